@@ -0,0 +1,75 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures fs.Cleaner on a real directory tree: half of the files are removed one by one,
+the other half is removed with their purged directories.
+Run: python -m xbench.clean'''
+
+import argparse
+import shutil
+import tempfile
+from timeit import default_timer as timer
+from xbuild.fs import FS, Cleaner
+
+
+def createTree(fs, root, dirs, files):
+    '''Returns (filePaths, dirPaths) of the leaf directories.'''
+    filePaths, dirPaths = [], []
+    for d in range(dirs):
+        for s in range(dirs):
+            dpath = fs.joinPath(root, 'd{}'.format(d), 's{}'.format(s))
+            dirPaths.append(dpath)
+            for f in range(files):
+                fpath = fs.joinPath(dpath, 'f{}.o'.format(f))
+                fs.write(fpath, fpath, mkDirs=True)
+                filePaths.append(fpath)
+    return filePaths, dirPaths
+
+
+def run(dirs, files, workers):
+    '''Returns the clean time in seconds.'''
+    fs = FS()
+    root = tempfile.mkdtemp()
+    # the Cleaner removes the emptied parent directories too
+    fs.write(fs.joinPath(root, 'keep'), 'keep')
+    try:
+        filePaths, dirPaths = createTree(fs, root, dirs, files)
+        half = len(dirPaths) // 2
+        cleaner = Cleaner(fs, [fpath for fpath in filePaths if fs.dirname(fpath) in dirPaths[:half]], dirPaths[half:], workers)
+        start = timer()
+        cleaner.clean()
+        res = timer() - start
+        assert not fs.exists(fs.joinPath(root, 'd0'))
+        return res
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dirs', dest='dirs', type=int, default=20)
+    parser.add_argument('--files', dest='files', type=int, default=20)
+    args = parser.parse_args()
+    for workers in (1, 2, 4):
+        print '{} workers, {} files: {:.3f} s'.format(workers, args.dirs * args.dirs * args.files, run(args.dirs, args.files, workers))
+
+
+if __name__ == '__main__':
+    main()
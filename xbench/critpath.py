@@ -0,0 +1,72 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the wall time of a build where a chain of long tasks competes with many short ones,
+without and with recorded action times.
+Run: python -m xbench.critpath'''
+
+import time
+import argparse
+from timeit import default_timer as timer
+from xbuild import Builder, FS
+from xbuild.callbacks import notUpToDate
+
+
+def sleepAction(bldr, task, secs):
+    time.sleep(secs)
+    return 0
+
+
+def run(workers, numShort, shortTime, numLong, longTime, recorded):
+    '''Returns the build time in seconds.'''
+    # the DB is not saved, the FS is not touched
+    bldr = Builder(
+        name='xbench.critpath', fs=FS(), workers=workers, printInfo=False, hashCheck=False, checkpointInterval=0,
+        checkpointTasks=0)
+    specs = [('short{}'.format(i), shortTime, []) for i in range(numShort)]
+    specs += [('long{}'.format(i), longTime, ['long{}'.format(i - 1)] if i else []) for i in range(numLong)]
+    for name, secs, deps in specs:
+        bldr.addTask(name=name, taskDeps=deps, upToDate=notUpToDate, action=(sleepAction, {'secs': secs}))
+        if recorded:
+            bldr._getTaskByName(name).meta = {'actionTime': secs}
+    topDeps = ['short{}'.format(i) for i in range(numShort)] + ['long{}'.format(numLong - 1)]
+    bldr.addTask(name='all', taskDeps=topDeps)
+    start = timer()
+    rc = bldr.build(['all'])
+    res = timer() - start
+    bldr.db.forget()
+    assert rc == 0
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', dest='workers', type=int, default=4)
+    args = parser.parse_args()
+    numShort, shortTime, numLong, longTime = 60, 0.02, 4, 0.1
+    bound = max(numLong * longTime, (numShort * shortTime + numLong * longTime) / args.workers)
+    print 'critical path bound: {:.3f} s'.format(bound)
+    for recorded in (False, True):
+        print '{} action times: {:.3f} s'.format(
+            'recorded' if recorded else 'no', run(args.workers, numShort, shortTime, numLong, longTime, recorded))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the startup of a build which requests one task out of a big DB.
+Run: python -m xbench.dbload'''
+
+import shutil
+import argparse
+import tempfile
+from timeit import default_timer as timer
+from xbuild import Builder, FS
+from xbuild.db import DB
+
+
+def createDB(name, numTasks):
+    db = DB.create(name, FS())
+    for i in range(numTasks):
+        taskId = 'out/{}.o'.format(i)
+        db._addSavedTask(taskId, {'trgs': [taskId], 'fDeps': ['src/{}.c'.format(i), 'inc/common.h']})
+        db.dirtyTaskIds.add(taskId)
+    db.save()
+    db.forget()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', dest='tasks', type=int, default=100000)
+    args = parser.parse_args()
+    tmpDir = tempfile.mkdtemp(prefix='xbench.dbload.')
+    try:
+        fs = FS()
+        name = fs.joinPath(tmpDir, 'default')
+        createDB(name, args.tasks)
+        start = timer()
+        bldr = Builder(name=name, fs=fs, printInfo=False)
+        bldr.addTask(targets=['out/0.o'], fileDeps=['src/0.c', 'inc/common.h'])
+        print '{} tasks in DB, load 1 task: {:.3f} s'.format(args.tasks, timer() - start)
+        start = timer()
+        bldr.db._loadAllTasks()
+        print '{} tasks in DB, load all tasks: {:.3f} s'.format(args.tasks, timer() - start)
+        bldr.db.forget()
+    finally:
+        shutil.rmtree(tmpDir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures DepGraph.calcDepths() on a layered graph, every task depends on all tasks of the previous
+layer and generates a file which is a dependency of the next layer.
+Run: python -m xbench.depths'''
+
+import argparse
+from timeit import default_timer as timer
+from xbuild.depgraph import DepGraph
+
+
+def run(layers, width):
+    '''Returns the calculation time in seconds.'''
+    graph = DepGraph()
+    prevNames, prevFiles = [], []
+    for layer in range(layers):
+        names = ['l{}_{}'.format(layer, i) for i in range(width)]
+        for name in names:
+            graph.addTask(name=name, taskDeps=prevNames, fileDeps=prevFiles, generatedFiles=[name + '.gen'])
+        prevNames, prevFiles = names, [name + '.gen' for name in names]
+    graph.addTask(name='all', taskDeps=prevNames)
+    start = timer()
+    graph.calcDepths()
+    return timer() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', dest='width', type=int, default=8)
+    args = parser.parse_args()
+    for layers in (25, 50, 100, 200):
+        print '{} layers x {} tasks: {:.3f} s'.format(layers, args.width, run(layers, args.width))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the queries of a DepGraph: calcDepths(), getAllTasks() and selectRight() on a graph of compile
+tasks, each depending on its source and on common headers, linked into libraries.
+Run: python -m xbench.graphquery'''
+
+import argparse
+from timeit import default_timer as timer
+from xbuild.depgraph import DepGraph
+
+
+def createGraph(numTasks, numHeaders=20, libSize=100):
+    graph = DepGraph()
+    headers = ['inc/{}.h'.format(i) for i in range(numHeaders)]
+    objs = []
+    for i in range(numTasks):
+        obj = 'out/{}.o'.format(i)
+        graph.addTask(targets=[obj], fileDeps=['src/{}.c'.format(i)] + headers)
+        objs.append(obj)
+    libs = []
+    for i in range(0, numTasks, libSize):
+        lib = 'lib/{}.a'.format(i // libSize)
+        graph.addTask(targets=[lib], fileDeps=objs[i:i + libSize])
+        libs.append(lib)
+    graph.addTask(name='all', fileDeps=libs)
+    return graph, libs
+
+
+def measure(fn, repeat=1):
+    start = timer()
+    for _ in range(repeat):
+        fn()
+    return (timer() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', dest='tasks', type=int, default=20000)
+    parser.add_argument('--selects', dest='selects', type=int, default=50)
+    args = parser.parse_args()
+    graph, libs = createGraph(args.tasks)
+    print '{} tasks'.format(args.tasks)
+    print 'calcDepths:  {:.3f} s'.format(measure(graph.calcDepths))
+
+    def recalcDepths():
+        graph.columns = None
+        graph.calcDepths()
+
+    print 'calcDepths again: {:.3f} s'.format(measure(recalcDepths, repeat=3))
+    print 'getAllTasks: {:.3f} s'.format(measure(graph.getAllTasks, repeat=5))
+    print 'selectRight(all): {:.3f} s'.format(measure(lambda: graph.selectRight(['all'], leaveLeaves=True), repeat=5))
+    selects = [libs[i % len(libs)] for i in range(args.selects)]
+    print '{} x selectRight(lib): {:.3f} s'.format(
+        args.selects, measure(lambda: [graph.selectRight([lib], leaveLeaves=True) for lib in selects]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Compares hashing files one by one against HashDict.hashFiles() on the I/O pool.
+Run: python -m xbench.hash'''
+
+import os
+import shutil
+import argparse
+import tempfile
+from timeit import default_timer as timer
+from xbuild import FS, HashDict, HashEnt
+
+
+def run(fpaths, batched):
+    '''Returns the hashing time of the files in seconds.'''
+    fs, hashDict = FS(), HashDict()
+    start = timer()
+    if batched:
+        hashDict.hashFiles(fs, fpaths)
+    else:
+        for fpath in fpaths:
+            HashEnt().setByFile(fs, fpath, hashDict.algo)
+    res = timer() - start
+    hashDict.close()
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', dest='files', type=int, default=500)
+    parser.add_argument('--size', dest='size', type=int, default=1 << 20)
+    args = parser.parse_args()
+    tmpDir = tempfile.mkdtemp(prefix='xbench.hash.')
+    try:
+        fpaths = []
+        for i in range(args.files):
+            fpath = os.path.join(tmpDir, '{}.bin'.format(i))
+            with open(fpath, 'wb') as f:
+                f.write(os.urandom(args.size))
+            fpaths.append(fpath)
+        print '{} files of {} bytes, sequential: {:.3f} s'.format(args.files, args.size, run(fpaths, False))
+        print '{} files of {} bytes, batched: {:.3f} s'.format(args.files, args.size, run(fpaths, True))
+    finally:
+        shutil.rmtree(tmpDir)
+
+
+if __name__ == '__main__':
+    main()
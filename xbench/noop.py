@@ -0,0 +1,59 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the scheduling overhead of a no-op rebuild: every task is up-to-date,
+so the wall time is spent in dispatching and completion handling.
+Run: python -m xbench.noop'''
+
+import argparse
+from timeit import default_timer as timer
+from xbuild import Builder, FS
+from xbuild.callbacks import alwaysUpToDate
+
+
+def run(numTasks, workers):
+    '''Returns the run time of the build queue in seconds.'''
+    # the DB is not saved, the FS is not touched
+    bldr = Builder(
+        name='xbench.noop', fs=FS(), workers=workers, printInfo=False, hashCheck=False, checkpointInterval=0,
+        checkpointTasks=0)
+    names = ['t{}'.format(i) for i in range(numTasks)]
+    for name in names:
+        bldr.addTask(name=name, upToDate=alwaysUpToDate)
+    bldr.addTask(name='all', taskDeps=names, upToDate=alwaysUpToDate)
+    rc = bldr._buildInitialDepGraph(['all'])
+    start = timer()
+    rc |= bldr._startBuildQueue()
+    res = timer() - start
+    bldr.db.forget()
+    assert rc == 0
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', dest='tasks', type=int, default=20000)
+    args = parser.parse_args()
+    for workers in (1, 2, 4, 8):
+        print '{} tasks, {} workers: {:.3f} s'.format(args.tasks, workers, run(args.tasks, workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the queue insertion and dispatch costs of a 50k task graph.
+Insertion includes the request propagation of Builder._buildInitialDepGraph().
+Run: python -m xbench.prio'''
+
+import random
+from timeit import default_timer as timer
+from xbuild import Builder, FS
+
+
+def createTasks(bldr, groups=50, subGroups=10, leaves=100):
+    rnd = random.Random(0)
+    groupNames = []
+    for g in range(groups):
+        subNames = []
+        for s in range(subGroups):
+            trgs = ['out/{}/{}/{}.o'.format(g, s, i) for i in range(leaves)]
+            for trg in trgs:
+                bldr.addTask(targets=[trg], prio=rnd.choice((0, 0, 0, 1, -1)))
+            subName = 'sub{}.{}'.format(g, s)
+            bldr.addTask(name=subName, fileDeps=trgs, prio=rnd.randint(0, 3))
+            subNames.append(subName)
+        groupName = 'grp{}'.format(g)
+        bldr.addTask(name=groupName, taskDeps=subNames, prio=rnd.randint(0, 3))
+        groupNames.append(groupName)
+    bldr.addTask(name='all', taskDeps=groupNames)
+
+
+def main():
+    # the build is not started and the DB is not saved, the FS is not touched
+    bldr = Builder(name='xbench.prio', fs=FS(), workers=1, printInfo=False)
+    createTasks(bldr)
+    start = timer()
+    bldr._buildInitialDepGraph(['all'])
+    insertTime = timer() - start
+    queue = bldr.queue.readyQueue
+    numTasks = len(queue)
+    start = timer()
+    while len(queue):
+        queue.pop()
+    dispatchTime = timer() - start
+    bldr.db.forget()
+    print '{} queued tasks, insertion: {:.3f} s, dispatch: {:.3f} s'.format(numTasks, insertTime, dispatchTime)
+
+
+if __name__ == '__main__':
+    main()
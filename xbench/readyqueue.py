@@ -0,0 +1,73 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the dispatch cost of buildqueue.ReadyQueue when most of the queued tasks
+are blocked by busy exclusion groups.
+Run: python -m xbench.readyqueue'''
+
+import random
+from timeit import default_timer as timer
+from xbuild.prio import Prio
+from xbuild.buildqueue import ReadyQueue, QueueTask
+
+
+class BenchTask(object):
+
+    def __init__(self, exclGroup, prio):
+        self.exclGroup = exclGroup
+        self.requestedPrio = Prio([prio])
+        self.greedy = False
+
+
+def createQueueTask(exclGroup, prio):
+    queueTask = QueueTask.__new__(QueueTask)
+    queueTask.task = BenchTask(exclGroup, prio)
+    queueTask.prio = queueTask.task.requestedPrio
+    return queueTask
+
+
+def bench(numTasks, numGroups=4, blockedRatio=0.9, dispatches=1000):
+    '''Returns the average time of one dispatch in microseconds.'''
+    rnd = random.Random(numTasks)
+    queue = ReadyQueue()
+    # the blocked tasks have high prio, so they are on top of the queue
+    for i in range(numTasks):
+        if rnd.random() < blockedRatio:
+            queue.add(createQueueTask('grp{}'.format(i % numGroups), 10 + rnd.randint(0, 10)))
+        else:
+            queue.add(createQueueTask(None, rnd.randint(0, 10)))
+    # make the groups busy
+    for g in range(numGroups):
+        queue.busyGroups.add('grp{}'.format(g))
+    dispatches = min(dispatches, int(numTasks * (1.0 - blockedRatio)) // 2)
+    start = timer()
+    for _ in range(dispatches):
+        queueTask = queue.pop()
+        queue.release(queueTask.task.exclGroup)
+    return (timer() - start) * 1e6 / dispatches
+
+
+def main():
+    for numTasks in (100, 1000, 10000, 100000):
+        print '{:>7} queued tasks: {:8.2f} us/dispatch'.format(numTasks, bench(numTasks))
+
+
+if __name__ == '__main__':
+    main()
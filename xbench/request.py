@@ -0,0 +1,60 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the initial request propagation (Builder._buildInitialDepGraph) on a layered diamond graph
+where every task depends on all tasks of the previous layer.
+Run: python -m xbench.request'''
+
+import argparse
+from timeit import default_timer as timer
+from xbuild import Builder, FS
+from xbuild.callbacks import alwaysUpToDate
+
+
+def run(layers, width):
+    '''Returns the setup time in seconds.'''
+    # the DB is not saved, the FS is not touched
+    bldr = Builder(
+        name='xbench.request', fs=FS(), printInfo=False, hashCheck=False, checkpointInterval=0, checkpointTasks=0)
+    prevNames = []
+    for layer in range(layers):
+        names = ['l{}_{}'.format(layer, i) for i in range(width)]
+        for name in names:
+            bldr.addTask(name=name, taskDeps=prevNames, upToDate=alwaysUpToDate)
+        prevNames = names
+    bldr.addTask(name='all', taskDeps=prevNames, upToDate=alwaysUpToDate)
+    start = timer()
+    rc = bldr._buildInitialDepGraph(['all'])
+    res = timer() - start
+    bldr.db.forget()
+    assert rc == 0
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--width', dest='width', type=int, default=12)
+    args = parser.parse_args()
+    for layers in (2, 3, 4, 5):
+        print '{} layers x {} tasks: {:.3f} s'.format(layers, args.width, run(layers, args.width))
+
+
+if __name__ == '__main__':
+    main()
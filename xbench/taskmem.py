@@ -0,0 +1,78 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Measures the memory footprint of the tasks: plain Task objects and tasks added to a Builder.
+Every task has 1 target and 2 file dependencies, one of them is shared by all tasks.
+Run: python -m xbench.taskmem'''
+
+import argparse
+import gc
+import resource
+from xbuild import Builder, FS, Task
+from xbuild.fs import joinPath
+
+
+def getMaxRSS():
+    '''Returns the peak resident set size in bytes (Linux reports kilobytes).'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def createArgs(i):
+    return dict(targets=[joinPath('out', '{}.o'.format(i))], fileDeps=[joinPath('src', '{}.c'.format(i)), joinPath('inc', 'common.h')])
+
+
+def measure(createFn, numTasks):
+    '''Returns the peak RSS growth per task in bytes.'''
+    gc.collect()
+    start = getMaxRSS()
+    keep = createFn(numTasks)
+    res = float(getMaxRSS() - start) / numTasks
+    del keep
+    return res
+
+
+def createTasks(numTasks):
+    return [Task(**createArgs(i)) for i in range(numTasks)]
+
+
+def createBuilder(numTasks):
+    # the DB is not saved, the FS is not touched
+    bldr = Builder(
+        name='xbench.taskmem', fs=FS(), printInfo=False, checkpointInterval=0, checkpointTasks=0)
+    for i in range(numTasks):
+        bldr.addTask(**createArgs(i))
+    bldr.db.forget()
+    return bldr
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', dest='tasks', type=int, default=200000)
+    parser.add_argument('--builder', dest='builder', action='store_true', help='add the tasks to a Builder')
+    args = parser.parse_args()
+    # the peak RSS never decreases, so one measurement is done per process
+    if args.builder:
+        print 'Builder: {:.0f} bytes/task'.format(measure(createBuilder, args.tasks))
+    else:
+        print 'Task: {:.0f} bytes/task'.format(measure(createTasks, args.tasks))
+
+
+if __name__ == '__main__':
+    main()
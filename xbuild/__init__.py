@@ -22,12 +22,14 @@ from fs import FS
 from hash import HashDict, HashEnt
 from builder import Task, Builder
 from callbacks import *
+from executor import ThreadExecutor, ProcessExecutor
+from tracer import Tracer
 from console import logger, getLoggerAdapter, info, infof, warn, warnf, error, errorf
 
 
 __all__ = [
-    'FS', 'HashDict', 'HashEnt', 'Task', 'Builder', 'info', 'infof', 'warn', 'warnf',
-    'error', 'errorf', 'getLoggerAdapter',
+    'FS', 'HashDict', 'HashEnt', 'Task', 'Builder', 'ThreadExecutor', 'ProcessExecutor', 'info', 'infof', 'warn', 'warnf',
+    'error', 'errorf', 'getLoggerAdapter', 'Tracer',
     'notUpToDate', 'targetUpToDate', 'fetchAllDynFileDeps', # TODO: use some python magic instead
     'FetchDynFileDeps', 'EndFilter', 'StartFilter', 'RegExpFilter'
     ]
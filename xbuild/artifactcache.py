@@ -0,0 +1,187 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import uuid
+import hashlib
+from threading import Lock
+from console import getLoggerAdapter
+
+logger = getLoggerAdapter('xbuild.artifactcache')
+
+ManifestName = 'manifest.json'
+UsedName = 'used'  # its mtime is the last use of the entry
+
+
+class ArtifactCache(object):
+    '''Content addressed cache of task outputs in cacheDir. The key of an entry is the task id and the
+    hashes of the task's file dependencies, or their stat signatures for the timestamp checked tasks.
+    An entry stores the targets and generatedFiles of the task.
+    A cache can be shared by concurrent builders: an entry is written into a temporary directory and renamed
+    to its final name, an evicted entry is renamed before it is removed.
+    The least recently used entries are evicted when the size of the cache exceeds maxSize bytes.'''
+
+    def __init__(self, fs, cacheDir, maxSize=1 << 30):
+        self.fs = fs
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        self.lock = Lock()
+        self.size = None  # estimated size of the entries, None until the cache directory is scanned
+        self.hits, self.misses, self.stores, self.evictions = 0, 0, 0, 0
+
+    def getStats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
+
+    def _count(self, what):
+        with self.lock:
+            setattr(self, what, getattr(self, what) + 1)
+
+    def getKey(self, bldr, task):
+        '''Returns the key of the task or None if a file dependency doesn't exist. The file dependencies of
+        a timestamp checked task are not hashed, they are identified by their stat signatures.'''
+        fileDeps = sorted(set(task.getFileDeps()))
+        depIds = []
+        if bldr.needsHashCheck(task):
+            kind = bldr.db.hashDict.algo
+            hashEnts = bldr.db.hashDict.hashFiles(bldr.fs, fileDeps, statCache=bldr.statCache)
+            for fileDep, hashEnt in zip(fileDeps, hashEnts):
+                if hashEnt.new is None:
+                    return None
+                depIds.append([fileDep, hashEnt.new])
+        else:
+            kind = 'stat'
+            for fileDep, stat in zip(fileDeps, bldr.statCache.statMany(fileDeps)):
+                if stat is None or stat.isDir:
+                    return None
+                depIds.append([fileDep, stat.getSig()])
+        keyObj = [task.getId(), sorted(task.taskDeps), kind, depIds]
+        return hashlib.sha1(json.dumps(keyObj)).hexdigest()
+
+    def _getEntryPath(self, key):
+        return self.fs.joinPath(self.cacheDir, key)
+
+    def restore(self, bldr, task):
+        '''Restores the outputs of the task from the cache. Returns True at hit.'''
+        fs = self.fs
+        key = self.getKey(bldr, task)
+        entryPath = self._getEntryPath(key) if key else None
+        if entryPath is None or not fs.isdir(entryPath):
+            self._count('misses')
+            return False
+        try:
+            manifest = json.loads(fs.read(fs.joinPath(entryPath, ManifestName)))
+            fpaths = manifest['targets'] + manifest['generatedFiles']
+            for i, fpath in enumerate(fpaths):
+                dpath = fs.dirname(fpath)
+                if dpath:
+                    fs.mkdirs(dpath)
+                fs.copy(fs.joinPath(entryPath, str(i)), fpath)
+            fs.write(fs.joinPath(entryPath, UsedName), '')
+        except (IOError, OSError, ValueError, KeyError) as e:
+            # evicted by an other builder meanwhile
+            logger.debugf("Cannot restore '{}' from {}: {}", task.getId(), entryPath, e)
+            self._count('misses')
+            return False
+        task.generatedFiles = manifest['generatedFiles']
+        task.providedFiles = manifest['providedFiles']
+        task.providedTasks = manifest['providedTasks']
+        self._count('hits')
+        return True
+
+    def store(self, bldr, task):
+        '''Stores the outputs of a built task. Returns True when a new entry is added.'''
+        fs = self.fs
+        key = self.getKey(bldr, task)
+        if key is None:
+            return False
+        entryPath = self._getEntryPath(key)
+        if fs.isdir(entryPath):
+            return False
+        fpaths = task.targets + task.generatedFiles
+        tmpPath = fs.joinPath(self.cacheDir, 'tmp-{}-{}'.format(key, uuid.uuid4().hex))
+        try:
+            fs.mkdirs(tmpPath)
+            for i, fpath in enumerate(fpaths):
+                fs.copy(fpath, fs.joinPath(tmpPath, str(i)))
+            manifest = {
+                'targets': task.targets, 'generatedFiles': task.generatedFiles, 'providedFiles': task.providedFiles,
+                'providedTasks': task.providedTasks}
+            fs.write(fs.joinPath(tmpPath, ManifestName), json.dumps(manifest))
+            fs.write(fs.joinPath(tmpPath, UsedName), '')
+            size = sum(stat.size for name, stat in fs.scanDir(tmpPath))
+            if fs.exists(entryPath):
+                raise IOError("'{}' is added by an other builder.".format(entryPath))
+            fs.rename(tmpPath, entryPath)
+        except (IOError, OSError) as e:
+            logger.debugf("Cannot store '{}' into {}: {}", task.getId(), entryPath, e)
+            self._removeEntry(tmpPath)
+            return False
+        self._count('stores')
+        with self.lock:
+            if self.size is not None:
+                self.size += size
+            needsEviction = self.size is None or self.size > self.maxSize
+        if needsEviction:
+            self.evict()
+        return True
+
+    def _removeEntry(self, entryPath):
+        fs = self.fs
+        entries = fs.scanDir(entryPath)
+        for name, _ in entries or []:
+            fs.remove(fs.joinPath(entryPath, name))
+        if entries is not None:
+            fs.rmdir(entryPath)
+
+    def _scanEntries(self):
+        '''Returns [(lastUsedNs, size, key)] of the complete entries.'''
+        fs = self.fs
+        res = []
+        for key, stat in fs.scanDir(self.cacheDir) or []:
+            if not stat.isDir or key.startswith('tmp-'):
+                continue
+            files = dict(fs.scanDir(fs.joinPath(self.cacheDir, key)) or [])
+            used = files.get(UsedName)
+            if used is None:
+                continue
+            res.append((used.mtimeNs, sum(st.size for st in files.values()), key))
+        return res
+
+    def evict(self):
+        '''Removes the least recently used entries until the size of the cache is not greater than maxSize.'''
+        fs = self.fs
+        with self.lock:
+            entries = sorted(self._scanEntries())
+            size = sum(ent[1] for ent in entries)
+            for _, entSize, key in entries:
+                if size <= self.maxSize:
+                    break
+                trashPath = fs.joinPath(self.cacheDir, 'tmp-{}-{}'.format(key, uuid.uuid4().hex))
+                try:
+                    # readers see either a complete entry or nothing
+                    fs.rename(self._getEntryPath(key), trashPath)
+                    self._removeEntry(trashPath)
+                except (IOError, OSError) as e:
+                    logger.debugf("Cannot evict {}: {}", key, e)
+                    continue
+                size -= entSize
+                self.evictions += 1
+            self.size = size
@@ -22,15 +22,14 @@ import logging
 import multiprocessing
 from cStringIO import StringIO
 from task import Task, TState, CheckType
-from threading import RLock
-from collections import defaultdict
 from db import DB
-from fs import FS
-from prio import Prio, prioCmp
+from fs import FS, StatCache
+from prio import Prio
 from callbacks import targetUpToDate, noDynFileDeps
 from buildqueue import BuildQueue, QueueTask
 from console import logger, getLoggerAdapter, write, cinfo, infof, cinfof, warn, warnf, error, errorf
 from pathformer import NoPathFormer
+from pathtable import PathTable, PathFlags, PathLists, PathMap
 
 dlogger = getLoggerAdapter('xbuild.builder')
 dlogger.setLevel(logging.DEBUG)
@@ -49,26 +48,39 @@ class Builder(object):
 
     def __init__(
         self, name='default', workers=0, fs=FS(), pathFormer=NoPathFormer(), printUpToDate=False,
-        printInfo=True, hashCheck=True, progressFn=None
+        printInfo=True, hashCheck=True, hashAlgo='md5', progressFn=None, progressInterval=0.2, executor=None,
+        checkpointInterval=60.0, checkpointTasks=1000, tracer=None, artifactCache=None
     ):
-        '''progressFn: e.g: def showProgress(progress) - progress is progress.Progress'''
+        '''progressFn: e.g: def showProgress(progress) - progress is progress.Progress
+        progressInterval: progressFn is called in every progressInterval seconds during the build
+        executor: runs the task callbacks, e.g. executor.ProcessExecutor(). Default is executor.ThreadExecutor.
+        hashAlgo: 'md5', 'sha1' or 'blake2b' (if supported by hashlib). Changing it invalidates the stored hashes.
+        checkpointInterval, checkpointTasks: the DB is saved in every checkpointInterval seconds and after every
+            checkpointTasks completed tasks during the build. 0 or None disables the trigger.
+        tracer: a tracer.Tracer records the timing of the tasks, e.g. for Tracer.writeChromeTrace().
+        artifactCache: an artifactcache.ArtifactCache, the targets and generatedFiles of the tasks having targets
+            are restored from it instead of running the action when the task's file dependencies are the same.'''
         self.pathFormer = pathFormer
-        self.db = DB.create(name, fs, pathFormer)
+        self.pathTable = PathTable()  # ids of the targets, file dependencies and task names
+        self.db = DB.create(name, fs, pathFormer, hashAlgo, self.pathTable)
         self.workers = calcNumOfWorkers(workers)
         self.fs = fs
+        self.statCache = StatCache(fs)  # memoizes the file metadata during the build
         self.printUpToDate = printUpToDate and printInfo
         self.printInfo = printInfo
         self.hashCheck = hashCheck
         self.progressFn = progressFn
-        self.targetTaskDict = {}  # {targetName: task}
-        self.nameTaskDict = {}  # {taskName: task}
+        self.checkpointInterval = checkpointInterval
+        self.checkpointTasks = checkpointTasks
+        self.artifactCache = artifactCache
+        self.targetTaskDict = PathMap(self.pathTable)  # {targetName: task}
+        self.nameTaskDict = PathMap(self.pathTable)  # {taskName: task}
         # self.idTaskDict = {}        # {taskId: task}    # TODO use
-        self.parentTaskDict = defaultdict(set)  # {target or task name: set([parentTask])}
-        self.providerTaskDict = {}  # {target or task name: providerTask} # TODO: remove
-        self.upToDateFiles = set()  # name of files
-        self.lock = RLock()
+        self.parentTasks = PathLists(self.pathTable)  # target or task name -> [parentTask]
+        self.upToDateFiles = PathFlags(self.pathTable)  # name of files
         self.queue = BuildQueue(
-            self.workers, printUpToDate=self.printUpToDate, printInfo=self.printInfo, progressFn=progressFn)  # contains QueueTasks
+            self.workers, printUpToDate=self.printUpToDate, printInfo=self.printInfo, progressFn=progressFn,
+            progressInterval=progressInterval, executor=executor, tracer=tracer)  # contains QueueTasks
         # load db
         self.db.load()
 
@@ -76,9 +88,20 @@ class Builder(object):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.db.save()
+        self.db.save(self._getStaleTaskIds())
         self.db.forget()
 
+    def _getStaleTaskIds(self):
+        '''Returns the ids of the requested but not completed tasks whose files got new hashes in this build,
+        see DB.save().'''
+        res = set()
+        hashDict = self.db.hashDict
+        for task in self.targetTaskDict.values() + self.nameTaskDict.values():
+            if task._isRequested() and task.state != TState.Built and self.needsHashCheck(task):
+                if hashDict.anyChanged(task.getFileDeps() + task.targets + task.generatedFiles):
+                    res.add(task.getId())
+        return res
+
     def needsHashCheck(self, task):
         return self.hashCheck if task.checkType is None else task.checkType == CheckType.Hash
 
@@ -89,59 +112,59 @@ class Builder(object):
         return nameOrTarget in self.nameTaskDict or nameOrTarget in self.targetTaskDict
 
     def _getTaskByName(self, name):
-        with self.lock:
-            return self.nameTaskDict.get(name)
+        return self.nameTaskDict.get(name)
 
     def _getTaskById(self, taskId):
-        with self.lock:
-            task = self.targetTaskDict.get(taskId)
-            if task is None:
-                task = self.nameTaskDict.get(taskId)
-            return task
+        task = self.targetTaskDict.get(taskId)
+        if task is None:
+            task = self.nameTaskDict.get(taskId)
+        return task
 
     def _taskExists(self, task, prefix=''):
         '''Returns True if exists, False if doesn't exist. Raises ValueError if exists with different content.'''
-        with self.lock:
-            oTsk = self._getTaskById(task.getId())
-            if oTsk:
-                if oTsk == task:
-                    return True
-                else:
-                    raise ValueError(
-                        "{}There is already a task for id '{}' with different content!". format(
-                            prefix, task.getId()))
-            return False
+        oTsk = self._getTaskById(task.getId())
+        if oTsk:
+            if oTsk == task:
+                return True
+            else:
+                raise ValueError(
+                    "{}There is already a task for id '{}' with different content!". format(
+                        prefix, task.getId()))
+        return False
 
     def _getRequestedTasks(self):
         taskDict = {task.getId(): task for task in self.nameTaskDict.values()}
-        return [task for task in taskDict.values() if task.requestedPrio.prioList]
+        return [task for task in taskDict.values() if task.requestedPrio.isRequested()]
 
     def _isTaskUpToDate(self, taskName):
         task = self.nameTaskDict.get(taskName)
         return task and task.state == TState.Built
 
     def _addTask(self, task):
-        with self.lock:
-            for trg in task.targets:
-                if trg in self.targetTaskDict:
-                    raise ValueError("There is already a task for target '{}'!".format(trg))
-                if trg in self.nameTaskDict:
-                    raise ValueError("There is already a task named '{}'!".format(trg))
-            if task.name:
-                if task.name in self.nameTaskDict:
-                    raise ValueError("There is already a task named '{}'!".format(task.name))
-                if task.name in self.targetTaskDict:
-                    raise ValueError("There is already a task for target '{}'!".format(task.name))
-            for trg in task.targets:
-                self.targetTaskDict[trg] = task
-            if task.name:
-                self.nameTaskDict[task.name] = task
-            for fileDep in task.fileDeps:
-                self.parentTaskDict[fileDep].add(task)
-            for taskDep in task.taskDeps:
-                self.parentTaskDict[taskDep].add(task)
-            # fill up task with saved data
-            self.db.loadTask(task)
+        for trg in task.targets:
+            if trg in self.targetTaskDict:
+                raise ValueError("There is already a task for target '{}'!".format(trg))
+            if trg in self.nameTaskDict:
+                raise ValueError("There is already a task named '{}'!".format(trg))
+        if task.name:
+            if task.name in self.nameTaskDict:
+                raise ValueError("There is already a task named '{}'!".format(task.name))
+            if task.name in self.targetTaskDict:
+                raise ValueError("There is already a task for target '{}'!".format(task.name))
+        for trg in task.targets:
+            self.targetTaskDict[trg] = task
+        if task.name:
+            self.nameTaskDict[task.name] = task
+        # task is new, it is a parent of each of its distinct dependencies once
+        fileDeps, taskDeps = set(task.fileDeps), set(task.taskDeps)
+        parentTasks = self.parentTasks
+        for dep in fileDeps | taskDeps:
+            parentTasks.add(dep, task)
+        # a task created by a taskFactory may depend on already built files and tasks
+        task.pendingDepCnt = (
+            len(self._getPendingFileDeps(fileDeps)) + len([name for name in taskDeps if not self._isTaskUpToDate(name)]))
+        # fill up task with saved data
+        self.db.loadTask(task)
 
     def addTask(
         self, name=None, targets=None, fileDeps=None, taskDeps=None, dynFileDepFetcher=noDynFileDeps, taskFactory=None,
@@ -158,38 +181,42 @@ class Builder(object):
                 return
         self._addTask(task)
 
-    def _executeTaskFactory(self, task):
-        if task.taskFactory:
-            factory, kwargs = task.taskFactory  # TODO: Task._runCallback
-            tasks = factory(self, task, **kwargs)
-            tid = task.getId()
-            with self.lock:
-                for tsk in tasks:
-                    if not self._taskExists(tsk, "taskFactory of task '{}': ".format(tid)):
-                        self._addTask(tsk)
+    def _runTaskFactory(self, task):
+        '''Returns the tasks created by the taskFactory of task. Called by a worker.'''
+        if not task.taskFactory:
+            return []
+        factory, kwargs = task.taskFactory  # TODO: Task._runCallback
+        return factory(self, task, **kwargs)
+
+    def _addFactoryTasks(self, task, tasks):
+        tid = task.getId()
+        for tsk in tasks:
+            if not self._taskExists(tsk, "taskFactory of task '{}': ".format(tid)):
+                self._addTask(tsk)
 
     def _injectGenerated(self, genTask):
         '''Injects task's generated and provided files into its parents.'''
         needToBuild = {}  # {providedFile: requestPrio}
-        with self.lock:
-            for parentTask in self.parentTaskDict[genTask.getId()]:  # {target or task name: [parentTask]}
-                _, newProvFiles = parentTask._injectDynDeps(genTask)
+        for parentTask in self.parentTasks.get(genTask.getId()):
+            _, newProvFiles = parentTask._injectDynDeps(genTask)
+            for pFile in newProvFiles:
+                if self.parentTasks.addUnique(pFile, parentTask):
+                    if pFile not in self.upToDateFiles:
+                        parentTask.pendingDepCnt += 1
+            if parentTask._isRequested():
+                # TODO: request build only for provided files
                 for pFile in newProvFiles:
-                    self.parentTaskDict[pFile].add(parentTask)
-                if parentTask._isRequested():
-                    # TODO: request build only for provided files
-                    for pFile in newProvFiles:
-                        prio = needToBuild.get(pFile)
-                        if prio is not None:
-                            if prioCmp(prio, parentTask.requestedPrio) > 0:
-                                needToBuild[pFile] = parentTask.requestedPrio
-                        else:
+                    prio = needToBuild.get(pFile)
+                    if prio is not None:
+                        if parentTask.requestedPrio.key < prio.key:
                             needToBuild[pFile] = parentTask.requestedPrio
-            # print '>>>> needToBuild: {}'.format(needToBuild.keys())
-            for pFile, prio in needToBuild.items():
-                if not self._putFileToBuildQueue(pFile, prio):
-                    return  # TODO: error handling
-            # generated files don't need any build
+                    else:
+                        needToBuild[pFile] = parentTask.requestedPrio
+        # print '>>>> needToBuild: {}'.format(needToBuild.keys())
+        for pFile, prio in needToBuild.items():
+            if not self._putFileToBuildQueue(pFile, prio):
+                return  # TODO: error handling
+        # generated files don't need any build
 
     def __checkAndHandleTaskDepCompletition(self, task):
         def queueIfRequested():
@@ -198,138 +225,163 @@ class Builder(object):
                 logger.debugf("put to queue: {}", task)
                 task.state = TState.Queued
                 self.queue.add(QueueTask(self, task))
-        # called in locked context
+        # called by the scheduler
         # debugf("depCompleted?: {}", task)
         if task.state < TState.Ready:
-            if not task.pendingFileDeps and not task.pendingDynFileDeps and not task.pendingTaskDeps:
+            if not task.pendingDepCnt:
                 task.state = TState.Ready
                 queueIfRequested()
         elif task.state == TState.Ready:
             queueIfRequested()
 
-    def __markParentTasks(self, name, getPendingDepsFn):
+    def __markParentTasks(self, name):
+        '''Called once per built file or task. The parent tasks added later don't count name as pending.'''
         # needDebug = name == 'generator'
         needDebug = False
         dlogger.cdebugf(needDebug, 'taskName: {}', name)
-        for parentTask in self.parentTaskDict[name]:
+        for parentTask in self.parentTasks.get(name):
             dlogger.cdebugf(needDebug, 'parentTask: {}', parentTask)
             if parentTask.state < TState.Queued:
                 # TODO  What to do if task is queued, not built and its requestedPrio changes?
-                pendingDeps, dynPendingDeps = getPendingDepsFn(parentTask)
-                if name in pendingDeps:
-                    pendingDeps.remove(name)
-                elif name in dynPendingDeps:
-                    dynPendingDeps.remove(name)
-                else:
-                    return
+                parentTask.pendingDepCnt -= 1
                 self.__checkAndHandleTaskDepCompletition(parentTask)
 
     def _markTargetUpToDate(self, target):
-        def getPendingDeps(task):
-            return task.pendingFileDeps, task.pendingDynFileDeps
-        with self.lock:
-            # Due to taskFactories, up-to-date files have to be removed from newly added tasks' pending dependencies.
-            # if target not in self.upToDateFiles:
+        if self.upToDateFiles.add(target):
             # debugf('targetUpToDate: {}', target)
-            self.upToDateFiles.add(target)
-            self.__markParentTasks(target, getPendingDeps)
+            self.__markParentTasks(target)
 
     def _markTaskUpToDate(self, task):
-        def getPendingDeps(task):
-            return task.pendingTaskDeps, []  # pendingDynTaskDeps
-        with self.lock:
-            if not task.state == TState.Built:
-                task.state = TState.Built
-                # debugf('taskUpToDate: {}', task)
-                self.__markParentTasks(task.name, getPendingDeps)
+        if not task.state == TState.Built:
+            task.state = TState.Built
+            # debugf('taskUpToDate: {}', task)
+            self.__markParentTasks(task.name)
+
+    def _getPendingFileDeps(self, fpaths):
+        return [fpath for fpath in fpaths if fpath not in self.upToDateFiles]
+
+    def _getPendingTaskDeps(self, task):
+        return [name for name in task.taskDeps if not self._isTaskUpToDate(name)]
 
     def _handleTaskBuildCompleted(self, task):
         logger.debugf("{}", task.getId())
-        with self.lock:
-            if task.name:
-                self._markTaskUpToDate(task)
-            else:
-                task.state = TState.Built
-            for trg in task.targets:
-                self._markTargetUpToDate(trg)
-            # update taskIdSavedTaskDict
-            # self.db.saveTask(self, task)    # moved to QueueTask
+        if task.name:
+            self._markTaskUpToDate(task)
+        else:
+            task.state = TState.Built
+        for trg in task.targets:
+            self._markTargetUpToDate(trg)
+        # update taskIdSavedTaskDict
+        # self.db.saveTask(self, task)    # moved to QueueTask
+
+    def __requestTask(self, task, prio, onStack, parentCritPath=0.0):
+        '''Sets the request prio of task. Returns the frame of the walk in __putTaskToBuildQueue()
+        or None when the task is already requested with at least that priority.'''
+        # a lower bound, build() calculates the exact value for the initial requests
+        task.critPath = max(task.critPath, parentCritPath + task.getActionTime())
+        targetPrio = prio.sub(task.prio, task.summary) if prio else Prio([task.prio], task.summary)
+        if task.requestedPrio and task.requestedPrio.key <= targetPrio.key:
+            return None
+        if task._setRequestPrio(targetPrio):
+            self.queue.incRequestedCnt()
+        onStack.add(task)
+        # --- TODO: separate handling of fileDeps and dynFileDeps
+        deps = [(True, name) for name in self._getPendingTaskDeps(task)]
+        deps += [(False, fpath) for fpath in self._getPendingFileDeps(task.getFileDeps())]
+        return task, targetPrio, iter(deps)
+
+    def __getFileTask(self, fpath):
+        '''Returns (success, task making fpath). The task is None when fpath doesn't need a build.'''
+        if fpath in self.upToDateFiles:
+            cinfof(self.printUpToDate, "File '{}' is up-to-date.", self.encodePath(fpath))
+            self._markTargetUpToDate(fpath)
+            return True, None
+        task = self.targetTaskDict.get(fpath)
+        if task is None:
+            if self.statCache.exists(fpath):
+                self._markTargetUpToDate(fpath)
+                return True, None
+            errorf("No task to make file '{}'!", self.encodePath(fpath))
+            return False, None
+        return True, task
 
     def __putTaskToBuildQueue(self, task, prio=None):  # def arg is safe here
+        '''Requests task and its pending dependencies. The dependencies are walked iteratively, a task is
+        visited again only when it gets a higher priority, so the walk is O(V+E) for any DAG.'''
         assert isinstance(task, Task)
-        # lock is handled by caller
-        # --- handle dependencies
-        if prio:
-            assert isinstance(prio, Prio)
-            targetPrio = Prio(prio.prioList + [task.prio], task.summary if task.summary else prio.phase)
-            # argetPrio = prio + [task.prio]
-        else:
-            targetPrio = Prio([task.prio], task.summary)
-        for taskDepName in task.pendingTaskDeps:
-            assert not self._isTaskUpToDate(taskDepName)
-            depTask = self.nameTaskDict.get(taskDepName)
-            if depTask is None:
-                errorf("Task '{}' refers to a not existing task '{}'!", task.getId(), taskDepName)
-                return False
-            if not self.__putTaskToBuildQueue(depTask, targetPrio):
-                return False
-        # --- TODO: separate handling of fileDeps and dynFileDeps
-        for fileDep in list(task.pendingFileDeps) + list(task.pendingDynFileDeps):
-            if not self._putFileToBuildQueue(fileDep, targetPrio):
+        assert prio is None or isinstance(prio, Prio)
+        onStack = set()
+        frame = self.__requestTask(task, prio, onStack)
+        if frame is None:
+            self.__checkAndHandleTaskDepCompletition(task)
+            return True
+        stack = [frame]
+        while stack:
+            task, targetPrio, deps = stack[-1]
+            isTaskDep, dep = next(deps, (None, None))
+            if isTaskDep is None:
+                # all the dependencies are requested
+                stack.pop()
+                onStack.discard(task)
+                self.__checkAndHandleTaskDepCompletition(task)
+                continue
+            if isTaskDep:
+                assert not self._isTaskUpToDate(dep)
+                depTask = self.nameTaskDict.get(dep)
+                if depTask is None:
+                    errorf("Task '{}' refers to a not existing task '{}'!", task.getId(), dep)
+                    return False
+            else:
+                ok, depTask = self.__getFileTask(dep)
+                if not ok:
+                    return False
+                if depTask is None:
+                    continue
+            if depTask in onStack:
+                errorf("Task '{}' has a circular dependency on '{}'!", task.getId(), dep)
                 return False
-        if task._setRequestPrio(targetPrio):
-            self.queue.incRequestedCnt()
-        self.__checkAndHandleTaskDepCompletition(task)
+            frame = self.__requestTask(depTask, targetPrio, onStack, task.critPath)
+            if frame is not None:
+                stack.append(frame)
         return True
 
     def _putFileToBuildQueue(self, fpath, prio=None):
-        with self.lock:
-            if fpath in self.upToDateFiles:
-                cinfof(self.printUpToDate, "File '{}' is up-to-date.", self.encodePath(fpath))
-                self._markTargetUpToDate(fpath)
-                return True  # success
-            task = self.targetTaskDict.get(fpath)
-            if task is None:
-                if self.fs.exists(fpath):
-                    self._markTargetUpToDate(fpath)
-                    return True
-                errorf("No task to make file '{}'!", self.encodePath(fpath))
-                return False
-            if not prio:
-                prio = Prio()
-            return self.__putTaskToBuildQueue(task, prio)
+        ok, task = self.__getFileTask(fpath)
+        if task is None:
+            return ok
+        if not prio:
+            prio = Prio()
+        return self.__putTaskToBuildQueue(task, prio)
 
     def _putTaskToBuildQueue(self, taskName, prio=None):
-        with self.lock:
-            task = self.nameTaskDict.get(taskName)
-            if task is None:
-                errorf("No task named '{}'!", self.encodePath(taskName))
-                return False
-            if not prio:
-                prio = Prio()
-            return self.__putTaskToBuildQueue(task, prio)
+        task = self.nameTaskDict.get(taskName)
+        if task is None:
+            errorf("No task named '{}'!", self.encodePath(taskName))
+            return False
+        if not prio:
+            prio = Prio()
+        return self.__putTaskToBuildQueue(task, prio)
 
     # task deps have to be built 1st
     def _putToBuildQueue(self, nameOrTarget, prio=None):
-        with self.lock:
-            if nameOrTarget in self.upToDateFiles:
-                cinfof("File '{}' is up-to-date.", self.printUpToDate, self.encodePath(nameOrTarget))
-                return True  # success
-            if self._isTaskUpToDate(nameOrTarget):
-                cinfof("Task '{}' is up-to-date.", self.printUpToDate, self.encodePath(nameOrTarget))
+        if nameOrTarget in self.upToDateFiles:
+            cinfof("File '{}' is up-to-date.", self.printUpToDate, self.encodePath(nameOrTarget))
+            return True  # success
+        if self._isTaskUpToDate(nameOrTarget):
+            cinfof("Task '{}' is up-to-date.", self.printUpToDate, self.encodePath(nameOrTarget))
+            return True
+        task = self.targetTaskDict.get(nameOrTarget)
+        if task is None:
+            task = self.nameTaskDict.get(nameOrTarget)
+        if task is None:
+            if self.statCache.exists(nameOrTarget):
+                self._markTargetUpToDate(nameOrTarget)
                 return True
-            task = self.targetTaskDict.get(nameOrTarget)
-            if task is None:
-                task = self.nameTaskDict.get(nameOrTarget)
-            if task is None:
-                if self.fs.exists(nameOrTarget):
-                    self._markTargetUpToDate(nameOrTarget)
-                    return True
-                errorf("No task to make target '{}'!", self.encodePath(nameOrTarget))
-                return False
-            if not prio:
-                prio = Prio()
-            return self.__putTaskToBuildQueue(task, prio)
+            errorf("No task to make target '{}'!", self.encodePath(nameOrTarget))
+            return False
+        if not prio:
+            prio = Prio()
+        return self.__putTaskToBuildQueue(task, prio)
 
     def buildOne(self, target):
         '''Builds a target. "target" can also be a task name.'''
@@ -348,9 +400,53 @@ class Builder(object):
                 return 1
         return 0
 
+    def _getParentTasks(self, task):
+        res = set()
+        for name in task.targets + ([task.name] if task.name else []):
+            res.update(self.parentTasks.get(name))
+        return res
+
+    def _calcCriticalPaths(self):
+        '''Sets critPath of the requested tasks to the sum of recorded action times along the longest
+        chain of requested tasks from the task to a requested target, and reorders the ready tasks.'''
+        tasks = [task for task in self.targetTaskDict.values() + self.nameTaskDict.values() if task._isRequested()]
+        critPaths = {}  # {task: critPath}
+        visiting = set()
+        for task in tasks:
+            if task in critPaths:
+                continue
+            # iterative DFS towards the requested parents
+            stack = [(task, None)]
+            while stack:
+                tsk, parents = stack[-1]
+                if parents is None:
+                    visiting.add(tsk)
+                    parents = [p for p in self._getParentTasks(tsk) if p._isRequested()]
+                    stack[-1] = (tsk, parents)
+                    for parent in parents:
+                        if parent not in critPaths and parent not in visiting:
+                            stack.append((parent, None))
+                    continue
+                stack.pop()
+                if tsk not in critPaths:
+                    critPaths[tsk] = tsk.getActionTime() + max([critPaths.get(p, 0.0) for p in parents] or [0.0])
+        for task, critPath in critPaths.items():
+            task.critPath = critPath
+        self.queue.readyQueue.rekey()
+
+    def _startCheckpoints(self):
+        '''Invoked by the build queue after the executor is started, the checkpointer thread must not run
+        when the process pool forks.'''
+        if self.checkpointInterval or self.checkpointTasks:
+            self.db.startCheckpoints(
+                self.checkpointInterval, self.checkpointTasks, lambda: self.queue.call(self._getStaleTaskIds))
+
     def _startBuildQueue(self):
         '''Invoked by build.'''
-        self.queue.start()
+        try:
+            self.queue.start(self._startCheckpoints)
+        finally:
+            self.db.stopCheckpoints()
         if self.queue.rc:
             errorf("BUILD FAILED! exitCode: {}", self.queue.rc)
         else:
@@ -359,10 +455,15 @@ class Builder(object):
 
     def build(self, targets):
         '''Builds a list targets. A "target" can also be a task name.'''
-        rc = self._buildInitialDepGraph(targets)
-        if rc:
-            return rc
-        return self._startBuildQueue()
+        self.statCache.activate()
+        try:
+            rc = self._buildInitialDepGraph(targets)
+            if rc:
+                return rc
+            self._calcCriticalPaths()
+            return self._startBuildQueue()
+        finally:
+            self.statCache.deactivate()
 
     def check(self):
         # TODO: find cycles
@@ -407,7 +508,7 @@ class Builder(object):
             idTaskDict[task.getId()] = task
         # find top level targets and tasks
         for task in idTaskDict.values():
-            if not self.parentTaskDict[task.getId()]:
+            if not self.parentTasks.get(task.getId()):
                 printHeader(res, task, indent=0)
                 printDepends(res, task, indent=2)
         return '\n'.join(res)
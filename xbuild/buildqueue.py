@@ -18,12 +18,16 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import heapq
 import traceback
-from sortedcontainers import SortedList
-from threading import Lock, RLock, Thread, Condition
-from prio import prioCmp
+from itertools import count
+from timeit import default_timer as timer
+from collections import deque
+from threading import Lock, Thread, Condition, Event
 from console import logger, cinfo, infof, cinfof, warn, warnf, error, errorf
-from progress import Progress
+from progress import Progress, ProgressReporter
+from executor import ThreadExecutor
+from tracer import noSpan
 
 
 class Worker(Thread):
@@ -32,9 +36,7 @@ class Worker(Thread):
         super(Worker, self).__init__(name="Wrk{}".format(wid))
         self.queue = queue
         self.id = wid
-        self.cnd = Condition(RLock())
-        self.queueTask = None
-        self.stopRequest = False
+        self.queueTask = None  # None while the worker is waiting
 
     def __hash__(self):
         return self.id
@@ -46,226 +48,361 @@ class Worker(Thread):
         return self.queueTask
 
     def getTaskId(self):
-        # with self.cnd:
-        if self.queueTask is None:
+        queueTask = self.queueTask
+        if queueTask is None:
             return 'None'
-        return self.queueTask.getTaskId()
+        return queueTask.getTaskId()
 
     def run(self):
         logger.debug("started")
+        queueTask = None
         while True:
-            with self.cnd:
-                self.queueTask = None
-                self.queue.regWaiter(self)
-                if self.stopRequest:
-                    break
-                if self.queueTask is None:
-                    self.cnd.wait()
-                    if self.stopRequest:
-                        break
-            assert self.queueTask is not None
-            logger.debugf("got task: {}", self.queueTask.task.getId())
-            self.queueTask.execute()
-            self.queue.release(self.queueTask)
+            queueTask = self.queue.take(queueTask)
+            if queueTask is None:
+                break
+            self.queueTask = queueTask
+            if queueTask.trace:
+                queueTask.trace.worker = self.name
+            logger.debugf("got task: {}", queueTask.task.getId())
+            queueTask.execute()
+            self.queueTask = None
         logger.debug('stopped')
 
-    def setQueueTask(self, queueTask):
-        '''This function is called by the feeder from the queue.'''
-        with self.cnd:
-            assert self.queueTask is None
-            self.queueTask = queueTask
-            self.cnd.notify()  # TODO: yield? Notify only when waits?
 
-    def stop(self):
-        with self.cnd:
-            self.stopRequest = True
-            self.cnd.notify()
+class SchedulerCall(object):
+    '''A function call posted to the scheduler thread by BuildQueue.call().'''
 
+    def __init__(self, fn):
+        self.fn = fn
+        self.event = Event()
+        self.res, self.error = None, None
 
-class BuildQueue(object):
+    def run(self):
+        try:
+            self.res = self.fn()
+        except Exception as e:
+            self.error = e
+        self.event.set()
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.res
+
+
+class ReadyQueue(object):
+    '''Priority queue of the ready QueueTasks. Tasks are stored in per exclGroup heaps,
+    the heads of the not busy groups are stored in a top level heap. Taking the next not excluded
+    task costs O(log n) regardless of the number of excluded tasks.
+    The order is given by the request prio, among equal prios the task on the longer critical path comes first.'''
+
+    def __init__(self):
+        self.groupHeaps = {}  # {exclGroup: [(key, seq, queueTask)]}, exclGroup None is never excluded
+        self.topHeap = []  # [(key, seq, queueTask, exclGroup)] heads of not busy groups, can contain stale entries
+        self.busyGroups = set()
+        self.seq = count()  # keeps FIFO order for equal priorities
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _pushHead(self, grp):
+        grpHeap = self.groupHeaps.get(grp)
+        if grpHeap:
+            heapq.heappush(self.topHeap, grpHeap[0] + (grp,))
+
+    def add(self, queueTask):
+        grp = queueTask.task.exclGroup or None
+        grpHeap = self.groupHeaps.get(grp)
+        if grpHeap is None:
+            self.groupHeaps[grp] = grpHeap = []
+        ent = ((queueTask.prio.key, -queueTask.critPath), next(self.seq), queueTask)
+        heapq.heappush(grpHeap, ent)
+        self.size += 1
+        if grpHeap[0] is ent and grp not in self.busyGroups:
+            heapq.heappush(self.topHeap, ent + (grp,))
+
+    def pop(self):
+        '''Returns the highest priority task which is not excluded by a running task or None.
+        The exclGroup of the returned task becomes busy until release() is called.'''
+        while self.topHeap:
+            _, seq, queueTask, grp = heapq.heappop(self.topHeap)
+            grpHeap = self.groupHeaps.get(grp)
+            if grp in self.busyGroups or not grpHeap or grpHeap[0][1] != seq:
+                continue  # stale entry
+            heapq.heappop(grpHeap)
+            self.size -= 1
+            if grp is None:
+                self._pushHead(grp)
+            else:
+                self.busyGroups.add(grp)
+            return queueTask
+        return None
+
+    def release(self, grp):
+        if grp:
+            self.busyGroups.remove(grp)
+            self._pushHead(grp)
 
-    def __init__(self, numWorkers, printUpToDate=False, printInfo=False, progressFn=None):
-        self.sortedList = SortedList()
+    def rekey(self):
+        '''Rebuilds the heaps with the current critical paths of the tasks. The FIFO order is kept.'''
+        ents = sorted(ent[1:] for grpHeap in self.groupHeaps.values() for ent in grpHeap)
+        self.groupHeaps, self.topHeap, self.size = {}, [], 0
+        for _, queueTask in ents:
+            queueTask.critPath = queueTask.task.critPath
+            self.add(queueTask)
+
+
+class BuildQueue(object):
+    '''The build graph is owned by the scheduler, it runs in the thread calling start(). The workers take
+    the dispatched QueueTasks by take() and post them back to the scheduler when they are executed.
+    The completion of a task is handled by the scheduler, so the graph is changed without locking.'''
+
+    def __init__(
+        self, numWorkers, printUpToDate=False, printInfo=False, progressFn=None, progressInterval=0.2, executor=None,
+        tracer=None
+    ):
+        self.readyQueue = ReadyQueue()
+        self.tracer = tracer
+        self.executor = ThreadExecutor() if executor is None else executor
         self.lock = Lock()
+        self.workCnd, self.eventCnd = Condition(self.lock), Condition(self.lock)
+        self.work = deque()  # dispatched QueueTasks, None stops a worker
+        self.events = []  # executed QueueTasks and SchedulerCalls for the scheduler
+        self.schedulerWaiting = False
+        self.scheduling = False  # True while the scheduler loop processes the events
         self.numWorkers = numWorkers
         self.printUpToDate, self.printInfo = printUpToDate, printInfo
         self.progressFn = progressFn
+        self.progressInterval = progressInterval
         self.workers = None  # thread can be started only once
-        self.waitingWorkers = []  # for small amount of threads (<=32) list could be faster than set().
+        self.numRunning = 0  # number of dispatched tasks
+        # a worker finds its next task without waiting for the scheduler
+        self.maxDispatched = 2 * numWorkers
         self.greedyRun = False
         self.loadedGreedyTask = None
-        self.loadedQueueTask = None
         self.finished = False
         self.tasksDone = 0
         self.rc = 0
-        self.exclGroups = set()
         self.requestedCnt = 0
 
     def incRequestedCnt(self):
-        with self.lock:
-            self.requestedCnt += 1
+        self.requestedCnt += 1
 
     def getRequestedCnt(self):
-        # with self.lock:    # called from lock
-            return self.requestedCnt
-
-    def _excluded(self, queueTask):
-        if not queueTask.task.exclGroup:
-            return False
-        return queueTask.task.exclGroup in self.exclGroups
+        return self.requestedCnt
+
+    def _nextTask(self):
+        '''Returns the task to be dispatched to an idle worker or None.'''
+        if self.finished or self.greedyRun:
+            return None
+        if self.loadedGreedyTask:
+            if not self.numRunning:
+                queueTask = self.loadedGreedyTask
+                self.loadedGreedyTask = None
+                self.greedyRun = True
+                return queueTask
+            return None
+        if len(self.readyQueue) > 0:
+            # None if all the queued tasks are excluded
+            queueTask = self.readyQueue.pop()
+            if queueTask is not None and queueTask.task.greedy:
+                if not self.numRunning:
+                    self.greedyRun = True
+                else:
+                    self.loadedGreedyTask = queueTask
+                    return None
+            return queueTask
+        return None
+
+    def _dispatch(self):
+        batch = []
+        while self.numRunning < self.maxDispatched:
+            queueTask = self._nextTask()
+            if queueTask is None:
+                break
+            self.numRunning += 1
+            if queueTask.trace:
+                queueTask.trace.dispatched = self.tracer.now()
+            batch.append(queueTask)
+        if batch:
+            self._putWork(batch)
+
+    def _putWork(self, batch):
+        with self.lock:
+            self.work.extend(batch)
+            self.workCnd.notify(len(batch))
 
-    def _feedWorkers(self):
+    def _post(self, event):
         # locked by caller
+        self.events.append(event)
+        if self.schedulerWaiting:
+            self.eventCnd.notify()
 
-        def stopWorkers():
-            for worker in self.waitingWorkers:
-                worker.stop()
-
-        def feedWorker(queueTask):
-            worker = self.waitingWorkers.pop(0)
-            worker.setQueueTask(queueTask)
-
-        if self.finished:
-            stopWorkers()
-            return
-        while len(self.waitingWorkers):
-            if self.greedyRun:
-                return
-            if self.loadedGreedyTask:
-                if len(self.waitingWorkers) == self.numWorkers:
-                    queueTask = self.loadedGreedyTask
-                    self.loadedGreedyTask = None
-                    self.greedyRun = True
-                    feedWorker(queueTask)
-                return
-            if len(self.sortedList) > 0:
-                taskTaken = False
-                for i in range(len(self.sortedList)):
-                    queueTask = self.sortedList[i]
-                    if not self._excluded(queueTask):
-                        taskTaken = True
-                        del self.sortedList[i]
-                        grp = queueTask.task.exclGroup
-                        if grp:
-                            self.exclGroups.add(grp)
-                        if queueTask.task.greedy:
-                            if len(self.waitingWorkers) == self.numWorkers:
-                                self.greedyRun = True
-                                feedWorker(queueTask)
-                            else:
-                                self.loadedGreedyTask = queueTask
-                            return
-                        else:
-                            feedWorker(queueTask)
-                        break
-                # leave if queueTask is not taken
-                if not taskTaken:
-                    return
-            else:
-                if len(self.waitingWorkers) == self.numWorkers:
-                    # No task in queue and all workers are waiting. Stop build!
-                    self.finished = True
-                    stopWorkers()
-                return
+    def take(self, doneTask=None):
+        '''Called by a worker. Posts the executed doneTask to the scheduler and blocks until
+        the next task is dispatched. Returns None when the worker has to stop.'''
+        with self.lock:
+            if doneTask is not None:
+                self._post(doneTask)
+            while not self.work:
+                self.workCnd.wait()
+            return self.work.popleft()
+
+    def _release(self, queueTask):
+        self.numRunning -= 1
+        self.tasksDone += 1
+        self.readyQueue.release(queueTask.task.exclGroup)
+        self.greedyRun = False
 
     def add(self, queueTask):
+        '''Called by the scheduler, the task is dispatched when a worker is idle.'''
         assert isinstance(queueTask, QueueTask)
+        logger.debugf("queue.add('{}')", queueTask.task.getId())
+        if self.tracer:
+            queueTask.trace = self.tracer.newTaskTrace(queueTask.getTaskId())
+        self.readyQueue.add(queueTask)
+
+    def call(self, fn):
+        '''Returns fn() called by the scheduler. It is for the other threads reading the build graph.'''
+        schedCall = SchedulerCall(fn)
         with self.lock:
-            logger.debugf("queue.add('{}')", queueTask.task.getId())
-            self.sortedList.add(queueTask)
-
-    def regWaiter(self, worker):
-
-        def isWaiting(worker):
-            # TODO in case of many workers it is not too efficient
-            for wrk in self.waitingWorkers:
-                if wrk.id == worker.id:
-                    return True
-            return False
-
+            scheduling = self.scheduling
+            if scheduling:
+                self._post(schedCall)
+        return schedCall.wait() if scheduling else fn()
+
+    def _schedule(self):
+        '''The scheduler loop. Runs until the requested tasks are built or the build fails and
+        the running tasks are completed.'''
+        self._dispatch()
+        while self.numRunning:
+            with self.lock:
+                while not self.events:
+                    self.schedulerWaiting = True
+                    self.eventCnd.wait()
+                self.schedulerWaiting = False
+                events, self.events = self.events, []
+            for event in events:
+                if isinstance(event, SchedulerCall):
+                    event.run()
+                else:
+                    self._release(event)
+                    event.complete()
+            self._dispatch()
+        self.finished = True
         with self.lock:
-            self.waitingWorkers.append(worker)
-            self._feedWorkers()
-            if self.progressFn:
-                # TODO: don't send too much progress information
-                # 5 per sec should be enough
-                progress = Progress(self.numWorkers)
-                reqCnt = self.getRequestedCnt()
-                progress.set(
-                   done=self.tasksDone, left=reqCnt - self.tasksDone,
-                   total=reqCnt)
-                for i in range(self.numWorkers):
-                    worker = self.workers[i]
-                    queueTask = worker.getQueueTask()
-                    if isWaiting(worker) or queueTask is None:
-                        progress.setWorker(i, '', True)
-                        progress.setWorkerPhase(i, '')
-                    else:
-                        progress.setWorker(i, worker.getTaskId(), False)
-                        progress.setWorkerPhase(i, queueTask.prio.phase)
-
-                self.progressFn(progress)
-
-    def release(self, queueTask):
-        with self.lock:
-            self.tasksDone += 1
-            grp = queueTask.task.exclGroup
-            if grp is not None:
-                self.exclGroups.remove(grp)
-            self.greedyRun = False
+            self.scheduling = False
+            events, self.events = self.events, []
+        # only SchedulerCalls can be left
+        for event in events:
+            event.run()
+
+    def getProgress(self):
+        '''Returns a progress.Progress snapshot. It is called without locking, the values may be
+        slightly inconsistent.'''
+        progress = Progress(self.numWorkers)
+        reqCnt, done = self.requestedCnt, self.tasksDone
+        progress.set(done=done, left=reqCnt - done, total=reqCnt)
+        for i, worker in enumerate(self.workers):
+            queueTask = worker.getQueueTask()
+            if queueTask is None:
+                progress.setWorker(i, '', True)
+                progress.setWorkerPhase(i, '')
+            else:
+                progress.setWorker(i, queueTask.getTaskId(), False)
+                progress.setWorkerPhase(i, queueTask.prio.phase)
+        return progress
 
-    def start(self):
+    def start(self, onStarted=None):
+        '''onStarted: called after the executor is started, the threads of the build have to be started by it.'''
         if self.finished:
             raise NotImplementedError("Builder instance can be used only once.")
         self.rc = 0
-        if not len(self.sortedList):
+        if not len(self.readyQueue):
             # if self.printUpToDate:
             cinfo(self.printInfo, "All targets are up-to-date. Nothing to do.")
             self.finished = True
             return
         self.workers = [Worker(self, i) for i in range(self.numWorkers)]
+        # the executor have to be started before the worker threads (process pool forks)
+        self.executor.start(self.numWorkers)
+        if onStarted:
+            onStarted()
+        reporter = ProgressReporter(self, self.progressFn, self.progressInterval) if self.progressFn else None
+        if reporter:
+            reporter.start()
         try:
             for worker in self.workers:
                 worker.start()
+            with self.lock:
+                self.scheduling = True
+            self._schedule()
+        # exception handling: progressFn have to be called with end marker
+        finally:
+            self._putWork([None] * self.numWorkers)
             for worker in self.workers:
                 logger.debugf("Joining worker {}", worker.id)
                 worker.join()
-        # exception handling: progressFn have to be called with end marker
-        finally:
+            self.executor.stop()
+            if reporter:
+                reporter.stop()
             if self.progressFn:
                 prg = Progress(self.numWorkers)
                 prg.finish(self.rc)
                 self.progressFn(prg)
 
-
     def stop(self, rc):
+        '''Called by the scheduler. No more tasks are dispatched, the dispatched ones not taken by a worker
+        yet are dropped, the running ones are completed.'''
         logger.debugf('rc={}', rc)
+        self.rc = rc
+        self.finished = True
         with self.lock:
-            self.rc = rc
-            self.finished = True
+            dropped, self.work = self.work, deque()
+        for queueTask in dropped:
+            self.numRunning -= 1
+            self.readyQueue.release(queueTask.task.exclGroup)
 
 
 class QueueTask(object):
 
+    critPath = 0.0
+    trace = None  # trace.TaskTrace if the build is traced
+
     def __init__(self, builder, task):
         self.builder = builder
         self.pf = self.builder.db.pathFormer
         self.prio = task.requestedPrio
         assert self.prio
         self.task = task
-
-    def __cmp__(self, o):
-        return prioCmp(self.prio, o.prio)
+        self.critPath = task.critPath
 
     def getTaskId(self):
         return self.pf.encode(self.task.getId())
 
+    def span(self, name):
+        '''Returns a context manager timing the phase "name" of the task if the build is traced.'''
+        return self.trace.span(name) if self.trace else noSpan
+
     def logFailure(self, what, rc):
         errorf('{}: {} failed! Return code: {}', self.getTaskId(), what, rc)
 
     def logUpToDate(self):
         cinfof(self.builder.printUpToDate, '{} is up-to-date.', self.getTaskId())
 
+    def _restoreFromCache(self):
+        '''Returns True when the outputs of the task are restored from the artifact cache.'''
+        cache = self.builder.artifactCache
+        if cache is None or not self.task.targets or not self.task.action:
+            return False
+        if not cache.restore(self.builder, self.task):
+            return False
+        self.builder.statCache.invalidate(self.task.targets + self.task.generatedFiles)
+        cinfof(self.builder.printInfo, 'Restored {} from cache.', self.getTaskId())
+        return True
+
     def logBuild(self):
         # cinfof(self.builder.printInfo, 'Building {}. {}', self.getTaskId(), self.prio.phase)
         cinfof(self.builder.printInfo, 'Building {}.', self.getTaskId())
@@ -276,7 +413,8 @@ class QueueTask(object):
         def runUpToDate():
             utd = self.task.upToDate
             if utd:
-                res = self.task._runCallback(utd, self.builder)
+                with self.span('upToDate'):
+                    res = self.builder.queue.executor.runCallback(self.builder, self.task, utd)
                 if type(res) is int:
                     self.logFailure('up-to-date check', res)
                     return res
@@ -294,9 +432,20 @@ class QueueTask(object):
                 # reset task's generated and provided files before action run
                 self.task.generatedFiles = []
                 self.task.providedFiles = []
-                res = self.task._runCallback(act, self.builder)
+                start = timer()
+                try:
+                    with self.span('action'):
+                        res = self.builder.queue.executor.runCallback(self.builder, self.task, act)
+                finally:
+                    # the action may change its outputs without the FS (e.g. by a compiler process)
+                    self.builder.statCache.invalidate(
+                        self.task.targets + self.task.generatedFiles + self.task.providedFiles)
+                # the meta dict can be shared by the user between tasks
+                self.task.meta = dict(self.task.meta, actionTime=round(timer() - start, 3))
                 if res:
                     self.logFailure('action', res)
+                elif self.builder.artifactCache and self.task.targets:
+                    self.builder.artifactCache.store(self.builder, self.task)
                 return res
             return 0
 
@@ -314,6 +463,8 @@ class QueueTask(object):
             return 0
 
         try:
+            if self._restoreFromCache():
+                return 0
             self.logBuild()
             return runAction()
         except Exception as e:
@@ -324,28 +475,49 @@ class QueueTask(object):
 
 
     def execute(self):
-        if self._execute():
-            # upToDate or action FAILED
-            self.builder.queue.stop(1)
-        else:
-            # upToDate or action PASSED
+        '''Called by a worker. Runs the up-to-date check and the action, and for a passed task saves it
+        and runs its taskFactory. The build graph is updated by complete().'''
+        self.rc = self._execute()
+        self.newTasks = None
+        if self.rc:
+            return
+        # upToDate or action PASSED
+        with self.span('save'):
             self.builder.db.saveTask(self.builder, self.task)  # need to be executed before _injectGenerated()
-            try:
-                # inject generated dependencies
-                if self.task.generatedFiles or self.task.providedFiles or self.task.providedTasks:
-                    # the task can be marked up-to-date when provided files and tasks are built
-                    logger.debugf('{} has provided files or tasks', self.getTaskId())
-                    # Tasks for generated files needs to be added even if the generator task is up-to-date.
-                    # If the generator task is up-to-date, the intermediate files between the provided files
-                    # and generated files may be changed.
-                    self.builder._executeTaskFactory(self.task)
-                    self.builder._injectGenerated(self.task)
-                # else:
-                logger.debugf('Build of {} is completed', self.getTaskId())
-                # -- task completed, notify parents
-                self.builder._handleTaskBuildCompleted(self.task)
-            except Exception as e:
-                # e.g. calculating task data hashes may fail
-                errorf("Exception in task '{}': {} msg: '{}'", self.getTaskId(), type(e), e)
-                traceback.print_exc()
+        try:
+            if self.task.generatedFiles or self.task.providedFiles or self.task.providedTasks:
+                # Tasks for generated files needs to be added even if the generator task is up-to-date.
+                # If the generator task is up-to-date, the intermediate files between the provided files
+                # and generated files may be changed.
+                with self.span('factory'):
+                    self.newTasks = self.builder._runTaskFactory(self.task)
+            else:
+                self.newTasks = []
+        except Exception as e:
+            errorf("Exception in task '{}': {} msg: '{}'", self.getTaskId(), type(e), e)
+            traceback.print_exc()
 
+    def complete(self):
+        '''Called by the scheduler when the task is executed.'''
+        if self.rc:
+            # upToDate or action FAILED
+            self.builder.queue.stop(1)
+            return
+        if self.newTasks is None:
+            return  # execute() failed
+        try:
+            # inject generated dependencies
+            if self.task.generatedFiles or self.task.providedFiles or self.task.providedTasks:
+                # the task can be marked up-to-date when provided files and tasks are built
+                logger.debugf('{} has provided files or tasks', self.getTaskId())
+                self.builder._addFactoryTasks(self.task, self.newTasks)
+                self.builder._injectGenerated(self.task)
+            logger.debugf('Build of {} is completed', self.getTaskId())
+            # -- task completed, notify parents
+            self.builder._handleTaskBuildCompleted(self.task)
+            if self.trace:
+                self.trace.notified = self.trace.tracer.now()
+        except Exception as e:
+            # e.g. calculating task data hashes may fail
+            errorf("Exception in task '{}': {} msg: '{}'", self.getTaskId(), type(e), e)
+            traceback.print_exc()
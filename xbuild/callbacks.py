@@ -19,7 +19,6 @@
 # SOFTWARE.
 
 
-import os
 import logging
 import fs
 from console import getLoggerAdapter
@@ -45,10 +44,11 @@ def targetUpToDate(bldr, task, skipFileDepChecks=False):
 def targetUpToDateTimeStamp(bldr, task, skipFileDepChecks=False):
     # needDebug = task.getId().endswith('unsigned.exe')
     needDebug = False
+    statCache = bldr.statCache
     def checkFiles(targetTime, fileDeps):
-        for fileDep in fileDeps:
-            if bldr.fs.exists(fileDep):
-                if os.path.getmtime(fileDep) > targetTime:
+        for fileDep, stat in zip(fileDeps, statCache.statMany(fileDeps)):
+            if stat is not None:
+                if stat.mtimeNs > targetTime:
                     logger.cdebugf(needDebug, '{} is newer than target!', fileDep)
                     return False
             else:
@@ -57,25 +57,24 @@ def targetUpToDateTimeStamp(bldr, task, skipFileDepChecks=False):
         return True
 
     targets = list(task.targets)
+    trgStats = statCache.statMany(targets + list(task.savedGeneratedFiles))
     # not up-to-date when target doesn't exist
-    for trg in targets:
-        if not bldr.fs.isfile(trg):
+    for trg, stat in zip(targets, trgStats):
+        if stat is None or stat.isDir:
             logger.cdebugf(needDebug, 'target: {} does not exist!', trg)
             return False
 
     # not up-to-date when generated files don't exist
-    for gen in task.savedGeneratedFiles:
-        if not bldr.fs.isfile(gen):
+    for gen, stat in zip(task.savedGeneratedFiles, trgStats[len(targets):]):
+        if stat is None or stat.isDir:
             logger.cdebugf(needDebug, 'generated file: {} does not exist!', gen)
             return False
 
     # get time of most up-to-date target
     targetTime = 0
-    for trg in targets + task.savedGeneratedFiles:
-        logger.cdebugf(needDebug, 'check file: {}', trg)
-        mtime = os.path.getmtime(trg)  # TODO: add getmtime() to FS
-        if mtime > targetTime:
-            targetTime = mtime
+    for stat in trgStats:
+        if stat.mtimeNs > targetTime:
+            targetTime = stat.mtimeNs
 
     # detect fileDeps list change
     if not skipFileDepChecks and task.fileDeps != task.savedFileDeps:
@@ -90,9 +89,9 @@ def targetUpToDateTimeStamp(bldr, task, skipFileDepChecks=False):
             return False
     # up-to-date status of provided files are checked by the QueueTask
     if not task.providedFiles:
-        task.providedFiles = task.savedProvidedFiles[:]
+        task.providedFiles = list(task.savedProvidedFiles)
     if not task.generatedFiles:
-        task.generatedFiles = task.savedGeneratedFiles[:]
+        task.generatedFiles = list(task.savedGeneratedFiles)
     logger.cdebug(needDebug, 'targetUpToDate: True')
     return True
 
@@ -105,20 +104,17 @@ def targetUpToDateHash(bldr, task, skipFileDepChecks=False):
 
     # if dependencies are not changed, targets also need check
     def checkFiles(fileDeps):
-        for fileDep in fileDeps:
-            hashEnt = bldr.db.hashDict.get(fileDep)
-            with hashEnt.lock:
-                if hashEnt.new is None:
-                    # there can be file dependencies coming from outside the build process
-                    hashEnt.setByFile(bldr.fs, fileDep)
-                logger.cdebugf(needDebug, 'after: {} -> {} matches: {}', fileDep, hashEnt, hashEnt.matches())
-                if not hashEnt.matches():
-                    return False
+        # there can be file dependencies coming from outside the build process
+        hashEnts = bldr.db.hashDict.hashFiles(bldr.fs, fileDeps, statCache=bldr.statCache)
+        for fileDep, hashEnt in zip(fileDeps, hashEnts):
+            logger.cdebugf(needDebug, 'after: {} -> {} matches: {}', fileDep, hashEnt, hashEnt.matches())
+            if not hashEnt.matches():
+                return False
         return True
 
     # not up-to-date when target doesn't exist
     for trg in task.targets:
-        if not bldr.fs.isfile(trg):
+        if not bldr.statCache.isfile(trg):
             logger.cdebugf(needDebug, 'target: {} does not exist!', trg)
             return False
 
@@ -136,10 +132,10 @@ def targetUpToDateHash(bldr, task, skipFileDepChecks=False):
         return False
     # up-to-date status of provided files are checked by the QueueTask
     if not task.providedFiles:
-        task.providedFiles = task.savedProvidedFiles[:]
+        task.providedFiles = list(task.savedProvidedFiles)
     # TODO: how to handle savedProvidedTasks?
     if not task.generatedFiles:
-        task.generatedFiles = task.savedGeneratedFiles[:]
+        task.generatedFiles = list(task.savedGeneratedFiles)
     # if not checkFiles(task.providedFiles):
     #    return False
     if not checkFiles(task.generatedFiles):
@@ -18,13 +18,61 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import os
-import json
-from hash import HashDict
+from threading import RLock, Thread, Event
+from multiprocessing.pool import ThreadPool
+from hash import HashDict, DefaultHashAlgo
+from dbstore import JsonStore, SqliteStore
 from fs import Cleaner
 from console import logger, infof, warnf, errorf
 from collections import defaultdict
 from xbuild.pathformer import NoPathFormer
+from pathtable import PathTable, PathMap
+
+class Checkpointer(Thread):
+    '''Saves the changed DB records in every interval seconds and after every taskInterval saved
+    tasks during the build, so an interrupted build continues with the unfinished tasks only.
+    staleFn() returns the ids of the tasks whose saved records must not be kept, see DB.save().'''
+
+    def __init__(self, db, interval, taskInterval, staleFn):
+        super(Checkpointer, self).__init__(name='Checkpointer')
+        self.daemon = True
+        self.db = db
+        self.interval = interval or None    # None: only taskInterval triggers
+        self.taskInterval = taskInterval
+        self.staleFn = staleFn
+        self.savedTasks = 0
+        self.dirty = False
+        self.wakeEvent = Event()
+        self.stopped = False
+
+    def taskSaved(self):
+        # called with the DB lock held
+        self.dirty = True
+        self.savedTasks += 1
+        if self.taskInterval and self.savedTasks >= self.taskInterval:
+            self.savedTasks = 0
+            self.wakeEvent.set()
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            self.wakeEvent.wait(self.interval)
+            self.wakeEvent.clear()
+            stopped = self.stopped
+            # the tasks saved since the last checkpoint are flushed when the build queue stops
+            if stopped and not self.dirty:
+                break
+            self.dirty = False
+            try:
+                self.db.save(self.staleFn())
+            except Exception as e:
+                warnf("DB checkpoint failed: {} msg: '{}'", type(e), e)
+
+    def stop(self):
+        self.stopped = True
+        self.wakeEvent.set()
+        self.join()
+
 
 class DB(object):
     
@@ -33,46 +81,68 @@ class DB(object):
     nameSet = set()
 
     @staticmethod
-    def create(name, fs, pathFormer=NoPathFormer()):
+    def create(name, fs, pathFormer=NoPathFormer(), hashAlgo=DefaultHashAlgo, pathTable=None):
         if name in DB.nameSet:
             errorf('DB "{}" is already created!', name)
             return None
+        db = DB(name, fs, pathFormer, hashAlgo, pathTable)
         DB.nameSet.add(name)
-        return DB(name, fs, pathFormer)
+        return db
 
-    def __init__(self, name, fs, pathFormer):
+    def __init__(self, name, fs, pathFormer, hashAlgo=DefaultHashAlgo, pathTable=None):
+        '''pathTable: the PathTable of the Builder, the target and hash dicts are indexed by its path ids.'''
+        pathTable = PathTable() if pathTable is None else pathTable
         self.name = name
         self.fs = fs
         self.pathFormer = pathFormer
         self.taskIdSavedTaskDict = {}   # {taskId: saved task data}
-        self.targetSavedTaskDict = {}   # {targetName: saved task data}
-        self.hashDict = HashDict()
+        self.targetSavedTaskDict = PathMap(pathTable)   # {targetName: saved task data}
+        self.hashDict = HashDict(hashAlgo, pathTable=pathTable)
         self.filesToClean = set()       # additional files for cleanAll
         self.graph = None
-        pass
+        self.dirtyTaskIds = set()       # task records changed or removed since the last save
+        self.store = SqliteStore(fs, name) if fs.isLocal() else JsonStore(fs, name)
+        # With a lazy store the task records are read on demand, the dicts above are partial.
+        self.allTasksLoaded = True
+        self.lock = RLock()             # serializes task record changes and saves
+        self.checkpointer = None
+        self.staleTaskIds = set()       # tasks whose records are left out from the store, see save()
+        self.savedTaskIds = set()       # tasks saved by saveTask(), their records are never stale
 
     def forget(self):
+        self.stopCheckpoints()
+        self.hashDict.close()
+        self.store.close()
         DB.nameSet.remove(self.name)
 
     def load(self):
-        fpath = '{}.xbuild'.format(self.name)
-        if not self.fs.isfile(fpath):
-            return
-        try:
-            jsonObj = json.loads(self.fs.read(fpath)) # loads() for easier unit test
-        except:
-            warnf("'{}' is corrupted! JSON load failed!", fpath)
-            raise
+        jsonObj = self.store.load()
+        if jsonObj is None:
             return
+        fpath = self.store.fpath
         # TODO: check version
         if type(jsonObj) is not dict:
             warnf("'{}' is corrupted! Top level dict expected!", fpath)
             return
+        hashAlgo = jsonObj.get('HashAlgo', DefaultHashAlgo)   # older DBs don't store it
+        if self.store.lazy:
+            if hashAlgo != self.hashDict.algo:
+                warnf("'{}' was saved with '{}' hash algorithm, its hashes are dropped.", fpath, hashAlgo)
+                self.hashDict.clear()
+            else:
+                self.hashDict.loader = self.store.getHash
+            self.allTasksLoaded = False
+            self.filesToClean = set(jsonObj.get('FilesToClean', []))
+            return
         hashDictJsonObj = jsonObj.get('HashDict')
         if hashDictJsonObj is None:
             warnf("'{}' is corrupted! 'HashDict' section is missing!", fpath)
             return
-        if not self.hashDict._loadJsonObj(hashDictJsonObj, warnf):
+        if hashAlgo != self.hashDict.algo:
+            # the stored hashes cannot be compared, the hash checked tasks will be rebuilt
+            warnf("'{}' was saved with '{}' hash algorithm, its hashes are dropped.", fpath, hashAlgo)
+            self.hashDict.clear()
+        elif not self.hashDict._loadJsonObj(hashDictJsonObj, warnf):
             warnf("'{}' is corrupted! Failed to load 'HashDict'!", fpath)
             return
         taskDict = jsonObj.get('Task')
@@ -89,32 +159,91 @@ class DB(object):
             for trg in taskData.get('trgs', emptyList):
                 self.targetSavedTaskDict[trg] = taskData
 
-    def save(self):
-        jsonObj = {'version': [0, 0, 0]}
-        jsonObj['HashDict'] = self.hashDict._toJsonObj()
-        # taskIdSavedTaskDict
-        jsonObj['Task'] = self.taskIdSavedTaskDict
-        jsonObj['FilesToClean'] = list(self.filesToClean)
-        fpath = '{}.xbuild'.format(self.name)
-        self.fs.write(fpath, json.dumps(jsonObj, ensure_ascii=True, indent=1))  # dumps() for easier unit test
+    def save(self, staleTaskIds=()):
+        '''staleTaskIds: unfinished tasks whose files got new hashes. The new hashes are saved, so the
+           saved records of these tasks are left out from the store, otherwise they would look up-to-date
+           in the next build. A record is written again by the save which doesn't get its task as stale.'''
+        with self.lock:
+            # a task may be saved by its worker before the build graph gets it completed
+            staleTaskIds = set(staleTaskIds).difference(self.savedTaskIds)
+            self.dirtyTaskIds.update(staleTaskIds ^ self.staleTaskIds)
+            self.staleTaskIds = staleTaskIds
+            self.store.save(self)
+
+    def startCheckpoints(self, interval, taskInterval, staleFn):
+        self.checkpointer = Checkpointer(self, interval, taskInterval, staleFn)
+        self.checkpointer.start()
+
+    def stopCheckpoints(self):
+        if self.checkpointer:
+            self.checkpointer.stop()
+            self.checkpointer = None
+
+    def _popDirtyTasks(self):
+        '''Returns ({taskId: taskData}, [removedTaskId]) of the changes since the previous call.'''
+        dirtyTaskIds, self.dirtyTaskIds = self.dirtyTaskIds, set()
+        taskDict, removedIds = {}, []
+        for taskId in dirtyTaskIds:
+            taskData = self.taskIdSavedTaskDict.get(taskId)
+            if taskData is None or taskId in self.staleTaskIds:
+                removedIds.append(taskId)
+            else:
+                taskDict[taskId] = taskData
+        return taskDict, removedIds
+
+    def _restoreDirtyTasks(self, taskDict, removedIds):
+        '''Marks the changes returned by _popDirtyTasks() as unsaved again.'''
+        self.dirtyTaskIds.update(taskDict)
+        self.dirtyTaskIds.update(removedIds)
 
     def saveTask(self, bldr, task, storeHash=True):
-        taskObj = self.taskIdSavedTaskDict.get(task.getId())
-        if taskObj is None:
-            taskObj = {}
-            self.taskIdSavedTaskDict[task.getId()] = taskObj
-            for trg in task.targets:
-                self.targetSavedTaskDict[trg] = taskObj
-        else:
-            taskObj.clear()
-        task.toDict(res=taskObj)
+        # hashes go first, a checkpoint must not see the new record without them
         if storeHash and bldr.needsHashCheck(task):
             self.hashDict.storeTaskHashes(bldr, task)
-        self.graph = None
+        # the record doesn't share lists with the task, so later changes of the task are detected
+        newObj = {key: type(value)(value) for key, value in task.toDict().items()}
+        with self.lock:
+            taskObj = self._getSavedTask(task.getId())
+            if taskObj is None:
+                taskObj = {}
+                self._addSavedTask(task.getId(), taskObj)
+            if taskObj != newObj:
+                # up-to-date tasks are saved too, their unchanged records are not written again
+                taskObj.clear()
+                taskObj.update(newObj)
+                self.dirtyTaskIds.add(task.getId())
+                if self.graph is not None:
+                    self._updateGraph(taskObj)
+            self.savedTaskIds.add(task.getId())
+            if self.checkpointer:
+                self.checkpointer.taskSaved()
+
+    def _addSavedTask(self, taskId, taskData):
+        self.taskIdSavedTaskDict[taskId] = taskData
+        for trg in taskData.get('trgs', []):
+            self.targetSavedTaskDict[trg] = taskData
+
+    def _getSavedTask(self, taskId):
+        '''Returns the saved task data, it is read from the store when it is not loaded yet.'''
+        with self.lock:
+            taskData = self.taskIdSavedTaskDict.get(taskId)
+            if taskData is None and not self.allTasksLoaded:
+                taskData = self.store.getTask(taskId)
+                if taskData is not None:
+                    self._addSavedTask(taskId, taskData)
+            return taskData
+
+    def _loadAllTasks(self):
+        '''Materializes all the task records. Needed by the operations working on the whole DB.'''
+        if not self.allTasksLoaded:
+            for taskId, taskData in self.store.getAllTasks().items():
+                if taskId not in self.taskIdSavedTaskDict:
+                    self._addSavedTask(taskId, taskData)
+            self.allTasksLoaded = True
 
     def loadTask(self, task):
         # fill up task with saved data
-        taskObj = self.taskIdSavedTaskDict.get(task.getId())
+        taskObj = self._getSavedTask(task.getId())
         if taskObj:
             task.savedFileDeps = taskObj.get('fDeps', [])
             task.savedDynFileDeps = taskObj.get('dfDeps', [])
@@ -125,25 +254,42 @@ class DB(object):
             meta = taskObj.get('meta', {})
             task.meta = meta
 
+    def _updateGraph(self, taskData):
+        taskNode = self.graph.updateTask(
+            name=taskData.get('name'),
+            targets=taskData.get('trgs'),
+            fileDeps=taskData.get('fDeps'),
+            dynFileDeps=taskData.get('dfDeps'),
+            taskDeps=taskData.get('tDeps'),
+            generatedFiles=taskData.get('gFiles'),
+            providedFiles=taskData.get('pFiles'),
+            providedTasks=taskData.get('pTasks'))
+        taskNode.data.garbageDirs = taskData.get('grbDirs', [])
+
     def getGraph(self):
-        if self.graph is None:
-            from depgraph import DepGraph
-            self.graph = DepGraph()
-            for taskData in self.taskIdSavedTaskDict.values():
-                taskNode = self.graph.addTask(
-                    name=taskData.get('name'),
-                    targets=taskData.get('trgs'),
-                    fileDeps=taskData.get('fDeps'),
-                    dynFileDeps=taskData.get('dfDeps'),
-                    taskDeps=taskData.get('tDeps'),
-                    generatedFiles=taskData.get('gFiles'),
-                    providedFiles=taskData.get('pFiles'),
-                    providedTasks=taskData.get('pTasks'))
-                taskNode.data.garbageDirs = taskData.get('grbDirs', [])
-        return self.graph
+        '''The graph is built at the 1st call, after that it is kept in sync by saveTask() and clean().'''
+        with self.lock:
+            if self.graph is None:
+                from depgraph import DepGraph
+                self._loadAllTasks()
+                self.graph = DepGraph()
+                for taskData in self.taskIdSavedTaskDict.values():
+                    self._updateGraph(taskData)
+            return self.graph
+
+    def _removeSavedTask(self, taskId):
+        taskData = self.taskIdSavedTaskDict.pop(taskId, None)
+        if taskData is None:
+            return
+        for trg in taskData.get('trgs', []):
+            if self.targetSavedTaskDict.get(trg) is taskData:
+                del self.targetSavedTaskDict[trg]
+        self.dirtyTaskIds.add(taskId)
 
     def loadGraph(self, graph):
         taskNodes = graph.getAllTasks().values()
+        self._loadAllTasks()
+        self.dirtyTaskIds.update(self.taskIdSavedTaskDict)
         self.taskIdSavedTaskDict.clear()
         self.targetSavedTaskDict.clear()
         for taskNode in taskNodes:
@@ -168,6 +314,7 @@ class DB(object):
             if hasattr(taskNode.data, 'garbageDirs'):
                 setF('grbDirs', taskNode.data.garbageDirs)
             self.taskIdSavedTaskDict[taskNode.id] = data
+            self.dirtyTaskIds.add(taskNode.id)
             for trg in data.get('trgs', []):
                 self.targetSavedTaskDict[trg] = data
 
@@ -179,9 +326,13 @@ class DB(object):
 
     def getTaskData(self, targetOrName):
         taskData = self.targetSavedTaskDict.get(targetOrName)
+        if taskData is None and not self.allTasksLoaded:
+            taskId = self.store.getTaskIdOfTarget(targetOrName)
+            if taskId is not None:
+                taskData = self._getSavedTask(taskId)
         if taskData is None:
             # this lookup is only good for task names
-            taskData = self.taskIdSavedTaskDict.get(targetOrName)
+            taskData = self._getSavedTask(targetOrName)
         return taskData
 
     def clean(self, bldr=None, targetOrNameList=None, extraFiles=[]):
@@ -201,28 +352,46 @@ class DB(object):
         # infof('selectedTasks: {}', selectedTasks)
         filesToRemove = set(selectedFiles.keys())
         dirsToRemove = set()
+        cleanerTasks = []
         for tNode in selectedTasks.values():
             if bldr is not None:
                 task = bldr._getTaskById(tNode.getId())
                 if task is not None and task.cleaner is not None:
-                    files, dirs = task._runCallback(task.cleaner, bldr)
-                    filesToRemove.update(files)
-                    dirsToRemove.update(dirs)
+                    cleanerTasks.append(task)
             dirsToRemove.update(tNode.data.garbageDirs)
+        workers = bldr.workers if bldr is not None else 1
+        for files, dirs in self._runCleaners(bldr, cleanerTasks, workers):
+            filesToRemove.update(files)
+            dirsToRemove.update(dirs)
         filesToRemove = list(filesToRemove)
         dirsToRemove = list(dirsToRemove)
-        cleaner = Cleaner(self.fs, filesToRemove + extraFiles, dirsToRemove)
+        cleaner = Cleaner(self.fs, filesToRemove + extraFiles, dirsToRemove, workers=workers)
         rDirs, rFiles = cleaner.clean()
-        for d in rDirs:
+        for d in sorted(rDirs):
             infof('Removed folder: {}', d)
-        for f in rFiles:
+        for f in sorted(rFiles):
             infof('Removed file: {}', f)
-        # remove selected tasks from graph
-        for taskNode in selectedTasks.values():
-            graph.removeTask(taskNode)
-        self.loadGraph(graph)
+        # remove selected tasks from graph and their records, the other records are not changed
+        with self.lock:
+            for taskNode in selectedTasks.values():
+                graph.removeTask(taskNode)
+                self._removeSavedTask(taskNode.id)
         return True # not errors
 
+    def _runCleaners(self, bldr, tasks, workers):
+        '''Runs the cleaner callbacks of the tasks concurrently. Returns [(files, dirs)].'''
+        def runCleaner(task):
+            return task._runCallback(task.cleaner, bldr)
+
+        if workers < 2 or len(tasks) < 2:
+            return map(runCleaner, tasks)
+        pool = ThreadPool(min(workers, len(tasks)))
+        try:
+            return pool.map(runCleaner, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
     def registerFilesToClean(self, fpaths):
         for f in fpaths:
             self.filesToClean.add(f)
@@ -250,6 +419,7 @@ class DB(object):
                 res += '[{}] {} () "{}" : {}\n'.format(taskIdxStr, arrow, encode(e), text)
             return res
             
+        self._loadAllTasks()
         res = "@startuml\n"
         res += "left to right direction\n"
         idIdxMap = {}
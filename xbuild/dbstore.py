@@ -0,0 +1,205 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import sqlite3
+from threading import Lock
+from console import warnf, infof
+
+Version = [0, 0, 0]
+
+
+class JsonStore(object):
+    '''Keeps the whole DB in one JSON file, it is rewritten on every save.
+       It is used when the FS is not the local file system (e.g. MockFS).'''
+
+    lazy = False    # load() returns all the records
+
+    def __init__(self, fs, name):
+        self.fs = fs
+        self.fpath = '{}.xbuild'.format(name)
+
+    def load(self):
+        '''Returns the stored JSON object or None if there is no DB file.'''
+        if not self.fs.isfile(self.fpath):
+            return None
+        try:
+            return json.loads(self.fs.read(self.fpath)) # loads() for easier unit test
+        except:
+            warnf("'{}' is corrupted! JSON load failed!", self.fpath)
+            raise
+
+    def save(self, db):
+        jsonObj = {'version': Version}
+        jsonObj['HashDict'] = db.hashDict._toJsonObj()
+        jsonObj['HashAlgo'] = db.hashDict.algo
+        jsonObj['Task'] = db.taskIdSavedTaskDict
+        if db.staleTaskIds:
+            jsonObj['Task'] = {
+                taskId: data for taskId, data in db.taskIdSavedTaskDict.items() if taskId not in db.staleTaskIds}
+        jsonObj['FilesToClean'] = list(db.filesToClean)
+        # the old file is replaced atomically, an interrupted save doesn't corrupt it
+        tmpPath = self.fpath + '.tmp'
+        self.fs.write(tmpPath, json.dumps(jsonObj, ensure_ascii=True, indent=1))  # dumps() for easier unit test
+        self.fs.rename(tmpPath, self.fpath)
+
+    def close(self):
+        pass
+
+
+class SqliteStore(object):
+    '''Keeps the DB in <name>.xbuild.db. Only the task records and hashes changed since the
+       previous save are written. An existing JSON DB is imported once and renamed to .bak.
+       The records are loaded on demand by getTask(), getTaskIdOfTarget() and getHash().'''
+
+    lazy = True
+
+    Schema = '''
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS task (id TEXT PRIMARY KEY, data TEXT);
+        CREATE TABLE IF NOT EXISTS target (name TEXT PRIMARY KEY, taskId TEXT);
+        CREATE TABLE IF NOT EXISTS hash (name TEXT PRIMARY KEY, hash TEXT, size INTEGER, mtimeNs INTEGER, ino INTEGER);
+        CREATE INDEX IF NOT EXISTS targetTaskId ON target (taskId);
+    '''
+
+    def __init__(self, fs, name):
+        self.fs = fs
+        self.fpath = '{}.xbuild.db'.format(name)
+        self.jsonStore = JsonStore(fs, name)
+        self.conn = None    # connected on first use
+        self.lock = Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.fpath, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+            self.conn.executescript(SqliteStore.Schema)
+        return self.conn
+
+    def _importJson(self):
+        jsonObj = self.jsonStore.load()
+        if type(jsonObj) is not dict or type(jsonObj.get('Task')) is not dict:
+            warnf("'{}' is corrupted! It is not imported.", self.jsonStore.fpath)
+            return
+        conn = self._connect()
+        with conn:
+            self._writeMeta(conn, jsonObj.get('HashAlgo'), jsonObj.get('FilesToClean', []))
+            taskDict = jsonObj.get('Task', {})
+            self._writeTasks(conn, taskDict, [])
+            self._writeHashes(conn, False, jsonObj.get('HashDict', {}), [])
+        bakPath = self.jsonStore.fpath + '.bak'
+        if self.fs.isfile(bakPath):
+            self.fs.remove(bakPath)
+        self.fs.rename(self.jsonStore.fpath, bakPath)
+        infof("'{}' is imported into '{}'.", self.jsonStore.fpath, self.fpath)
+
+    def load(self):
+        '''Returns the meta data in the JSON DB format (without 'Task' and 'HashDict')
+           or None if there is no DB file.'''
+        with self.lock:
+            if not self.fs.isfile(self.fpath):
+                if not self.fs.isfile(self.jsonStore.fpath):
+                    return None
+                self._importJson()
+            conn = self._connect()
+            meta = {key: json.loads(value) for key, value in conn.execute('SELECT key, value FROM meta')}
+            jsonObj = {'version': meta.get('version', Version), 'FilesToClean': meta.get('FilesToClean', [])}
+            if 'HashAlgo' in meta:
+                jsonObj['HashAlgo'] = meta['HashAlgo']
+            return jsonObj
+
+    def getTask(self, taskId):
+        '''Returns the task record or None.'''
+        with self.lock:
+            row = self._connect().execute('SELECT data FROM task WHERE id = ?', (taskId,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def getTaskIdOfTarget(self, target):
+        with self.lock:
+            row = self._connect().execute('SELECT taskId FROM target WHERE name = ?', (target,)).fetchone()
+        return None if row is None else row[0]
+
+    def getAllTasks(self):
+        '''Returns {taskId: task record}.'''
+        with self.lock:
+            rows = self._connect().execute('SELECT id, data FROM task').fetchall()
+        return {taskId: json.loads(data) for taskId, data in rows}
+
+    def getHash(self, name):
+        '''Returns the hash entry in the JSON DB format or None.'''
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT hash, size, mtimeNs, ino FROM hash WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        digest, size, mtimeNs, ino = row
+        return digest if size is None else [digest, size, mtimeNs, ino]
+
+    def _writeMeta(self, conn, hashAlgo, filesToClean):
+        conn.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [(key, json.dumps(value)) for key, value in (
+                ('version', Version), ('HashAlgo', hashAlgo), ('FilesToClean', filesToClean)) if value is not None])
+
+    def _writeTasks(self, conn, taskDict, removedIds):
+        removedIds = [(taskId,) for taskId in removedIds]
+        conn.executemany('DELETE FROM task WHERE id = ?', removedIds)
+        conn.executemany('DELETE FROM target WHERE taskId = ?', removedIds + [(taskId,) for taskId in taskDict])
+        conn.executemany(
+            'INSERT OR REPLACE INTO task (id, data) VALUES (?, ?)',
+            [(taskId, json.dumps(data, ensure_ascii=True)) for taskId, data in taskDict.items()])
+        conn.executemany(
+            'INSERT OR REPLACE INTO target (name, taskId) VALUES (?, ?)',
+            [(trg, taskId) for taskId, data in taskDict.items() for trg in data.get('trgs', [])])
+
+    def _writeHashes(self, conn, removedAll, hashDict, removedNames):
+        if removedAll:
+            conn.execute('DELETE FROM hash')
+        conn.executemany('DELETE FROM hash WHERE name = ?', [(name,) for name in removedNames])
+        rows = []
+        for name, obj in hashDict.items():
+            if type(obj) is list:
+                rows.append([name] + obj)
+            elif obj:
+                rows.append((name, obj, None, None, None))
+        conn.executemany('INSERT OR REPLACE INTO hash (name, hash, size, mtimeNs, ino) VALUES (?, ?, ?, ?, ?)', rows)
+
+    def save(self, db):
+        taskDict, removedIds = db._popDirtyTasks()
+        removedAll, hashDict, removedNames = db.hashDict._popChanges()
+        try:
+            with self.lock:
+                conn = self._connect()
+                with conn:
+                    self._writeMeta(conn, db.hashDict.algo, list(db.filesToClean))
+                    self._writeTasks(conn, taskDict, removedIds)
+                    self._writeHashes(conn, removedAll, hashDict, removedNames)
+        except:
+            # the transaction is rolled back, the next save writes the changes
+            db._restoreDirtyTasks(taskDict, removedIds)
+            db.hashDict._restoreChanges(removedAll, hashDict, removedNames)
+            raise
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
@@ -19,6 +19,7 @@
 # SOFTWARE.
 
 
+from array import array
 from collections import OrderedDict
 
 
@@ -44,6 +45,13 @@ class Depth(object):
             self.higher = v
 
 
+class EdgeKind(object):
+    '''Tags of the GraphSnapshot edges. An edge has the same kind in both directions, e.g. a FileDep edge is
+    a right edge of the task and a left edge of the file.'''
+    Target, Generated, Provided, FileDep, DynFileDep, TaskDep = range(6)
+    TXT = ['Target', 'Generated', 'Provided', 'FileDep', 'DynFileDep', 'TaskDep']
+
+
 class Node(object):
 
     @staticmethod
@@ -64,7 +72,6 @@ class Node(object):
     def __init__(self, nodeId):
         self.id = nodeId
         self.depth = Depth()
-        self.selectCnt = 0
         self.data = UserData()
         # cache
         self._resetCache()
@@ -163,6 +170,9 @@ class FileNode(Node):
     def getRightNodeDicts(self):
         return self.targetOf, self.generatedOf, self.providedOf
 
+    # EdgeKinds of getRightNodeDicts()
+    rightKinds = EdgeKind.Target, EdgeKind.Generated, EdgeKind.Provided
+
     def setTargetOf(self, taskNode):
         assert not self.targetOf
         assert not self.generatedOf
@@ -227,6 +237,93 @@ class TaskNode(Node):
     def getRightNodeDicts(self):
         return self.fileDeps, self.dynFileDeps, self.taskDeps, self.providedOf
 
+    # EdgeKinds of getRightNodeDicts()
+    rightKinds = EdgeKind.FileDep, EdgeKind.DynFileDep, EdgeKind.TaskDep, EdgeKind.Provided
+
+
+class GraphSnapshot(object):
+    '''An immutable compressed sparse row (CSR) copy of the links of a DepGraph for the traversals.
+    The nodes are numbered: the roots come first, then the nodes reachable from them, then the rest.
+    The right edges of node i are rightEdges[rightOffsets[i]:rightOffsets[i + 1]] with their EdgeKinds in
+    rightKinds at the same positions, the left edges are stored the same way. The Nodes remain the object
+    view of the graph, nodes[i] is the Node of index i.'''
+
+    def __init__(self, depGraph):
+        self.nodes = nodes = depGraph.rootFileDict.values() + depGraph.rootTaskDict.values()
+        self.numRoots = len(nodes)
+        self.nodeIdxs = nodeIdxs = {node: idx for idx, node in enumerate(nodes)}  # {Node: index}
+        self.isTask = isTask = bytearray()
+        self.rightOffsets = rightOffsets = array('l', [0])
+        self.rightEdges = rightEdges = array('l')
+        self.rightKinds = rightKinds = array('b')
+
+        getIdx = nodeIdxs.get
+
+        def addRows():
+            # breadth first, the rows are appended in index order
+            idx = len(isTask)
+            while idx < len(nodes):
+                node = nodes[idx]
+                isTask.append(isinstance(node, TaskNode))
+                for rnDict, kind in zip(node.getRightNodeDicts(), node.rightKinds):
+                    if not rnDict:
+                        continue
+                    # the common case is a known node, the new nodes are numbered in a 2nd pass
+                    rNodes = rnDict.values()
+                    row = [getIdx(rNode, -1) for rNode in rNodes]
+                    if -1 in row:
+                        for i, rNode in enumerate(rNodes):
+                            if row[i] == -1:
+                                rIdx = getIdx(rNode)
+                                if rIdx is None:
+                                    rIdx = nodeIdxs[rNode] = len(nodes)
+                                    nodes.append(rNode)
+                                row[i] = rIdx
+                    rightEdges.extend(row)
+                    rightKinds.extend([kind] * len(row))
+                rightOffsets.append(len(rightEdges))
+                idx += 1
+
+        addRows()
+        self.numReached = len(nodes)  # nodes reachable from the roots
+        for node in depGraph.fileDict.values() + depGraph.taskDict.values():
+            if node not in nodeIdxs:
+                nodeIdxs[node] = len(nodes)
+                nodes.append(node)
+        addRows()
+        # the left edges are the transposed right edges
+        numNodes = len(nodes)
+        leftOffsets = array('l', [0]) * (numNodes + 1)
+        for rIdx in rightEdges:
+            leftOffsets[rIdx + 1] += 1
+        for idx in xrange(numNodes):
+            leftOffsets[idx + 1] += leftOffsets[idx]
+        ends = leftOffsets[:-1]
+        self.leftOffsets = leftOffsets
+        self.leftEdges = leftEdges = array('l', [0]) * len(rightEdges)
+        self.leftKinds = leftKinds = array('b', [0]) * len(rightEdges)
+        for idx in xrange(numNodes):
+            for e in xrange(rightOffsets[idx], rightOffsets[idx + 1]):
+                rIdx = rightEdges[e]
+                pos = ends[rIdx]
+                leftEdges[pos] = idx
+                leftKinds[pos] = rightKinds[e]
+                ends[rIdx] = pos + 1
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def getNodeIdx(self, node):
+        return self.nodeIdxs[node]
+
+    def getRightIdxs(self, idx):
+        '''Returns the indexes of the right nodes of node idx, a node linked twice is listed twice.'''
+        return self.rightEdges[self.rightOffsets[idx]:self.rightOffsets[idx + 1]]
+
+    def getLeftIdxs(self, idx):
+        '''Returns the indexes of the left nodes of node idx, a node linked twice is listed twice.'''
+        return self.leftEdges[self.leftOffsets[idx]:self.leftOffsets[idx + 1]]
+
 
 class DepGraph(object):
 
@@ -239,6 +336,7 @@ class DepGraph(object):
         self.selectedTasks = {}
         # self.hasDephts = False
         self.columns = None     # depth columns
+        self.snapshot = None    # GraphSnapshot, dropped on every change
 
     def getNode(self, nodeId):
         node = self.taskDict.get(nodeId)
@@ -278,7 +376,7 @@ class DepGraph(object):
                 assert isinstance(var, list)
                 return var
 
-        self.columns = None
+        self.columns = self.snapshot = None
         targets = lst(targets)
         taskId = name if name else targets[0]
 
@@ -295,6 +393,7 @@ class DepGraph(object):
             for fpath in fpaths:
                 node = self.getFileNode(fpath)
                 setFn(node, taskNode)
+                node._resetCache()
                 res[node.id] = node
             return res
         
@@ -313,6 +412,7 @@ class DepGraph(object):
                 if node.fpath in self.rootFileDict:
                     del self.rootFileDict[node.fpath]
                 appendFn(node, taskNode)
+                node._resetCache()
             return res
         
         addFileDeps(taskNode.fileDeps, lst(fileDeps), appendFileDepOf)
@@ -327,6 +427,7 @@ class DepGraph(object):
                 if node.name in self.rootTaskDict:
                     del self.rootTaskDict[taskName]
                 appendFn(node, taskNode)
+                node._resetCache()
 
         addTaskDeps(taskNode.taskDeps, lst(taskDeps), appendTaskDepOf)
         
@@ -337,6 +438,66 @@ class DepGraph(object):
             node = self.getTaskNode(provTaskName)
             node.providedOf = taskNode
             taskNode.providedTasks.append(node)
+        taskNode._resetCache()
+        return taskNode
+
+    def _updateRoot(self, node):
+        '''Registers or unregisters a node as root by its current links.'''
+        if isinstance(node, FileNode):
+            if node.id not in self.fileDict:
+                return
+            isRoot, rootDict = not node.fileDepOf and not node.dynFileDepOf, self.rootFileDict
+        elif node.name and node.name in self.taskDict:
+            isRoot, rootDict = not node.taskDepOf and not node.getCreatedLeftNodeList(), self.rootTaskDict
+        else:
+            return
+        key = node.id if isinstance(node, FileNode) else node.name
+        if isRoot:
+            rootDict[key] = node
+        elif key in rootDict:
+            del rootDict[key]
+
+    def _detachTask(self, taskNode):
+        '''Unlinks the outputs and the dependencies of taskNode. The nodes depending on the task are kept.'''
+        self.columns = self.snapshot = None
+        for node in taskNode.getCreatedLeftNodeList():
+            node.unlinkRightNode(taskNode.id)
+            if node.floats():
+                self._unregNode(node)
+        depDicts = taskNode.fileDeps, taskNode.dynFileDeps, taskNode.taskDeps
+        for nodeDict in depDicts:
+            for node in nodeDict.values():
+                node.unlinkLeftNode(taskNode.id)
+                if node.floats():
+                    self._unregNode(node)
+                else:
+                    self._updateRoot(node)
+        for nodeDict in taskNode.getCreatedLeftNodeDicts() + depDicts:
+            nodeDict.clear()
+        taskNode._resetCache()
+
+    def findTask(self, taskId):
+        '''Returns the TaskNode of taskId (task name or first target of an unnamed task) or None.'''
+        node = self.taskDict.get(taskId)
+        if node is None:
+            fileNode = self.fileDict.get(taskId)
+            if fileNode is not None and taskId in fileNode.targetOf:
+                node = fileNode.targetOf[taskId]
+        return node
+
+    def updateTask(
+        self, name=None, targets=None, fileDeps=None, dynFileDeps=None,
+        taskDeps=None, generatedFiles=None, providedFiles=None, providedTasks=None):
+        '''Adds the task or replaces its outputs and dependencies in place. The links of the nodes depending on the
+        task are kept. It costs O(number of the old and new links of the task).'''
+        taskId = name if name else targets[0]
+        taskNode = self.findTask(taskId)
+        if taskNode is not None:
+            self._detachTask(taskNode)
+        taskNode = self.addTask(
+            name=name, targets=targets, fileDeps=fileDeps, dynFileDeps=dynFileDeps, taskDeps=taskDeps,
+            generatedFiles=generatedFiles, providedFiles=providedFiles, providedTasks=providedTasks)
+        self._updateRoot(taskNode)
         return taskNode
 
     def removeTask(self, taskNode):
@@ -345,20 +506,15 @@ class DepGraph(object):
             # it may be already removed as it could become floating node at removal of other nodes
             return
         
-        def unlinkLeft(rightNode, leftNodeId): rightNode.unlinkLeftNode(leftNodeId)
-        def unlinkRight(leftNode, rightNodeId): leftNode.unlinkRightNode(rightNodeId)
-        
-        def unlink(nodeList, unlinkerFn):
-            for node in nodeList:
-                unlinkerFn(node, taskNode.id)
-                if node.floats():
-                    self._unregNode(node)
-
-        self.columns = None
-        # unlink targets, generated files, provided files?
-        unlink(taskNode.getLeftNodeList(), unlinkRight)
-        # unlink fileDeps, dynFileDeps, taskDeps
-        unlink(taskNode.getRightNodeList(), unlinkLeft)
+        # unlink targets, generated files, provided files, fileDeps, dynFileDeps, taskDeps
+        self._detachTask(taskNode)
+        # unlink the dependent tasks
+        for node in taskNode.taskDepOf.values():
+            node.unlinkRightNode(taskNode.id)
+            if node.floats():
+                self._unregNode(node)
+        taskNode.taskDepOf.clear()
+        taskNode._resetCache()
         self._unregNode(taskNode)
 
     def getTask(self, targetOrTaskName):
@@ -370,16 +526,21 @@ class DepGraph(object):
                 return target.targetOf.values()[0] if target.targetOf else None
         return task
 
+    def getSnapshot(self):
+        '''Returns the GraphSnapshot of the current links.'''
+        if self.snapshot is None:
+            self.snapshot = GraphSnapshot(self)
+        return self.snapshot
+
     def getAllTasks(self):
-        taskIdDict = self.taskDict.copy()    # {id: TaskNode}
-        for fileNode in self.fileDict.values():
-            for taskNode in fileNode.targetOf.values():   # at most 1 iteration
-                if taskNode.id not in taskIdDict:
-                    taskIdDict[taskNode.id] = taskNode
-        return taskIdDict
-
-    def selectRight(self, targetOrNameList, maxDepth=1024, exclusiveChilds=True, selectTopOutputs=True, leaveLeaves=False):
+        snapshot = self.getSnapshot()
+        nodes = snapshot.nodes
+        return {nodes[idx].id: nodes[idx] for idx, isTask in enumerate(snapshot.isTask) if isTask}  # {id: TaskNode}
+
+    def selectRight(self, targetOrNameList, maxDepth=None, exclusiveChilds=True, selectTopOutputs=True, leaveLeaves=False):
         '''
+        maxDepth:
+            If not None, the nodes farther than maxDepth from the top level nodes are not selected.
         exclusiveChilds:
             If True, only those children are selected (rightNodes) which are not belonging to
             unselected parents (leftNodes)
@@ -388,48 +549,69 @@ class DepGraph(object):
             are selected.
         leaveLeaves:
             Don't select leaf FileNodes.
+        Every selected node is expanded once from a work stack over the GraphSnapshot, so the cost is O(V+E)
+        and deep graphs don't hit the recursion limit.
         Returns: (selectedFiles, selectedTasks)
         '''
-
-        touched = {}    # {nodeId: Node}
-        selectedFiles = {}
-        selectedTasks = {}
-
-        def selectNode(node, depth):
-            
-            def select():
-                selDict = selectedFiles if isinstance(node, FileNode) else selectedTasks
-                nId = node.getId()
-                if nId not in selDict:
-                    selDict[nId] = node
-                    newDepth = depth + 1
-                    for rightNode in node.getRightNodeList():
-                        selectNode(rightNode, newDepth)
-                        # If rightNode is a TaskNode via taskDep, all of its targets have to be selected.
-                        if isinstance(rightNode, TaskNode) and isinstance(node, TaskNode):
-                            # rightNode is a task dependency
-                            for trgNode in rightNode.targets.values():
-                                selectNode(trgNode, depth)
-        
+        snapshot = self.getSnapshot()
+        nodes, isTask = snapshot.nodes, snapshot.isTask
+        rightOffsets, rightEdges = snapshot.rightOffsets, snapshot.rightEdges
+        leftOffsets, leftEdges, leftKinds = snapshot.leftOffsets, snapshot.leftEdges, snapshot.leftKinds
+        selected = bytearray(len(nodes))
+        selectedIdxs = []
+        selectCnts = {}     # {node index: number of references from selected nodes}
+        leftCnts = {}       # {node index: number of distinct left nodes}
+        stack = []          # [(node index, depth)] selected, not expanded nodes
+
+        def select(idx, depth):
+            if not selected[idx]:
+                selected[idx] = 1
+                selectedIdxs.append(idx)
+                stack.append((idx, depth))
+
+        def getLeftNodeCount(idx):
+            cnt = leftCnts.get(idx)
+            if cnt is None:
+                cnt = leftCnts[idx] = len(set(leftEdges[leftOffsets[idx]:leftOffsets[idx + 1]]))
+            return cnt
+
+        def selectNode(idx, depth):
             if depth == 0:
-                select()
+                select(idx, depth)
                 return
-            if depth >= maxDepth:
+            if maxDepth is not None and depth >= maxDepth:
                 return
-            if leaveLeaves and node.getRightNodeCount() == 0 and isinstance(node, FileNode):
+            if leaveLeaves and not isTask[idx] and rightOffsets[idx] == rightOffsets[idx + 1]:
                 return
-            if node.selectCnt == 0:
-                touched[node.getId()] = node
-            node.selectCnt += 1
+            selectCnt = selectCnts.get(idx, 0) + 1
+            selectCnts[idx] = selectCnt
             if exclusiveChilds:
                 # select child only if all of its parents are selected
-                if node.selectCnt >= node.getLeftNodeCount():
+                if selectCnt >= getLeftNodeCount(idx):
                     # selectCnt can be greater than leftNodeCount. When node is a task target, it may not be referred
                     # directly, but its task may be referred by its name.
-                    select()
+                    select(idx, depth)
             else:
                 # select child anyway
-                select()
+                select(idx, depth)
+
+        def selectTopNode(idx):
+            '''The selection of a top level node is completed before the next one. A top level node which is
+            already selected via an other top level node is not expanded again at depth 0, so the targets of
+            its task dependencies are selected only if all of their parents are selected.'''
+            selectNode(idx, 0)
+            while stack:
+                idx, depth = stack.pop()
+                newDepth = depth + 1
+                rightIdxs = rightEdges[rightOffsets[idx]:rightOffsets[idx + 1]]
+                for rIdx in (set(rightIdxs) if len(rightIdxs) > 1 else rightIdxs):
+                    selectNode(rIdx, newDepth)
+                    # If rightNode is a TaskNode via taskDep, all of its targets have to be selected.
+                    if isTask[rIdx] and isTask[idx]:
+                        # rightNode is a task dependency
+                        for e in xrange(leftOffsets[rIdx], leftOffsets[rIdx + 1]):
+                            if leftKinds[e] == EdgeKind.Target:
+                                selectNode(leftEdges[e], depth)
 
         topTasks = []
         for targetOrName in targetOrNameList:
@@ -437,20 +619,23 @@ class DepGraph(object):
             if node is None:
                 node = self.fileDict.get(targetOrName)
             if node is not None:
-                if selectTopOutputs and isinstance(node, TaskNode):
-                    topTasks.append(node)
-                selectNode(node, 0)
+                idx = snapshot.nodeIdxs[node]
+                if selectTopOutputs and isTask[idx]:
+                    topTasks.append(idx)
+                selectTopNode(idx)
             else:
                 pass    # TODO error handling if needed
         
-        # selectTopOutputs
-        for taskNode in topTasks:
-            for leftNode in taskNode.getCreatedLeftNodeList():
-                selectNode(leftNode, 0)
-
-        # clean selectCnt
-        for node in touched.values():
-            node.selectCnt = 0
+        # selectTopOutputs: the created left nodes are every left node except the dependent tasks
+        for idx in topTasks:
+            for e in xrange(leftOffsets[idx], leftOffsets[idx + 1]):
+                if leftKinds[e] != EdgeKind.TaskDep:
+                    selectTopNode(leftEdges[e])
+        selectedFiles = {}
+        selectedTasks = {}
+        for idx in selectedIdxs:
+            node = nodes[idx]
+            (selectedTasks if isTask[idx] else selectedFiles)[node.id] = node
         return selectedFiles, selectedTasks
 
     def calcDepths(self, topLeafGenerated=False):
@@ -458,65 +643,77 @@ class DepGraph(object):
         topLeafGenerated:
             If True, the unreferenced generated and provided Nodes will be considered
             as top level nodes.
+        The nodes are visited in topological order (Kahn's algorithm) over the GraphSnapshot, every node and edge
+        only once.
         ''' 
-        def adjustDepthToRightNodes(allNodes, needToCheckFn):
-            changed = False
-            for node in allNodes:
-                if needToCheckFn(node):
-                    lowestHighDepth = node.depth.higher - 1
-                    for rNode in node.getRightNodeList():
-                        if rNode.depth.higher < lowestHighDepth:
-                            lowestHighDepth = rNode.depth.higher
-                            changed = True
-                    if changed:
-                        node.depth.higher = lowestHighDepth
-            return changed
-
         if self.columns is not None:    # TODO: consider topLefGenerated here
             return
-        depth = 0
-        nodes = self.rootFileDict.values() + self.rootTaskDict.values()
-        allNodes = []
-        while len(nodes) > 0:
-            rightFileDict, rightTaskDict = {}, {}
-            for node in nodes:
-                allNodes.append(node)
-                node.depth.set(depth)
-                for rnDict in node.getRightNodeDicts():
-                    for nId, node in rnDict.items():
-                        nDict = rightFileDict if isinstance(node, FileNode) else rightTaskDict
-                        nDict[nId] = node
-            depth += 1
-            nodes = rightFileDict.values() + rightTaskDict.values()
-        # 1. place generated files next to generator (TODO: handle providedTasks)
-        # 2. place tasks of generated files (Task.fDep == generated file) to the lowest high-depth of its fileDeps
-        # 3. place provided files to the lowest-high depth top of its right nodes
-        # repeat while no change happens
-        changed = not topLeafGenerated
-        while changed:
-            changed = False
-            # 1. place generated files next to generator  (TODO: handle providedTasks)
-            for node in allNodes:
-                if isinstance(node, FileNode):
-                    genTask = node.getGeneratorTask()
-                    if genTask:
-                        neededDepth = genTask.depth.higher - 1
-                        if node.depth.higher < neededDepth:
-                            node.depth.higher = neededDepth
-                            changed = True
+        snapshot = self.getSnapshot()
+        nodes, isTask, numRoots, numReached = snapshot.nodes, snapshot.isTask, snapshot.numRoots, snapshot.numReached
+        offsets, edges, kinds = snapshot.rightOffsets, snapshot.rightEdges, snapshot.rightKinds
+        # count the left nodes of the nodes reachable from the roots, they are numbered before the others
+        leftCnts = [0] * numReached
+        for rIdx in edges[:offsets[numReached]]:
+            leftCnts[rIdx] += 1
+        # lower depth: shortest path from the roots, higher depth: longest path from the roots
+        # a higher depth of 0 marks the non root nodes which are not reached by Kahn's algorithm (cycles)
+        lowers, highers = [numReached] * numReached, [0] * numReached
+        for idx in xrange(numRoots):
+            lowers[idx] = 0
+        order, ready = [], range(numRoots)
+        while ready:
+            idx = ready.pop()
+            order.append(idx)
+            lower, higher = lowers[idx] + 1, highers[idx] + 1
+            for e in xrange(offsets[idx], offsets[idx + 1]):
+                rIdx = edges[e]
+                if lower < lowers[rIdx]:
+                    lowers[rIdx] = lower
+                if higher > highers[rIdx]:
+                    highers[rIdx] = higher
+                cnt = leftCnts[rIdx] - 1
+                leftCnts[rIdx] = cnt
+                if cnt == 0:
+                    ready.append(rIdx)
+        numOfColumns = max(highers[idx] for idx in order) + 1 if order else 0
+        if not topLeafGenerated:
+
+            def pullToRightNodes(idx):
+                lowestHighDepth = min(highers[edges[e]] for e in xrange(offsets[idx], offsets[idx + 1]))
+                if lowestHighDepth < highers[idx] - 1:
+                    highers[idx] = lowestHighDepth
+
+            def getGeneratorTask(idx):
+                for e in xrange(offsets[idx], offsets[idx + 1]):
+                    if kinds[e] == EdgeKind.Generated:
+                        return edges[e]
+                return None
+
+            generated = bytearray(getGeneratorTask(idx) is not None for idx in xrange(numReached))
+            # The right nodes are placed before their left nodes in reverse topological order.
+            # 1. place generated files next to generator (TODO: handle providedTasks)
             # 2. place tasks of generated files (Task.fDep == generated file) to the lowest high-depth of its rightNodes
-            def dependsOnGeneratedFile(node):
-                return isinstance(node, TaskNode) and node.dependsOnGeneratedFile()
-            changed |= adjustDepthToRightNodes(allNodes, dependsOnGeneratedFile)
             # 3. place provided files to the lowest-high depth top of its right nodes          
-            def isProvidedFile(node):
-                return isinstance(node, FileNode) and node.isProvidedFile()
-            changed |= adjustDepthToRightNodes(allNodes, isProvidedFile)
-        
-        columns = [{} for _ in range(depth)]
-        for n in allNodes:
-            columns[n.depth.higher][n.id] = n    
-        self.columns = [nodeDict.values() for nodeDict in columns]
+            for idx in reversed(order):
+                edgeRange = xrange(offsets[idx], offsets[idx + 1])
+                if not isTask[idx]:
+                    if generated[idx]:
+                        neededDepth = highers[getGeneratorTask(idx)] - 1
+                        if highers[idx] < neededDepth:
+                            highers[idx] = neededDepth
+                    if any(kinds[e] == EdgeKind.Provided for e in edgeRange):
+                        pullToRightNodes(idx)
+                elif any(kinds[e] in (EdgeKind.FileDep, EdgeKind.DynFileDep) and generated[edges[e]] for e in edgeRange):
+                    pullToRightNodes(idx)
+        for idx in xrange(numReached):
+            depth = nodes[idx].depth
+            if idx < numRoots or highers[idx]:
+                depth.lower, depth.higher = lowers[idx], highers[idx]
+            else:
+                depth.reset()
+        self.columns = [[] for _ in range(numOfColumns)]
+        for idx in order:
+            self.columns[highers[idx]].append(nodes[idx])
 
     def _unregFile(self, fpath):
         # TODO: better function name (maybe some LUT class instead of the 2 dicts)
@@ -0,0 +1,112 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import cPickle as pickle
+import traceback
+from multiprocessing import Pool
+from callbacks import alwaysUpToDate, notUpToDate, targetUpToDate, targetUpToDateHash, targetUpToDateTimeStamp
+from console import logger
+from fs import StatCache
+from task import CheckType
+
+# These callbacks work on the Builder's state (e.g. HashDict), they have to run in the build process.
+localCallbacks = set([alwaysUpToDate, notUpToDate, targetUpToDate, targetUpToDateHash, targetUpToDateTimeStamp])
+
+
+class ThreadExecutor(object):
+    '''Runs the task callbacks in the worker thread. This is the default executor.'''
+
+    def start(self, numWorkers):
+        pass
+
+    def stop(self):
+        pass
+
+    def runCallback(self, bldr, task, cbTuple):
+        return task._runCallback(cbTuple, bldr)
+
+
+class RemoteBuilder(object):
+    '''Minimal Builder replacement passed to the callbacks running in a worker process.'''
+
+    def __init__(self, bldr):
+        self.fs = bldr.fs
+        self.statCache = None   # created in the worker process, see _runRemoteCallback()
+        self.pathFormer = bldr.pathFormer
+        self.hashCheck = bldr.hashCheck
+        self.printUpToDate, self.printInfo = bldr.printUpToDate, bldr.printInfo
+
+    def needsHashCheck(self, task):
+        return self.hashCheck if task.checkType is None else task.checkType == CheckType.Hash
+
+    def encodePath(self, fpath):
+        return self.pathFormer.encode(fpath)
+
+
+def _runRemoteCallback(jobData):
+    '''Runs in the worker process. Returns the callback's result and the task fields
+    which can be modified by the callback.'''
+    cb, kwargs, bldr, task = pickle.loads(jobData)
+    bldr.statCache = StatCache(bldr.fs)  # inactive, it doesn't cache
+    try:
+        res = cb(bldr, task, **kwargs)
+    except:
+        traceback.print_exc()
+        raise
+    return res, task.generatedFiles, task.providedFiles, task.providedTasks, task.garbageDirs, task.meta
+
+
+class ProcessExecutor(object):
+    '''Runs the upToDate and action callbacks in a multiprocessing.Pool to bypass the GIL.
+    The callbacks, their kwargs, the task data and the FS have to be picklable. Tasks which
+    don't fulfill it, are executed in the worker thread like in case of ThreadExecutor.'''
+
+    def __init__(self, processes=None):
+        '''processes: number of worker processes, default is the number of Builder workers.'''
+        self.processes = processes
+        self.pool = None
+
+    def start(self, numWorkers):
+        self.pool = Pool(self.processes if self.processes else numWorkers)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def _pickleJob(self, bldr, task, cbTuple):
+        '''Returns None if the job cannot be passed to an other process.'''
+        cb, kwargs = cbTuple
+        if cb in localCallbacks:
+            return None
+        try:
+            return pickle.dumps((cb, kwargs, RemoteBuilder(bldr), task._getRemoteCopy()), pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.debugf("{} runs locally: {}", task.getId(), e)
+            return None
+
+    def runCallback(self, bldr, task, cbTuple):
+        jobData = self._pickleJob(bldr, task, cbTuple)
+        if jobData is None:
+            return task._runCallback(cbTuple, bldr)
+        res, task.generatedFiles, task.providedFiles, task.providedTasks, task.garbageDirs, task.meta = \
+            self.pool.apply(_runRemoteCallback, (jobData,))
+        return res
@@ -19,10 +19,21 @@
 # SOFTWARE.
 
 import os
+import stat
+import weakref
+import threading
 # from threading import RLock
 from multiprocessing import RLock
+from multiprocessing.pool import ThreadPool
 from shutil import copyfile
 from console import logger
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir     # pip install scandir
+    except ImportError:
+        scandir = None
 
 
 def joinPath(*ents):
@@ -82,6 +93,139 @@ def changeDirAndExt(fpath, newDir, newExt):
     return joinPath(newDir, name + '.' + newExt)
 
 
+class Stat(object):
+    '''File metadata used for change detection.'''
+
+    def __init__(self, size, mtimeNs, ino, isDir=False):
+        self.size, self.mtimeNs, self.ino, self.isDir = size, mtimeNs, ino, isDir
+
+    def __repr__(self):
+        return 'Stat(size={}, mtimeNs={}, ino={}, isDir={})'.format(self.size, self.mtimeNs, self.ino, self.isDir)
+
+    def isFile(self):
+        return not self.isDir
+
+    def getSig(self):
+        '''Returns the stat signature: [size, mtimeNs, ino]'''
+        return [self.size, self.mtimeNs, self.ino]
+
+
+def mtimeNs(st):
+    '''Returns the modification time of an os.stat() result in nanoseconds.'''
+    res = getattr(st, 'st_mtime_ns', None)
+    return int(st.st_mtime * 1000000000) if res is None else res
+
+
+# StatCaches of the running builds, they are notified about the changes made through FS
+activeStatCaches = weakref.WeakSet()
+
+
+class StatCache(object):
+    '''Memoizes FS.stat() results during a build. An entry is invalidated when its path is changed
+       through the FS or when an action producing it completes. When it is not active it only passes
+       the calls to the FS.'''
+
+    # When at least this many paths of a directory are requested at once, the whole directory
+    # is read by one FS.scanDir() instead of stat-ing the paths one by one. Only if the FS gets the
+    # metadata with the listing (FS.scanDirHasStats), otherwise the scan would stat every entry.
+    ScanBatch = 16
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.lock = threading.Lock()
+        self.cache = {}     # {fpath: Stat or None}
+        self.active = False
+        self.scanBatch = StatCache.ScanBatch
+
+    def activate(self):
+        with self.lock:
+            self.active = True
+        activeStatCaches.add(self)
+
+    def deactivate(self):
+        activeStatCaches.discard(self)
+        with self.lock:
+            self.active = False
+            self.cache.clear()
+
+    def invalidate(self, fpaths):
+        with self.lock:
+            for fpath in fpaths:
+                self.cache.pop(fpath, None)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def stat(self, fpath):
+        return self.statMany([fpath])[0]
+
+    def statMany(self, fpaths):
+        '''Returns a list of Stat (None for non-existing path) in the order of fpaths.'''
+        with self.lock:
+            if not self.active:
+                res, missing = [None] * len(fpaths), range(len(fpaths))
+            else:
+                res, missing = [], []
+                for i, fpath in enumerate(fpaths):
+                    st = self.cache.get(fpath, self)    # self: not cached
+                    if st is self:
+                        missing.append(i)
+                        st = None
+                    res.append(st)
+        if missing:
+            scanned = {}
+            if len(missing) >= self.scanBatch and self.fs.scanDirHasStats:
+                scanned = self._scan([fpaths[i] for i in missing])
+            missing = [i for i in missing if fpaths[i] not in scanned]
+            stats = self.fs.statMany([fpaths[i] for i in missing])
+            for i, st in zip(missing, stats):
+                res[i] = st
+            for i, fpath in enumerate(fpaths):
+                if fpath in scanned:
+                    res[i] = scanned[fpath]
+            with self.lock:
+                if self.active:
+                    for i, st in zip(missing, stats):
+                        self.cache[fpaths[i]] = st
+                    self.cache.update(scanned)
+        return res
+
+    def _scan(self, fpaths):
+        '''Groups fpaths by directory and scans the directories having at least scanBatch of them.
+           Returns {fpath: Stat or None} for the paths of the scanned directories. A name which is not
+           listed in an existing directory is left out, the FS may still find it (e.g. by other casing).'''
+        dirPaths = {}   # {dpath: [fpath]}
+        for fpath in fpaths:
+            dirPaths.setdefault(os.path.dirname(fpath), []).append(fpath)
+        res = {}
+        for dpath, dFPaths in dirPaths.items():
+            if len(dFPaths) < self.scanBatch:
+                continue
+            entries = self.fs.scanDir(dpath or '.')
+            if entries is None:
+                for fpath in dFPaths:
+                    res[fpath] = None
+                continue
+            nameStats = dict(entries)
+            for fpath in dFPaths:
+                st = nameStats.get(os.path.basename(fpath))
+                if st is not None:
+                    res[fpath] = st
+        return res
+
+    def exists(self, fpath):
+        return self.stat(fpath) is not None
+
+    def isfile(self, fpath):
+        st = self.stat(fpath)
+        return st is not None and not st.isDir
+
+    def isdir(self, fpath):
+        st = self.stat(fpath)
+        return st is not None and st.isDir
+
+
 '''This is a wrapper over the filesystem. It makes possible to map other kind of resources
    as FS resources. It is also comfortable for mocking.'''
 class FS(object):
@@ -89,6 +233,10 @@ class FS(object):
     '''It is not instance member, since that cannot be passed to other process on Windows.'''
     lock = RLock()
 
+    # scanDir() gets the metadata with the directory listing only by scandir on Windows,
+    # elsewhere it stats every entry
+    scanDirHasStats = scandir is not None and os.name == 'nt'
+
     def __init__(self):
         pass
         # TODO: context based locking
@@ -119,12 +267,77 @@ class FS(object):
     def exists(self, fpath):
         return os.path.exists(fpath)
 
+    def stat(self, fpath):
+        '''Returns Stat or None when fpath doesn't exist.'''
+        try:
+            st = os.stat(fpath)
+        except OSError:
+            return None
+        return Stat(st.st_size, mtimeNs(st), st.st_ino, stat.S_ISDIR(st.st_mode))
+
+    def statMany(self, fpaths):
+        '''Returns a list of Stat (None for non-existing path) in the order of fpaths.'''
+        return [self.stat(fpath) for fpath in fpaths]
+
+    def _changed(self, fpath):
+        '''Has to be called by the modifying methods, it invalidates fpath in the active StatCaches.'''
+        for statCache in list(activeStatCaches):
+            statCache.invalidate([fpath])
+
     def open(self, fpath, mode='r'):
+        if 'w' in mode or 'a' in mode:
+            self._changed(fpath)
         return open(fpath, mode)
 
     def copy(self, spath, dpath):
+        self._changed(dpath)
         copyfile(spath, dpath)
 
+    def scanDir(self, dpath):
+        '''Returns [(name, Stat)] of the directory entries or None if dpath is not a directory.
+           With scandir the metadata comes with the directory listing where the platform supports it,
+           see scanDirHasStats.'''
+        res = []
+        try:
+            if scandir is not None:
+                for ent in scandir(dpath):
+                    try:
+                        st = ent.stat()
+                    except OSError:
+                        continue    # removed meanwhile
+                    res.append((ent.name, Stat(st.st_size, mtimeNs(st), st.st_ino, stat.S_ISDIR(st.st_mode))))
+            else:
+                for name in os.listdir(dpath):
+                    st = self.stat(os.path.join(dpath, name))
+                    if st is not None:
+                        res.append((name, st))
+        except OSError:
+            return None
+        return res
+
+    def scanDirTypes(self, dpath, names=None):
+        '''Returns [(name, isDir)] of the directory entries or None if dpath is not a directory. isDir is None
+           for an entry which is neither a file nor a directory (e.g. a broken link). With scandir the types
+           come with the listing (d_type), otherwise the entries are stat-ed.
+           names: only the types of these entries are needed, the others get None without a stat.'''
+        res = []
+        try:
+            if scandir is not None:
+                for ent in scandir(dpath):
+                    res.append((ent.name, True if ent.is_dir() else False if ent.is_file() else None))
+            else:
+                for name in os.listdir(dpath):
+                    fpath = os.path.join(dpath, name)
+                    if names is not None and name not in names:
+                        res.append((name, None))
+                    elif os.path.isfile(fpath):
+                        res.append((name, False))
+                    else:
+                        res.append((name, True if os.path.isdir(fpath) else None))
+        except OSError:
+            return None
+        return res
+
     def listdir(self, dpath, dontFail=False):
         try:
             if dontFail:
@@ -136,29 +349,49 @@ class FS(object):
             print 'dpath={}'.format(dpath)
             raise
 
+    def rename(self, spath, dpath):
+        '''Renames spath to dpath, an existing dpath is replaced.'''
+        self._changed(spath)
+        self._changed(dpath)
+        if os.name == 'nt' and os.path.exists(dpath):
+            os.remove(dpath)
+        os.rename(spath, dpath)
+
+    def isLocal(self):
+        '''Returns True when the paths are paths of the local file system, so they can be passed
+           to other libraries (e.g. sqlite3). FS implementations mapping other resources return False.'''
+        return True
+
     def remove(self, fpath):
+        self._changed(fpath)
         os.remove(fpath)
 
     def rmdir(self, dpath):
+        self._changed(dpath)
         os.rmdir(dpath)
 
     def cleandir(self, dpath, rmRoot=False):
         with FS.lock:
-            if self.isdir(dpath):
-                for f in self.listdir(dpath):
-                    fpath = joinPath(dpath, f)
-                    if self.isfile(fpath):
-                        self.remove(fpath)
-                    elif self.isdir(fpath):
+            entries = self.scanDirTypes(dpath)
+            if entries is not None:
+                for name, isDir in entries:
+                    fpath = joinPath(dpath, name)
+                    if isDir:
                         self.cleandir(fpath, rmRoot=True)
                     else:
-                        assert False, "Cannot remove entity: {}".format(fpath)
+                        self.remove(fpath)
                 if rmRoot:
                     self.rmdir(dpath)
 
     def mkdirs(self, dpath):
         with FS.lock:
             if not self.exists(dpath):
+                # the missing parents are created too
+                path = dpath
+                while path and not self.exists(path):
+                    self._changed(path)
+                    parent = os.path.dirname(path)
+                    path = parent if parent != path else None
                 os.makedirs(dpath)
 
     def dirname(self, fpath):
@@ -204,13 +437,31 @@ class DirEnt(object):
         self.files = set()
 
 
+class CleanDir(object):
+    '''A directory visited by the Cleaner.'''
+
+    __slots__ = ('path', 'dirEnt', 'numOfEntries', 'subDirs', 'removed', 'removedDirs', 'removedFiles')
+
+    def __init__(self, path, dirEnt):
+        self.path = path
+        self.dirEnt = dirEnt        # None for the sub directories of a purged directory
+        self.numOfEntries = None    # None if the directory doesn't exist
+        self.subDirs = []           # [CleanDir]
+        self.removed = False
+        self.removedDirs, self.removedFiles = [], []
+
+    def isPurged(self):
+        return self.dirEnt is None or self.dirEnt.toPurge
+
+
 class Cleaner(object):
     '''It accepts a list of removable paths, removes the paths
     and their empty parent directories.'''
 
-    def __init__(self, fs, absPaths=[], absDirPaths=[]):
+    def __init__(self, fs, absPaths=[], absDirPaths=[], workers=1):
         # print 'files:{}\ndirs:{}'.format(absPaths, absDirPaths)
         self.fs = fs
+        self.workers = workers
         self.root = DirEnt()
         for adp in absDirPaths:
             self.addDir(adp)
@@ -225,6 +476,7 @@ class Cleaner(object):
             subDir = DirEnt(toPurge)
             curDir.folders[subDirName] = subDir
         elif toPurge:
+            subDir.toPurge = True
             subDir.folders.clear()
             subDir.files.clear()
         return subDir
@@ -245,48 +497,88 @@ class Cleaner(object):
             curDir = Cleaner._addSubDir(curDir, ent, toPurge=False)
         curDir.files.add(ents[-1])
 
-    def clean(self):
-        '''Returns ([removedDirs], [removedFiles])'''
-        def cleanDir(dirPath, dirEnt):
-            '''Returns (isEmpty, [removedDirs], [removedFiles])'''
-            logger.debugf('dirPath={}', dirPath)
-            if dirEnt.toPurge:
-                self.fs.cleandir(dirPath)
-                return True, [dirPath], []
-            removedDirs, removedFiles = [], []
-            for f in dirEnt.files:
-                fpath = self.fs.joinPath(dirPath, f)
-                if self.fs.isfile(fpath):   # FIXME: assert?
-                    # logger.debugf('remove: {}', fpath)
-                    self.fs.remove(fpath)
-                    removedFiles.append(fpath)
-            for dname, dent in dirEnt.folders.items():
-                subPath = self.fs.joinPath(dirPath, dname)
-                isEmpty, subRemovedDirs, subRemovedFiles = cleanDir(subPath, dent)
-                # print "isEmpty:{}, subRemovedDirs:{}, subRemovedFiles:{} = cleanDir(subPath:{}, dent:{})".format(
-                #    isEmpty, subRemovedDirs, subRemovedFiles, subPath, dent)
-                if isEmpty:
-                    if self.fs.isdir(subPath):
-                        logger.debugf('rmdir: {}', subPath)
-                        self.fs.rmdir(subPath)
-                        removedDirs.append(subPath)
+    def _cleanDir(self, cleanDir):
+        '''Removes the files of a directory by one scan. Returns the sub directories to visit.
+        Only the entry types are read, in a not purged directory only the types of the paths to clean.'''
+        logger.debugf('dirPath={}', cleanDir.path)
+        purged = cleanDir.isPurged()
+        names = None if purged else cleanDir.dirEnt.files.union(cleanDir.dirEnt.folders)
+        entries = self.fs.scanDirTypes(cleanDir.path, names)
+        if entries is None:
+            return []
+        cleanDir.numOfEntries = len(entries)
+        if purged:
+            for name, isDir in entries:
+                fpath = self.fs.joinPath(cleanDir.path, name)
+                if isDir:
+                    cleanDir.subDirs.append(CleanDir(fpath, None))
                 else:
-                    removedDirs += subRemovedDirs
-                    removedFiles += subRemovedFiles
-            # logger.debugf('dirPath:{} entries:{}', dirPath, len(self.fs.listdir(dirPath)))
-            return len(self.fs.listdir(dirPath, dontFail=True)) == 0, removedDirs, removedFiles
+                    self.fs.remove(fpath)
+                    cleanDir.removedFiles.append(fpath)
+        else:
+            types = dict(entries)
+            for f in cleanDir.dirEnt.files:
+                if types.get(f) is False:
+                    fpath = self.fs.joinPath(cleanDir.path, f)
+                    self.fs.remove(fpath)
+                    cleanDir.removedFiles.append(fpath)
+            for dname, dent in cleanDir.dirEnt.folders.items():
+                if types.get(dname):
+                    cleanDir.subDirs.append(CleanDir(self.fs.joinPath(cleanDir.path, dname), dent))
+        return cleanDir.subDirs
 
+    def _rmdir(self, cleanDir):
+        logger.debugf('rmdir: {}', cleanDir.path)
+        self.fs.rmdir(cleanDir.path)
+
+    def clean(self):
+        '''Returns ([removedDirs], [removedFiles])
+        Every directory is scanned once, the directories of a tree level are cleaned concurrently.
+        A directory is empty when all of its scanned entries are removed, it is not listed again.'''
+        pool = ThreadPool(self.workers) if self.workers > 1 else None
+
+        def mapDirs(fn, cleanDirs):
+            if pool is not None and len(cleanDirs) > 1:
+                return pool.map(fn, cleanDirs)
+            return map(fn, cleanDirs)
+
+        try:
+            # 1. remove the files level by level
+            level = [CleanDir(dirName, dirEnt) for dirName, dirEnt in self.root.folders.items()]
+            levels = []
+            while level:
+                levels.append(level)
+                level = [subDir for subDirs in mapDirs(self._cleanDir, level) for subDir in subDirs]
+            # 2. remove the emptied directories bottom-up
+            for level in reversed(levels):
+                emptyDirs = []
+                for cleanDir in level:
+                    if cleanDir.numOfEntries is None:
+                        continue
+                    numOfRemoved = len(cleanDir.removedFiles)
+                    for subDir in cleanDir.subDirs:
+                        if subDir.removed:
+                            numOfRemoved += 1
+                            cleanDir.removedDirs.append(subDir.path)
+                        else:
+                            cleanDir.removedDirs += subDir.removedDirs
+                            cleanDir.removedFiles += subDir.removedFiles
+                    if numOfRemoved == cleanDir.numOfEntries:
+                        emptyDirs.append(cleanDir)
+                mapDirs(self._rmdir, emptyDirs)
+                for cleanDir in emptyDirs:
+                    cleanDir.removed = True
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
         removedDirs, removedFiles = [], []
-        for dirName, dirEnt in self.root.folders.items():
-            removeDir, rDirs, rFiles = cleanDir(dirName, dirEnt)
-            # print "removeDir:{}, rDirs:{}, rFiles:{} = cleanDir(dirName:{}, dirEnt:{})".format(
-            #    removeDir, rDirs, rFiles, dirName, dirEnt)
-            if removeDir:
-                self.fs.rmdir(dirName)
-                removedDirs.append(dirName)
+        for cleanDir in levels[0] if levels else []:
+            if cleanDir.removed:
+                removedDirs.append(cleanDir.path)
             else:
-                removedDirs += rDirs
-                removedFiles += rFiles
+                removedDirs += cleanDir.removedDirs
+                removedFiles += cleanDir.removedFiles
         return removedDirs, removedFiles
 
 if __name__ == '__main__':
@@ -18,31 +18,64 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import time
 import hashlib
 import logging
-from threading import RLock
-from collections import defaultdict
+from threading import RLock, Event
+from multiprocessing.pool import ThreadPool
 from console import getLoggerAdapter
+from pathtable import PathTable, PathMap
 
 logger = getLoggerAdapter('xbuild.hash')
 logger.setLevel(logging.DEBUG)
 
+HashAlgos = ('md5', 'sha1', 'blake2b')
+DefaultHashAlgo = 'md5'
+ChunkSize = 1 << 16  # files are hashed by chunks of this size
+# A stat signature is trusted only when the file's mtime is older than the hashing start by this
+# amount. Otherwise a modification in the same timestamp tick could go unnoticed (racy timestamp).
+RacyWindowNs = 2 * 1000000000
+HashWorkers = 4  # size of the I/O pool used by HashDict.hashFiles()
+
+
+def nowNs():
+    return int(time.time() * 1000000000)
+
+
+def checkHashAlgo(algo):
+    if algo not in HashAlgos:
+        raise ValueError("Unknown hash algorithm '{}'! Supported: {}".format(algo, ', '.join(HashAlgos)))
+    try:
+        hashlib.new(algo)
+    except ValueError:
+        raise ValueError("Hash algorithm '{}' is not supported by this Python!".format(algo))
+
+
 class HashEnt(object):
 
     @staticmethod
-    def calcHash(content):
-        return hashlib.md5(content).hexdigest()
+    def calcHash(content, algo=DefaultHashAlgo):
+        return hashlib.new(algo, content).hexdigest()
 
     @staticmethod
     def _loadJsonObj(jsonObj, warnfFn):
+        # The entry is either a digest or [digest, size, mtimeNs, inode].
+        if type(jsonObj) is list:
+            if len(jsonObj) != 4 or type(jsonObj[0]) not in (str, unicode):
+                warnfFn("HashEnt._loadJsonObj(): [hash, size, mtimeNs, inode] entry expected! Got: {}", jsonObj)
+                return None
+            return HashEnt(old=str(jsonObj[0]), new=None, oldSig=jsonObj[1:])
         if type(jsonObj) not in (str, unicode):
             warnfFn("HashEnt._loadJsonObj(): str entry expected! Got: {}", type(jsonObj))
             return None
         return HashEnt(old=str(jsonObj), new=None)
     
-    def __init__(self, old=None, new=None):
+    def __init__(self, old=None, new=None, oldSig=None):
         self.old, self.new = old, new
+        # stat signatures ([size, mtimeNs, inode]) belonging to the digests, None if unknown or racy
+        self.oldSig, self.newSig = oldSig, None
         self.lock = RLock()
+        self.storedObj = self._toJsonObj()     # the last saved state, see HashDict._popChanges()
 
     def __repr__(self):
         return 'HashEnt:(old={}, new={})'.format(self.old, self.new)
@@ -50,28 +83,72 @@ class HashEnt(object):
     def matches(self):
         return False if self.old is None else self.old == self.new
 
-    def setByContent(self, content):
-        self.new = HashEnt.calcHash(content)
+    def setByContent(self, content, algo=DefaultHashAlgo):
+        self.new = HashEnt.calcHash(content, algo)
+        self.newSig = None
 
-    def setByFile(self, fs, fpath):
+    def setByFile(self, fs, fpath, algo=DefaultHashAlgo, racyWindowNs=RacyWindowNs, stat=None):
+        '''The file is read by chunks, the whole content is never in the memory.
+           The known digest is reused when the file's stat signature didn't change.
+           stat: the file's Stat if it is already known'''
         # needDebug = fpath.endswith('clang/module_emb/GROUPED_002_FrTp_MT_AddressRange_PB/FrTp_TestUtils.o')
         needDebug = False
-        if not fs.isfile(fpath):
+        if stat is None:
+            stat = fs.stat(fpath)
+        if stat is None or stat.isDir:
             logger.cdebugf(needDebug, '{} does not exist!', fpath)
             return
-        with fs.open(fpath) as f:
-            return self.setByContent(f.read())
+        sig = stat.getSig()
+        known, knownSig = (self.new, self.newSig) if self.new else (self.old, self.oldSig)
+        if known and knownSig == sig:
+            logger.cdebugf(needDebug, '{} stat matches, digest is reused', fpath)
+            self.new, self.newSig = known, knownSig
+            return
+        hashStart = nowNs()
+        hasher = hashlib.new(algo)
+        with fs.open(fpath, 'rb') as f:
+            while True:
+                chunk = f.read(ChunkSize)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        self.new = hasher.hexdigest()
+        self.newSig = sig if stat.mtimeNs < hashStart - racyWindowNs else None
 
     def _toJsonObj(self):
-        return self.new if self.new else self.old
+        with self.lock:
+            digest, sig = (self.new, self.newSig) if self.new else (self.old, self.oldSig)
+        return [digest] + sig if digest and sig else digest
         
 
+class Pending(object):
+    '''A file being hashed on the I/O pool. All the requesters of the file wait for it.'''
+
+    def __init__(self):
+        # AsyncResult of Python 2 wakes up only one waiter, an Event wakes up all of them
+        self.event = Event()
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error:
+            raise self.error
+
+
 class HashDict(object):
 
 
-    def __init__(self):
+    def __init__(self, algo=DefaultHashAlgo, workers=HashWorkers, pathTable=None):
+        checkHashAlgo(algo)
+        self.algo = algo
+        self.racyWindowNs = RacyWindowNs
+        self.workers = workers
         self.lock = RLock()
-        self.nameHashDict = defaultdict(HashEnt)
+        self.nameHashDict = PathMap(PathTable() if pathTable is None else pathTable)  # {name: HashEnt}
+        self.loader = None      # loads a stored entry on demand: loader(name) -> JSON object or None
+        self.pool = None        # created on first use
+        self.inFlight = {}      # {fpath: Pending}
+        self.removedAll, self.removedNames = False, set()  # removals since the last save
 
     def _loadJsonObj(self, jsonObj, warnfFn):
         if type(jsonObj) is not dict:
@@ -88,38 +165,143 @@ class HashDict(object):
         return False if warns else True
     
     def _toJsonObj(self):
-        return {name: hashEnt._toJsonObj() for name, hashEnt in self.nameHashDict.items()}
+        with self.lock:
+            res = {}
+            for name, hashEnt in self.nameHashDict.items():
+                obj = hashEnt._toJsonObj()
+                if obj:
+                    res[name] = obj
+            return res
+
+    def _popChanges(self):
+        '''Returns (removedAll, {name: jsonObj}, removedNames) of the changes since the previous call.'''
+        with self.lock:
+            changed = {}
+            for name, hashEnt in self.nameHashDict.items():
+                obj = hashEnt._toJsonObj()
+                if obj and obj != hashEnt.storedObj:
+                    changed[name] = hashEnt.storedObj = obj
+            res = self.removedAll, changed, self.removedNames
+            self.removedAll, self.removedNames = False, set()
+            return res
+
+    def _restoreChanges(self, removedAll, changed, removedNames):
+        '''Marks the changes returned by _popChanges() as unsaved again.'''
+        with self.lock:
+            for name in changed:
+                hashEnt = self.nameHashDict.get(name)
+                if hashEnt is not None:
+                    hashEnt.storedObj = None
+            self.removedAll = self.removedAll or removedAll
+            self.removedNames.update(removedNames)
+
+    def anyChanged(self, names):
+        '''Returns True if any of the names got a new hash in this build which differs from the loaded one.'''
+        with self.lock:
+            for name in names:
+                hashEnt = self.nameHashDict.get(name)
+                if hashEnt is not None and hashEnt.new and not hashEnt.matches():
+                    return True
+        return False
 
     def clear(self):
         with self.lock:
             self.nameHashDict.clear()
+            self.loader = None
+            self.removedAll, self.removedNames = True, set()
+
+    def _getEnt(self, name):
+        # caller holds self.lock
+        hashEnt = self.nameHashDict.get(name)
+        if hashEnt is None:
+            jsonObj = None if self.loader is None else self.loader(name)
+            hashEnt = None if jsonObj is None else HashEnt._loadJsonObj(jsonObj, logger.warningf)
+            if hashEnt is None:
+                hashEnt = HashEnt()
+            self.nameHashDict[name] = hashEnt
+        return hashEnt
 
     def get(self, name):
         with self.lock:
-            return self.nameHashDict[name]
+            return self._getEnt(name)
 
     def remove(self, name):
         # No lock, it is called from one thread
         self.nameHashDict.pop(name, None)
+        self.removedNames.add(name)
+
+    def close(self):
+        if self.pool:
+            # no pending jobs after the build, the pool threads exit on their own
+            # (join() would poll the pool's worker handler thread)
+            self.pool.close()
+            self.pool = None
+
+    def _hashFile(self, fs, fpath, hashEnt, stat=None):
+        with hashEnt.lock:
+            hashEnt.setByFile(fs, fpath, self.algo, self.racyWindowNs, stat)
+
+    def _hashJob(self, fs, fpath, hashEnt, pending, stat=None):
+        try:
+            self._hashFile(fs, fpath, hashEnt, stat)
+        except Exception as e:
+            pending.error = e
+        finally:
+            pending.event.set()
+
+    def hashFiles(self, fs, fpaths, recalc=False, statCache=None):
+        '''Hashes the given files concurrently on the I/O pool and returns their HashEnts in order.
+           Files hashed already in this build are skipped unless recalc is set. A file which is
+           being hashed by an other request is waited for, not hashed again.
+           statCache: the file metadata is taken from it by one batch'''
+        hashEnts, todo, waitFor = [], [], []
+        with self.lock:
+            for fpath in fpaths:
+                hashEnt = self._getEnt(fpath)
+                hashEnts.append(hashEnt)
+                pending = self.inFlight.get(fpath)
+                if pending and not recalc:
+                    waitFor.append((fpath, pending))
+                elif recalc or not hashEnt.new:
+                    pending = Pending()
+                    self.inFlight[fpath] = pending
+                    todo.append((fs, fpath, hashEnt, pending))
+                    waitFor.append((fpath, pending))
+        if statCache and todo:
+            stats = statCache.statMany([job[1] for job in todo])
+            todo = [job + (stat,) for job, stat in zip(todo, stats)]
+        if len(todo) > 1 or (todo and len(waitFor) > 1):
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ThreadPool(self.workers)
+                for job in todo:
+                    self.pool.apply_async(self._hashJob, job)
+            todo = []
+        # a single file is hashed by the calling thread
+        for job in todo:
+            self._hashJob(*job)
+        for fpath, pending in waitFor:
+            try:
+                pending.wait()
+            finally:
+                with self.lock:
+                    if self.inFlight.get(fpath) is pending:
+                        del self.inFlight[fpath]
+        return hashEnts
 
     def storeTaskHashes(self, bldr, task):  # TODO: pass FS instead of Builder
         '''Currently it is automatically called when the task build is completed.'''
-        def doit(what, files, recalc=False):
+        def check(what, files):
             for fpath in files:
-                # needDebug = fpath.endswith('/ALU.o') or fpath.endswith('/ALU.vhdl')
-                needDebug = False
-                hashEnt = self.nameHashDict[fpath]
-                logger.cdebugf(needDebug, '{} before hashEnt:{}', fpath, hashEnt)
-                with hashEnt.lock:
-                    if recalc or not hashEnt.new:
-                        if not bldr.fs.isfile(fpath):
-                            raise ValueError(
-                                '{what}:"{file}" for task "{task}" does not exist!'.format(
-                                    what=what, file=fpath, task=task.getId()))
-                        hashEnt.setByFile(bldr.fs, fpath)
-                        logger.cdebugf(needDebug, '{} after hashEnt:{}', fpath, hashEnt)
+                if not bldr.statCache.isfile(fpath):
+                    raise ValueError(
+                        '{what}:"{file}" for task "{task}" does not exist!'.format(
+                            what=what, file=fpath, task=task.getId()))
+        check('target', task.targets)
+        check('generatedFile', task.generatedFiles)
+        self.hashFiles(bldr.fs, task.targets + task.generatedFiles, recalc=True, statCache=bldr.statCache)
+        fileDeps = task.getFileDeps()
         with self.lock:
-            doit('target', task.targets, recalc=True)
-            doit('fileDep', task.getFileDeps())
-            doit('generatedFile', task.generatedFiles, recalc=True)
-            # doit(task.providedFileDeps) # provided file may not be built here
+            check('fileDep', [fpath for fpath in fileDeps if not self._getEnt(fpath).new])
+        self.hashFiles(bldr.fs, fileDeps, statCache=bldr.statCache)
+        # provided file may not be built here
@@ -0,0 +1,200 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from threading import Lock
+
+
+def internPath(fpath):
+    '''Paths are repeated in many tasks (e.g. common headers), equal str paths share one object.'''
+    return intern(fpath) if type(fpath) is str else fpath
+
+
+def internPaths(fpaths):
+    '''Interns the paths of fpaths in place and returns it.'''
+    for i, fpath in enumerate(fpaths):
+        fpaths[i] = internPath(fpath)
+    return fpaths
+
+
+class PathTable(object):
+    '''Maps the paths and task names to dense integer ids. The per path data is kept in lists and
+    bytearrays indexed by the ids, so they don't need a dict entry or a string key per path.'''
+
+    def __init__(self):
+        self.pathIdDict = {}    # {path: id}
+        self.paths = []         # [path] indexed by id
+        self.lock = Lock()      # serializes the new ids
+
+    def __len__(self):
+        return len(self.paths)
+
+    def getId(self, path):
+        '''Returns the id of path, an unknown path gets the next id.'''
+        pathId = self.pathIdDict.get(path)
+        if pathId is None:
+            # The table is shared by the Builder, the DB and the HashDict, they use it from different threads.
+            with self.lock:
+                pathId = self.pathIdDict.get(path)
+                if pathId is None:
+                    pathId = len(self.paths)
+                    path = internPath(path)
+                    self.paths.append(path)     # before the dict entry, so a found id has its path
+                    self.pathIdDict[path] = pathId
+        return pathId
+
+    def findId(self, path):
+        '''Returns the id of path or None if path is unknown.'''
+        return self.pathIdDict.get(path)
+
+    def getPath(self, pathId):
+        return self.paths[pathId]
+
+
+class PathFlags(object):
+    '''A set of paths of a PathTable stored as a bytearray indexed by the path ids.'''
+
+    def __init__(self, pathTable):
+        self.pathTable = pathTable
+        self.flags = bytearray()
+
+    def __contains__(self, path):
+        pathId = self.pathTable.findId(path)
+        return pathId is not None and pathId < len(self.flags) and self.flags[pathId] == 1
+
+    def add(self, path):
+        '''Returns False if path was already in the set.'''
+        pathId = self.pathTable.getId(path)
+        flags = self.flags
+        if pathId >= len(flags):
+            flags.extend(bytearray(max(pathId + 1, len(self.pathTable)) - len(flags)))
+        if flags[pathId]:
+            return False
+        flags[pathId] = 1
+        return True
+
+
+class PathLists(object):
+    '''Lists of objects per path of a PathTable, e.g. the parent tasks of the targets.
+    A path without objects doesn't allocate a list.'''
+
+    def __init__(self, pathTable):
+        self.pathTable = pathTable
+        self.lists = []     # [None or list] indexed by path id
+
+    def get(self, path):
+        '''Returns the objects of path, an empty tuple if it has none.'''
+        pathId = self.pathTable.findId(path)
+        if pathId is None or pathId >= len(self.lists):
+            return ()
+        return self.lists[pathId] or ()
+
+    def add(self, path, obj):
+        '''Appends obj to the objects of path, the caller ensures that it isn't there yet.'''
+        pathId = self.pathTable.getId(path)
+        lists = self.lists
+        if pathId >= len(lists):
+            lists.extend([None] * (max(pathId + 1, len(self.pathTable)) - len(lists)))
+        lst = lists[pathId]
+        if lst is None:
+            lists[pathId] = [obj]
+        else:
+            lst.append(obj)
+
+    def addUnique(self, path, obj):
+        '''Appends obj to the objects of path if it isn't there yet. Returns False if it was there.'''
+        for o in self.get(path):
+            if o is obj:
+                return False
+        self.add(path, obj)
+        return True
+
+
+class PathMap(object):
+    '''A {path: value} dict replacement storing the values in a list indexed by the path ids.
+    None is not a valid value, it marks the missing paths.'''
+
+    def __init__(self, pathTable):
+        self.pathTable = pathTable
+        self.slots = []     # [None or value] indexed by path id
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def get(self, path, default=None):
+        pathId = self.pathTable.findId(path)
+        if pathId is None or pathId >= len(self.slots):
+            return default
+        value = self.slots[pathId]
+        return default if value is None else value
+
+    def __getitem__(self, path):
+        value = self.get(path)
+        if value is None:
+            raise KeyError(path)
+        return value
+
+    def __setitem__(self, path, value):
+        assert value is not None
+        pathId = self.pathTable.getId(path)
+        slots = self.slots
+        if pathId >= len(slots):
+            slots.extend([None] * (max(pathId + 1, len(self.pathTable)) - len(slots)))
+        if slots[pathId] is None:
+            self.size += 1
+        slots[pathId] = value
+
+    def pop(self, path, default=None):
+        pathId = self.pathTable.findId(path)
+        if pathId is None or pathId >= len(self.slots) or self.slots[pathId] is None:
+            return default
+        value = self.slots[pathId]
+        self.slots[pathId] = None
+        self.size -= 1
+        return value
+
+    def __delitem__(self, path):
+        if self.pop(path) is None:
+            raise KeyError(path)
+
+    def clear(self):
+        self.slots = []
+        self.size = 0
+
+    def iteritems(self):
+        paths = self.pathTable.paths
+        for pathId, value in enumerate(self.slots):
+            if value is not None:
+                yield paths[pathId], value
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return [path for path, _ in self.iteritems()]
+
+    def values(self):
+        return [value for value in self.slots if value is not None]
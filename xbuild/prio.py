@@ -18,31 +18,47 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+# key entry of the not requested levels, it is placed between the entries of positive and negative prios
+_Rest = (1,)
+
+
+def _keyEntry(level, prio):
+    return (0, level, -prio) if prio > 0 else (2, -level, -prio)
+
+
 class Prio(object):
+    '''Immutable request priority. Its logical value is the list of task prios along the
+    dependency path from the requested target to the task. Prio lists are compared level by level,
+    a missing level counts as prio 0.
+
+    key is precomputed so that native tuple comparison gives this order, the lower key is the higher
+    priority. Only the non-zero levels are stored in it, so the tasks with default prio share their parent's key.
+    '''
+
+    __slots__ = ('key', 'depth', 'phase')
 
     def __init__(self, prioList=None, phase=None):
-        self.prioList = prioList if prioList else []
-        self.phase = phase
+        key = ()
+        for level, prio in enumerate(prioList if prioList else []):
+            if prio:
+                key += (_keyEntry(level, prio),)
+        self._set(key + (_Rest,), len(prioList) if prioList else 0, phase)
+
+    def _set(self, key, depth, phase):
+        self.key, self.depth = key, depth
+        self.phase = intern(phase) if type(phase) is str else phase
 
-    def copyPrioSettings(self, other):
-        assert isinstance(other, Prio)
-        self.prioList = other.prioList[:]
-        self.phase = other.phase
+    def sub(self, prio, phase=None):
+        '''Returns the Prio of a dependency with task prio "prio".'''
+        res = Prio.__new__(Prio)
+        key = self.key[:-1] + (_keyEntry(self.depth, prio), _Rest) if prio else self.key
+        res._set(key, self.depth + 1, phase if phase else self.phase)
+        return res
 
     def isRequested(self):
-        if self.prioList:
-            return True
-        return False
+        return self.depth > 0
 
 
 def prioCmp(a, b):
-    assert isinstance(a, Prio)
-    assert isinstance(b, Prio)
-    a = a.prioList
-    b = b.prioList
-    chkLen = min(len(a), len(b))
-    for i in range(chkLen):
-        diff = b[i] - a[i]  # reverse compare to achieve high on top in SortedList
-        if diff:
-            return diff
-    return 0
+    '''Returns negative value if "a" has higher priority.'''
+    return cmp(a.key, b.key)
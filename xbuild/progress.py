@@ -18,6 +18,8 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from threading import Thread, Event
+
 
 class Worker(object):
 
@@ -45,3 +47,26 @@ class Progress(object):
     def setWorkerPhase(self, idx, phase):
         w = self.workers[idx]
         w.phase = phase
+
+
+class ProgressReporter(Thread):
+    '''Samples the build queue with the given interval (seconds) and passes the snapshot to progressFn.
+    The worker threads only update counters, so a slow progressFn doesn't slow down the build.'''
+
+    def __init__(self, queue, progressFn, interval):
+        super(ProgressReporter, self).__init__(name='Progress')
+        self.daemon = True
+        self.queue = queue
+        self.progressFn = progressFn
+        self.interval = interval
+        self.stopEvent = Event()
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            self.progressFn(self.queue.getProgress())
+        # final state
+        self.progressFn(self.queue.getProgress())
+
+    def stop(self):
+        self.stopEvent.set()
+        self.join()
@@ -18,14 +18,20 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-from prio import Prio, prioCmp
+import copy
+import errno
 from callbacks import targetUpToDate, noDynFileDeps
 from xbuild.fs import joinPath
+from pathtable import internPaths
 
 class UserData(object):
     pass
 
 
+NoKwargs = {}   # shared by the callbacks passed without kwargs, they are unpacked at call
+NoFiles = ()    # shared default of the saved file lists, they are only replaced, never extended
+
+
 class CheckType(object):
     TimeStamp, Hash = range(2)
     TXT = ['TimeStamp', 'Hash']
@@ -43,6 +49,13 @@ class TState(object):
 # 2nd: build dynFileDeps
 class Task(object):
 
+    __slots__ = (
+        'name', 'targets', 'fileDeps', 'dynFileDeps', 'savedFileDeps', 'savedDynFileDeps', 'taskDeps',
+        'dynFileDepFetcher', 'taskFactory', 'prio', 'requestedPrio', 'critPath', 'pendingDepCnt', 'upToDate',
+        'action', 'cleaner', 'checkType', 'meta', 'exclGroup', 'greedy', 'summary', 'desc', 'state',
+        'generatedFiles', 'savedGeneratedFiles', 'providedFiles', 'providedTasks', 'savedProvidedFiles',
+        'savedProvidedTasks', 'garbageDirs', '_userData')
+
     @staticmethod
     def makeCB(cb):
         if cb is None:
@@ -57,7 +70,7 @@ class Task(object):
             else:
                 raise ValueError("Tuple must have 2 entries: (function, dict)!")
         elif hasattr(cb, '__call__'):
-            return (cb, {})
+            return (cb, NoKwargs)
         else:
             raise ValueError("Callback argument must be a function or a tuple: (function, dict)!")
 
@@ -99,19 +112,19 @@ class Task(object):
         Task.checkInput(
             name, targets, fileDeps, taskDeps, dynFileDepFetcher, taskFactory, upToDate, action, prio, meta, summary, desc)
         self.name = name
-        self.targets = [] if targets is None else targets
-        self.fileDeps = [] if fileDeps is None else fileDeps
+        self.targets = [] if targets is None else internPaths(targets)
+        self.fileDeps = [] if fileDeps is None else internPaths(fileDeps)
         self.dynFileDeps = []
         self.savedFileDeps = None
         self.savedDynFileDeps = None
-        self.taskDeps = [] if taskDeps is None else taskDeps
+        self.taskDeps = [] if taskDeps is None else internPaths(taskDeps)
         self.dynFileDepFetcher = Task.makeCB(dynFileDepFetcher)
         self.taskFactory = Task.makeCB(taskFactory)  # create rules to make providedFiles from generatedFiles
         self.prio = prio
         self.requestedPrio = None
-        self.pendingFileDeps = set(self.fileDeps)
-        self.pendingTaskDeps = set(self.taskDeps)
-        self.pendingDynFileDeps = set()
+        self.critPath = 0.0  # estimated seconds of the longest action chain from the task to a requested target
+        # number of the not built fileDeps, taskDeps and provided dynFileDeps, the Builder maintains it
+        self.pendingDepCnt = len(set(self.fileDeps)) + len(set(self.taskDeps))
         self.upToDate = Task.makeCB(upToDate)
         self.action = Task.makeCB(action)
         self.cleaner = Task.makeCB(cleaner)
@@ -124,21 +137,25 @@ class Task(object):
         self.state = TState.Init
         # generator tasks need to fill these fields
         self.generatedFiles = []
-        self.savedGeneratedFiles = []
+        self.savedGeneratedFiles = NoFiles
         self.providedFiles = []
         self.providedTasks = []
-        self.savedProvidedFiles = []
-        self.savedProvidedTasks = []
-        self.pendingProvidedFiles = set()  # TODO: remove
-        self.pendingProvidedTasks = set()  # TODO: remove
+        self.savedProvidedFiles = NoFiles
+        self.savedProvidedTasks = NoFiles
         self.garbageDirs = []
-        # task related data can be stored here which is readable by other tasks
-        self.userData = UserData()
+        self._userData = None
+
+    @property
+    def userData(self):
+        '''Task related data can be stored here which is readable by other tasks. Created at 1st access.'''
+        if self._userData is None:
+            self._userData = UserData()
+        return self._userData
 
     def __repr__(self, *args, **kwargs):
-        res = '{{{} state:{}, req:{}, trgs:{}, '.format(self.getId(), TState.TXT[self.state], bool(self.requestedPrio.prioList), self.targets)
+        res = '{{{} state:{}, req:{}, trgs:{}, '.format(self.getId(), TState.TXT[self.state], self.requestedPrio.isRequested(), self.targets)
         res += 'fDeps:{}, dfDeps:{}, tDeps:{}, '.format(self.fileDeps, self.dynFileDeps, self.taskDeps)
-        res += 'pfDeps:{}, pdFileDeps:{}, ptDeps:{}, '.format(list(self.pendingFileDeps), list(self.pendingDynFileDeps), list(self.pendingTaskDeps))
+        res += 'pendingDeps:{}, '.format(self.pendingDepCnt)
         res += 'prvFiles:{}, prvTasks:{}}}'.format(self.providedFiles, self.providedTasks)
         return res
 
@@ -182,10 +199,9 @@ class Task(object):
         return res
 
     def _injectDynDeps(self, generatorTask):
-        # update pending file deps
+        # the Builder counts the pending provided files
         cb, kwargs = self.dynFileDepFetcher
         newGenFileDeps, newProvFileDeps = cb(generatorTask, **kwargs)
-        self.pendingDynFileDeps |= set(newProvFileDeps)
         for newDep in newGenFileDeps + newProvFileDeps:
             assert newDep not in self.fileDeps
             if newDep not in self.dynFileDeps:
@@ -229,12 +245,15 @@ class Task(object):
 
     def addGeneratedFiles(self, fs, dpath):
         '''Scans dpath and adds all files found to generatedFiles.'''
-        for f in fs.listdir(dpath):
+        entries = fs.scanDirTypes(dpath)
+        if entries is None:
+            raise OSError(errno.ENOTDIR, 'Cannot scan the generated files, no such directory', dpath)
+        for f, isDir in entries:
             fpath = joinPath(dpath, f)
-            if fs.isfile(fpath):
-                self.generatedFiles.append(fpath)
-            elif fs.isdir(fpath):
+            if isDir:
                 self.addGeneratedFiles(fs, fpath)
+            elif isDir is not None:
+                self.generatedFiles.append(fpath)
 
     def getDynFileDeps(self, filterFn=None):
         '''Gets the dynamic file dependencies.'''
@@ -247,6 +266,12 @@ class Task(object):
         cb, kwargs = cbTuple
         return cb(bldr, self, **kwargs)
 
+    def _getRemoteCopy(self):
+        '''Returns a copy without callbacks. It is passed to callbacks running in other process.'''
+        res = copy.copy(self)   # it copies the slots too
+        res.dynFileDepFetcher = res.taskFactory = res.upToDate = res.action = res.cleaner = None
+        return res
+
     def _readyAndRequested(self):
         return self.state == TState.Ready and self.requestedPrio.isRequested()
 
@@ -254,13 +279,16 @@ class Task(object):
         '''Set only when reqPrio is higher than current requestPrio.
         Returns True when the task is first time requested.'''
         if self.requestedPrio:
-            if prioCmp(reqPrio, self.requestedPrio) < 0:
-                # self.requestedPrio = reqPrio
-                self.requestedPrio.copyPrioSettings(reqPrio)
+            if reqPrio.key < self.requestedPrio.key:
+                self.requestedPrio = reqPrio
             return False
         else:
             self.requestedPrio = reqPrio
             return True
 
+    def getActionTime(self):
+        '''Returns the recorded wall time of the last action run in seconds, 0 if it is unknown.'''
+        return self.meta.get('actionTime', 0.0)
+
     def _isRequested(self):
         return self.requestedPrio is not None
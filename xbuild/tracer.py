@@ -0,0 +1,148 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Opt-in per-task timing of a build. Pass a Tracer to the Builder, after the build write it
+by Tracer.writeChromeTrace() (open it in chrome://tracing or https://ui.perfetto.dev) or print Tracer.summary().'''
+
+import json
+from threading import Lock
+from timeit import default_timer as timer
+
+
+class TaskTrace(object):
+    '''Timestamps of a QueueTask in seconds relative to the start of the Tracer.'''
+
+    __slots__ = ('taskId', 'worker', 'queued', 'dispatched', 'spans', 'notified', 'tracer')
+
+    def __init__(self, tracer, taskId):
+        self.tracer = tracer
+        self.taskId = taskId
+        self.worker = None  # name of the worker thread
+        self.queued = tracer.now()
+        self.dispatched = None
+        self.spans = []  # [(name, start, end)], e.g. 'upToDate', 'action', 'save'
+        self.notified = None  # the parents are notified about the completion
+
+    def span(self, name):
+        return Span(self, name)
+
+    def getSpanTime(self, name):
+        return sum(end - start for sName, start, end in self.spans if sName == name)
+
+
+class Span(object):
+
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace, self.name = trace, name
+
+    def __enter__(self):
+        self.start = self.trace.tracer.now()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.trace.spans.append((self.name, self.start, self.trace.tracer.now()))
+
+
+class NoSpan(object):
+    '''Used when the build is not traced.'''
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+noSpan = NoSpan()
+
+
+class Tracer(object):
+
+    Phases = ('upToDate', 'action', 'save', 'factory')
+
+    def __init__(self):
+        self.start = timer()
+        self.lock = Lock()
+        self.traces = []
+
+    def now(self):
+        return timer() - self.start
+
+    def newTaskTrace(self, taskId):
+        trace = TaskTrace(self, taskId)
+        with self.lock:
+            self.traces.append(trace)
+        return trace
+
+    def toChromeTrace(self):
+        '''Returns the trace in the Chrome trace event format. Each worker is a thread, the queue waits
+        are async events.'''
+        def us(secs):
+            return int(secs * 1e6)
+
+        events, tids = [], {}
+        with self.lock:
+            traces = list(self.traces)
+        for i, trace in enumerate(traces):
+            if trace.dispatched is not None:
+                for ph, secs in (('b', trace.queued), ('e', trace.dispatched)):
+                    events.append({'name': trace.taskId, 'cat': 'wait', 'ph': ph, 'id': i, 'pid': 1, 'ts': us(secs)})
+            if trace.worker is None:
+                continue
+            tid = tids.setdefault(trace.worker, len(tids) + 1)
+            for name, start, end in trace.spans:
+                events.append({
+                    'name': trace.taskId, 'cat': name, 'ph': 'X', 'pid': 1, 'tid': tid, 'ts': us(start),
+                    'dur': us(end - start), 'args': {'phase': name}})
+            if trace.notified is not None:
+                events.append({
+                    'name': trace.taskId, 'cat': 'notified', 'ph': 'i', 's': 't', 'pid': 1, 'tid': tid,
+                    'ts': us(trace.notified)})
+        for worker, tid in tids.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': worker}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def writeChromeTrace(self, fs, fpath):
+        fs.write(fpath, json.dumps(self.toChromeTrace()), mkDirs=True)
+
+    def summary(self, topN=10):
+        '''Returns the phase totals and the topN tasks by the time spent in the workers as text.'''
+        with self.lock:
+            traces = [trace for trace in self.traces if trace.dispatched is not None]
+
+        def getWait(trace):
+            return trace.dispatched - trace.queued
+
+        def getTotal(trace):
+            return sum(end - start for _, start, end in trace.spans)
+
+        lines = ['{} tasks, total wait: {:.3f} s'.format(len(traces), sum(getWait(trace) for trace in traces))]
+        lines.append(', '.join(
+            'total {}: {:.3f} s'.format(phase, sum(trace.getSpanTime(phase) for trace in traces))
+            for phase in Tracer.Phases))
+        lines.append('Top {} tasks:'.format(topN))
+        lines.append('{:>8} {:>8} {:>8} {:>8} {:>8} {:>8}  {}'.format(
+            'total', 'wait', 'upToDate', 'action', 'save', 'factory', 'task'))
+        for trace in sorted(traces, key=getTotal, reverse=True)[:topN]:
+            phaseTimes = [trace.getSpanTime(phase) for phase in Tracer.Phases]
+            lines.append('{:8.3f} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:8.3f}  {}'.format(
+                getTotal(trace), getWait(trace), *(phaseTimes + [trace.taskId])))
+        return '\n'.join(lines)
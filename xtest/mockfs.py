@@ -19,6 +19,7 @@
 # SOFTWARE.
 
 import os
+import time
 import xbuild.fs as fs
 from xbuild import FS
 from StringIO import StringIO
@@ -31,6 +32,7 @@ class MyIO(StringIO):
     def __init__(self):
         StringIO.__init__(self) # StringIO is old style class
         self.lock = Lock()
+        self.mtimeNs = 0
 
     def reset(self):
         self.lock.acquire()
@@ -50,6 +52,8 @@ class MyIO(StringIO):
 
 class MockFS(FS):
 
+    scanDirHasStats = True  # the entries are in the memory
+
     @staticmethod
     def entcmp(ne0, ne1):
         name0, ent0 = ne0
@@ -74,6 +78,7 @@ class MockFS(FS):
         super(MockFS, self).__init__()
         self.root = {}   # {folderName:{}} {fileName: MyIO}
         self.lock =  RLock()
+        self.lastMTimeNs = 0
 
     def getFileList(self):
         res = []
@@ -131,10 +136,29 @@ class MockFS(FS):
     def abspath(self, fpath):
         return os.path.normpath(fpath)
 
+    def isLocal(self):
+        return False
+
     def exists(self, fpath):
         with self.lock:
             return self._walkDown(fpath) is not None
 
+    def _touch(self, ent):
+        # modification times are unique and increasing
+        self.lastMTimeNs = max(int(time.time() * 1000000000), self.lastMTimeNs + 1)
+        ent.mtimeNs = self.lastMTimeNs
+
+    def stat(self, fpath):
+        with self.lock:
+            return self._statEnt(self._walkDown(fpath))
+
+    def _statEnt(self, ent):
+        if ent is None:
+            return None
+        if isinstance(ent, MyIO):
+            return fs.Stat(len(ent.getvalue()), ent.mtimeNs, id(ent))
+        return fs.Stat(0, 0, id(ent), isDir=True)
+
     def open(self, fpath, mode='r'):
         with self.lock:
             dPath, fName = os.path.split(fpath)
@@ -156,11 +180,45 @@ class MockFS(FS):
                     return subEnt
                 raise IOError("'{}' is a folder!".format(fpath))
             elif 'w' in mode:
+                self._changed(fpath)
                 if subEnt is None:
                     ent[fName] = subEnt = MyIO()
                 subEnt.reset()
+                self._touch(subEnt)
                 return subEnt
 
+    def rename(self, spath, dpath):
+        self._changed(spath)
+        self._changed(dpath)
+        with self.lock:
+            sDir, sName = os.path.split(spath)
+            dDir, dName = os.path.split(dpath)
+            sEnt, dEnt = self._walkDown(sDir), self._walkDown(dDir)
+            if type(sEnt) is not dict or sName not in sEnt:
+                raise IOError("'{}' does not exist!".format(spath))
+            if type(dEnt) is not dict:
+                raise IOError("Cannot rename to '{}'!".format(dpath))
+            dEnt[dName] = sEnt.pop(sName)
+
+    def copy(self, spath, dpath):
+        self._changed(dpath)
+        with self.lock:
+            self.write(dpath, self.read(spath))
+
+    def scanDir(self, dpath):
+        with self.lock:
+            curEnt = self._walkDown(dpath)
+            if type(curEnt) is not dict:
+                return None
+            return [(name, self._statEnt(ent)) for name, ent in curEnt.items()]
+
+    def scanDirTypes(self, dpath, names=None):
+        with self.lock:
+            curEnt = self._walkDown(dpath)
+            if type(curEnt) is not dict:
+                return None
+            return [(name, type(ent) is dict) for name, ent in curEnt.items()]
+
     def listdir(self, dpath, dontFail=False):
         with self.lock:
             curEnt = self._walkDown(dpath)
@@ -171,6 +229,7 @@ class MockFS(FS):
                 return curEnt.keys()
 
     def remove(self, fpath):
+        self._changed(fpath)
         with self.lock:
             dPath, fName = os.path.split(fpath)
             ent = self._walkDown(dPath)
@@ -186,6 +245,7 @@ class MockFS(FS):
 
     # TODO: test
     def rmdir(self, dpath):
+        self._changed(dpath)
         with self.lock:
             pDir, folder = os.path.split(dpath)
             ent = self._walkDown(pDir)
@@ -203,6 +263,12 @@ class MockFS(FS):
         
     
     def mkdirs(self, dpath):
+        # the missing parents are created too
+        path = dpath
+        while path and not self.exists(path):
+            self._changed(path)
+            parent = os.path.dirname(path)
+            path = parent if parent != path else None
         with self.lock:
             entries = self.tokenizePath(dpath)  # MockFS.tokenize(dpath)
             curPath = self.root
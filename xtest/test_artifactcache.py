@@ -0,0 +1,144 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import shutil
+import tempfile
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, FS
+from xbuild.artifactcache import ArtifactCache
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.actions = 0
+
+    def concat(self, bldr, task, **kwargs):
+        self.actions += 1
+        res = ''
+        for src in task.getFileDeps():
+            res += bldr.fs.read(src)
+        for trg in task.targets:
+            bldr.fs.write(trg, res, mkDirs=True)
+        return 0
+
+    def generate(self, bldr, task, **kwargs):
+        self.actions += 1
+        dpath = bldr.fs.joinPath(bldr.fs.dirname(task.targets[0]), 'gen')
+        for i in range(2):
+            bldr.fs.write(bldr.fs.joinPath(dpath, '{}.txt'.format(i)), str(i), mkDirs=True)
+        task.addGeneratedFiles(bldr.fs, dpath)
+        bldr.fs.write(task.targets[0], 'list', mkDirs=True)
+        return 0
+
+
+class Test(XTest):
+
+    def build(self, fs, root, cache, counter):
+        joinPath = fs.joinPath
+        with Builder(name=joinPath(root, 'default'), fs=fs, printInfo=False, artifactCache=cache) as bldr:
+            bldr.addTask(
+                targets=[joinPath(root, 'out', 'a.o')], fileDeps=[joinPath(root, 'src', 'a.c')], action=counter.concat)
+            bldr.addTask(targets=[joinPath(root, 'out', 'gen.lst')], action=counter.generate)
+            return bldr.build([joinPath(root, 'out', 'a.o'), joinPath(root, 'out', 'gen.lst')])
+
+    def checkRestore(self, fs, root):
+        joinPath = fs.joinPath
+        src, obj = joinPath(root, 'src', 'a.c'), joinPath(root, 'out', 'a.o')
+        genFiles = [joinPath(root, 'out', 'gen', '{}.txt'.format(i)) for i in range(2)]
+        cache = ArtifactCache(fs, joinPath(root, 'cache'))
+        counter = Counter()
+        fs.write(src, 'a', mkDirs=True)
+        self.assertEquals(0, self.build(fs, root, cache, counter))
+        self.assertEquals(2, counter.actions)
+        self.assertEquals({'hits': 0, 'misses': 2, 'stores': 2, 'evictions': 0}, cache.getStats())
+        # clean then rebuild
+        for fpath in [obj, joinPath(root, 'out', 'gen.lst')] + genFiles:
+            fs.remove(fpath)
+        self.assertEquals(0, self.build(fs, root, cache, counter))
+        self.assertEquals(2, counter.actions)
+        self.assertEquals(2, cache.getStats()['hits'])
+        self.assertEquals('a', fs.read(obj))
+        self.assertEquals(['0', '1'], [fs.read(fpath) for fpath in genFiles])
+        # changed input
+        fs.write(src, 'b')
+        self.assertEquals(0, self.build(fs, root, cache, counter))
+        self.assertEquals(3, counter.actions)
+        self.assertEquals(3, cache.getStats()['stores'])
+        # back to the first version, e.g. by a branch switch
+        fs.write(src, 'a')
+        self.assertEquals(0, self.build(fs, root, cache, counter))
+        self.assertEquals(3, counter.actions)
+        self.assertEquals('a', fs.read(obj))
+
+    def testMockFS(self):
+        self.checkRestore(MockFS(), 'ws')
+
+    def testFS(self):
+        tmpDir = tempfile.mkdtemp()
+        try:
+            self.checkRestore(FS(), tmpDir)
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def testTimeStamp(self):
+        '''The file dependencies of the timestamp checked tasks are not hashed.'''
+        fs, counter = MockFS(), Counter()
+        cache = ArtifactCache(fs, 'cache')
+        fs.write('ws/src/a.c', 'a', mkDirs=True)
+
+        def build():
+            with Builder(name='ws/default', fs=fs, printInfo=False, artifactCache=cache, hashCheck=False) as bldr:
+                bldr.addTask(targets=['ws/out/a.o'], fileDeps=['ws/src/a.c'], action=counter.concat)
+                self.assertEquals(0, bldr.buildOne('ws/out/a.o'))
+                self.assertEquals(0, len(bldr.db.hashDict.nameHashDict))
+
+        build()
+        fs.remove('ws/out/a.o')
+        build()
+        self.assertEquals(1, counter.actions)
+        self.assertEquals({'hits': 1, 'misses': 1, 'stores': 1, 'evictions': 0}, cache.getStats())
+        fs.write('ws/src/a.c', 'b')
+        build()
+        self.assertEquals(2, counter.actions)
+        self.assertEquals('b', fs.read('ws/out/a.o'))
+
+    def testEviction(self):
+        '''The least recently used entries are evicted.'''
+        fs = MockFS()
+        counter = Counter()
+        # the a.o entries are 92 bytes, the gen.lst entry is 139 bytes (with the manifests)
+        cache = ArtifactCache(fs, 'cache', maxSize=250)
+        for content in ('a', 'b', 'c'):
+            fs.write('ws/src/a.c', content, mkDirs=True)
+            self.assertEquals(0, self.build(fs, 'ws', cache, counter))
+        stats = cache.getStats()
+        self.assertEquals(2, stats['evictions'])
+        self.assertTrue(cache.size <= 250)
+        # the last one is kept
+        fs.remove('ws/out/a.o')
+        self.assertEquals(0, self.build(fs, 'ws', cache, counter))
+        self.assertEquals(stats['hits'] + 1, cache.getStats()['hits'])
+        # the first one is evicted
+        fs.write('ws/src/a.c', 'a')
+        actions = counter.actions
+        self.assertEquals(0, self.build(fs, 'ws', cache, counter))
+        self.assertEquals(actions + 1, counter.actions)
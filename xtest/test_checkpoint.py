@@ -0,0 +1,134 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import threading
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, ThreadExecutor
+
+
+class ThreadCheckingExecutor(ThreadExecutor):
+    '''Records the running threads at start, a process pool would fork them.'''
+
+    def start(self, numWorkers):
+        self.threadNames = [thread.name for thread in threading.enumerate()]
+        super(ThreadCheckingExecutor, self).start(numWorkers)
+
+
+class Test(XTest):
+
+    def setUp(self):
+        self.fs = MockFS()
+        self.failing = set()
+        for i in range(3):
+            self.fs.write('src/{}.txt'.format(i), 'src{}'.format(i), mkDirs=True)
+
+    def concat(self, bldr, task, **kwargs):
+        if task.targets[0] in self.failing:
+            return 1
+        res = ''
+        for src in task.getFileDeps():
+            res += bldr.fs.read(src)
+        for trg in task.targets:
+            bldr.fs.write(trg, res, mkDirs=True)
+        return 0
+
+    def createBuilder(self, **kwargs):
+        bldr = Builder(fs=self.fs, workers=1, **kwargs)
+        for i in range(3):
+            bldr.addTask(targets=['out/{}.txt'.format(i)], fileDeps=['src/{}.txt'.format(i)], action=self.concat)
+        bldr.addTask(name='all', fileDeps=['out/{}.txt'.format(i) for i in range(3)])
+        bldr.addTask(targets=['out/all.txt'], fileDeps=['out/{}.txt'.format(i) for i in range(3)], action=self.concat)
+        return bldr
+
+    def getBuilt(self, output):
+        return [line for line in output.splitlines() if line.startswith('INFO: Building ')]
+
+    def testInterrupted(self):
+        '''The completed tasks are checkpointed, only the rest is built after a crash.'''
+        bldr = self.createBuilder(checkpointInterval=0, checkpointTasks=1)
+        try:
+            self.assertEquals(0, self.buildAndFetchOutput(bldr, ['out/0.txt', 'out/1.txt'])[0])
+        finally:
+            bldr.db.forget()    # killed, DB.save() is not called
+        self.assertEquals(
+            ['out/0.txt', 'out/1.txt'], sorted(json.loads(self.fs.read('default.xbuild'))['Task'].keys()))
+        self.assertFalse(self.fs.exists('default.xbuild.tmp'))
+        with self.createBuilder() as bldr:
+            rc, output = self.buildAndFetchOutput(bldr, 'all')
+        self.assertEquals(0, rc)
+        lines = output.splitlines()
+        self.assertNotIn('INFO: Building out/0.txt.', lines)
+        self.assertNotIn('INFO: Building out/1.txt.', lines)
+        self.assertIn('INFO: Building out/2.txt.', lines)
+
+    def testUnfinished(self):
+        '''A failed task whose dependency changed is built again, the saved hash doesn't make it up-to-date.'''
+        with self.createBuilder() as bldr:
+            self.assertEquals(0, self.buildAndFetchOutput(bldr, 'all')[0])
+        self.fs.write('src/0.txt', 'changed')
+        self.failing.add('out/0.txt')
+        with self.createBuilder() as bldr:
+            self.assertEquals(1, self.buildAndFetchOutput(bldr, 'all')[0])
+        self.failing.clear()
+        with self.createBuilder() as bldr:
+            rc, output = self.buildAndFetchOutput(bldr, 'all')
+        self.assertEquals(0, rc)
+        self.assertIn('INFO: Building out/0.txt.', output.splitlines())
+        self.assertEquals('changed', self.fs.read('out/0.txt'))
+
+    def testPartialFailure(self):
+        '''After a failed build only the failed task and its parents are built, also when the build
+        is killed after a checkpoint.'''
+        def buildFailing(bldr):
+            rc, output = self.buildAndFetchOutput(bldr, 'out/all.txt')
+            self.assertEquals(1, rc)
+            self.assertEquals(
+                ['INFO: Building out/0.txt.', 'INFO: Building out/1.txt.', 'INFO: Building out/2.txt.'],
+                sorted(self.getBuilt(output)))
+
+        for killed in (False, True):
+            self.setUp()
+            self.failing.add('out/2.txt')
+            if killed:
+                bldr = self.createBuilder(checkpointInterval=0, checkpointTasks=1)
+                try:
+                    buildFailing(bldr)
+                finally:
+                    bldr.db.forget()    # DB.save() is not called
+            else:
+                with self.createBuilder() as bldr:
+                    buildFailing(bldr)
+            self.failing.clear()
+            with self.createBuilder() as bldr:
+                rc, output = self.buildAndFetchOutput(bldr, 'out/all.txt')
+            self.assertEquals(0, rc)
+            self.assertEquals(
+                ['INFO: Building out/2.txt.', 'INFO: Building out/all.txt.'], sorted(self.getBuilt(output)))
+
+    def testStartedAfterExecutor(self):
+        '''The checkpointer thread is not running when the executor starts.'''
+        executor = ThreadCheckingExecutor()
+        with self.createBuilder(checkpointInterval=0, checkpointTasks=1, executor=executor) as bldr:
+            self.assertEquals(0, self.buildAndFetchOutput(bldr, 'all')[0])
+        self.assertNotIn('Checkpointer', executor.threadNames)
+        self.assertEquals(
+            ['all', 'out/0.txt', 'out/1.txt', 'out/2.txt'], sorted(json.loads(self.fs.read('default.xbuild'))['Task']))
@@ -0,0 +1,172 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import shutil
+import sqlite3
+import tempfile
+from helper import XTest
+from xbuild import Builder, FS
+
+
+def concat(bldr, task, **kwargs):
+    res = ''
+    for src in task.getFileDeps():
+        res += bldr.fs.read(src)
+    for trg in task.targets:
+        bldr.fs.write(trg, res, mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.fs = FS()
+        self.name = self.fs.joinPath(self.tmpDir, 'default')
+        self.srcs = [self.fs.joinPath(self.tmpDir, 'src', '{}.txt'.format(i)) for i in range(4)]
+        self.trgs = [self.fs.joinPath(self.tmpDir, 'out', '{}.txt'.format(i)) for i in range(4)]
+        for src in self.srcs:
+            self.fs.write(src, src, mkDirs=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def createBuilder(self):
+        bldr = Builder(name=self.name, fs=self.fs, printInfo=False)
+        for src, trg in zip(self.srcs, self.trgs):
+            bldr.addTask(targets=[trg], fileDeps=[src], action=concat)
+        bldr.addTask(name='all', fileDeps=self.trgs)
+        return bldr
+
+    def build(self, nameOrTarget='all'):
+        '''Returns (rc, number of the written rows).'''
+        with self.createBuilder() as bldr:
+            rc = bldr.buildOne(nameOrTarget)
+            conn = bldr.db.store._connect()
+            changes = conn.total_changes
+            bldr.db.save()
+            return rc, conn.total_changes - changes
+
+    def query(self, sql):
+        conn = sqlite3.connect(self.name + '.xbuild.db')
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def testIncremental(self):
+        '''Only the changed task records and hashes are written.'''
+        rc, _ = self.build()
+        self.assertEquals(0, rc)
+        self.assertFalse(self.fs.exists(self.name + '.xbuild'))
+        self.assertEquals([(5,)], self.query('SELECT COUNT(*) FROM task'))
+        self.assertEquals([(8,)], self.query('SELECT COUNT(*) FROM hash'))
+        # 3 meta rows are always written
+        rc, changes = self.build()
+        self.assertEquals((0, 3), (rc, changes))
+        self.fs.write(self.srcs[0], 'changed')
+        self.assertEquals(0, self.build()[0])
+        self.assertEquals('changed', self.fs.read(self.trgs[0]))
+        self.assertEquals([(5,)], self.query('SELECT COUNT(*) FROM task'))
+        self.assertEquals(
+            [(self.trgs[2],)],
+            self.query("SELECT taskId FROM target WHERE name = '{}'".format(self.trgs[2])))
+
+    def testFailedSave(self):
+        '''The changes of a failed save are written by the next save.'''
+
+        def failingWrite(*args):
+            raise sqlite3.OperationalError('disk I/O error')
+
+        with Builder(name=self.name, fs=self.fs, printInfo=False, checkpointInterval=0, checkpointTasks=0) as bldr:
+            for src, trg in zip(self.srcs, self.trgs):
+                bldr.addTask(targets=[trg], fileDeps=[src], action=concat)
+            bldr.addTask(name='all', fileDeps=self.trgs)
+            self.assertEquals(0, bldr.buildOne('all'))
+            store = bldr.db.store
+            store._writeHashes = failingWrite
+            self.assertRaises(sqlite3.OperationalError, bldr.db.save)
+            self.assertEquals([(0,)], self.query('SELECT COUNT(*) FROM task'))
+            del store._writeHashes
+            bldr.db.save()
+            self.assertEquals([(5,)], self.query('SELECT COUNT(*) FROM task'))
+            self.assertEquals([(8,)], self.query('SELECT COUNT(*) FROM hash'))
+        self.assertEquals((0, 3), self.build())
+
+    def testImportJson(self):
+        '''A JSON DB is imported once and kept as .bak.'''
+        with self.createBuilder() as bldr:
+            bldr.db.store = bldr.db.store.jsonStore
+            self.assertEquals(0, bldr.buildOne('all'))
+        jsonObj = json.loads(self.fs.read(self.name + '.xbuild'))
+        self.assertFalse(self.fs.exists(self.name + '.xbuild.db'))
+        self.assertEquals((0, 3), self.build())
+        self.assertFalse(self.fs.exists(self.name + '.xbuild'))
+        self.assertEquals(jsonObj, json.loads(self.fs.read(self.name + '.xbuild.bak')))
+        self.assertEquals([(5,)], self.query('SELECT COUNT(*) FROM task'))
+
+    def testImportWithoutHashAlgo(self):
+        '''A JSON DB saved before the hash algorithm was stored has md5 hashes.'''
+        with self.createBuilder() as bldr:
+            bldr.db.store = bldr.db.store.jsonStore
+            self.assertEquals(0, bldr.buildOne('all'))
+        jsonObj = json.loads(self.fs.read(self.name + '.xbuild'))
+        del jsonObj['HashAlgo']
+        self.fs.write(self.name + '.xbuild', json.dumps(jsonObj))
+        with Builder(name=self.name, fs=self.fs, printInfo=False, hashAlgo='sha1') as bldr:
+            self.assertEquals(0, len(bldr.db.hashDict.nameHashDict))
+            self.assertEquals(None, bldr.db.hashDict.loader)
+        self.assertEquals([('"sha1"',)], self.query("SELECT value FROM meta WHERE key = 'HashAlgo'"))
+
+    def testLazyLoad(self):
+        '''Only the records of the requested tasks are loaded.'''
+        self.assertEquals(0, self.build()[0])
+        with Builder(name=self.name, fs=self.fs, printInfo=False) as bldr:
+            bldr.addTask(targets=[self.trgs[1]], fileDeps=[self.srcs[1]], action=concat)
+            self.assertEquals(0, bldr.buildOne(self.trgs[1]))
+            self.assertEquals([self.trgs[1]], bldr.db.taskIdSavedTaskDict.keys())
+            self.assertEquals(sorted([self.srcs[1], self.trgs[1]]), sorted(bldr.db.hashDict.nameHashDict.keys()))
+            self.assertEquals(self.trgs[2], bldr.db.getTaskData(self.trgs[2])['trgs'][0])
+            self.assertEquals(5, len(bldr.db.getGraph().getAllTasks()))
+        self.assertEquals([(5,)], self.query('SELECT COUNT(*) FROM task'))
+        self.assertEquals((0, 3), self.build())
+
+    def testGraphSync(self):
+        '''The graph follows the saved and the cleaned tasks, clean writes only the removed records.'''
+        self.assertEquals(0, self.build()[0])
+        with Builder(name=self.name, fs=self.fs, printInfo=False) as bldr:
+            graph = bldr.db.getGraph()
+            bldr.addTask(targets=[self.trgs[0]], fileDeps=[self.srcs[0], self.srcs[1]], action=concat)
+            self.assertEquals(0, bldr.buildOne(self.trgs[0]))
+            self.assertTrue(graph is bldr.db.getGraph())
+            taskNode = graph.getTask(self.trgs[0])
+            self.assertEquals(sorted(self.srcs[:2]), sorted(taskNode.fileDeps))
+            self.assertTrue(taskNode.id in graph.fileDict[self.srcs[1]].fileDepOf)
+            conn = bldr.db.store._connect()
+            bldr.db.save()
+            changes = conn.total_changes
+            self.assertTrue(bldr.cleanOne(self.trgs[1]))
+            self.assertEquals(None, graph.getTask(self.trgs[1]))
+            self.assertFalse(self.trgs[1] in bldr.db.taskIdSavedTaskDict)
+            bldr.db.save()
+            # 3 meta rows, the removed task and target rows
+            self.assertEquals(5, conn.total_changes - changes)
+        self.assertEquals([(4,)], self.query('SELECT COUNT(*) FROM task'))
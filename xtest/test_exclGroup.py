@@ -22,7 +22,9 @@
 from time import sleep
 from mockfs import MockFS
 from helper import XTest
-from xbuild import Builder
+from xbuild import Builder, Task
+from xbuild.prio import Prio
+from xbuild.buildqueue import ReadyQueue, QueueTask
 from threading import Lock
 
 class ThreadReg(object):
@@ -126,3 +128,25 @@ class Test(XTest):
             self.assertEquals(0, rc)
             self.assertEquals(1, thrReg.maxCnt)
         
+
+
+class ReadyQueueTest(XTest):
+
+    def createQueueTask(self, name, exclGroup, prio):
+        queueTask = QueueTask.__new__(QueueTask)
+        queueTask.task = Task(name=name, exclGroup=exclGroup)
+        queueTask.prio = Prio([prio])
+        return queueTask
+
+    def testExcluded(self):
+        '''Busy exclusion groups don't block the other tasks.'''
+        queue = ReadyQueue()
+        for name, grp, prio in (('a0', 'A', 10), ('a1', 'A', 9), ('b0', 'B', 8), ('n0', None, 1), ('n1', None, 2)):
+            queue.add(self.createQueueTask(name, grp, prio))
+        self.assertEquals(5, len(queue))
+        taken = [queue.pop().task.name for _ in range(4)]
+        self.assertEquals(['a0', 'b0', 'n1', 'n0'], taken)
+        self.assertEquals(None, queue.pop())
+        queue.release('A')
+        self.assertEquals('a1', queue.pop().task.name)
+        self.assertEquals(0, len(queue))
@@ -0,0 +1,93 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import shutil
+import tempfile
+from helper import XTest
+from mockfs import MockFS
+from xbuild import Builder, Task, FS, FetchDynFileDeps, ProcessExecutor
+
+
+def pidAction(bldr, task, **kwargs):
+    for trg in task.targets:
+        bldr.fs.write(trg, str(os.getpid()), mkDirs=True)
+    return 0
+
+
+def generatorAction(bldr, task, outDir):
+    for i in range(3):
+        fpath = bldr.fs.joinPath(outDir, 'gen', 'gen{}.txt'.format(i))
+        bldr.fs.write(fpath, 'Generated file {}\n'.format(i), mkDirs=True)
+        task.generatedFiles.append(fpath)
+        task.providedFiles.append(bldr.fs.joinPath(outDir, 'out', 'gen{}.pid'.format(i)))
+    return 0
+
+
+def genTaskFactory(bldr, task):
+    return [
+        Task(targets=[trg], fileDeps=[src], action=pidAction)
+        for trg, src in zip(task.providedFiles, task.generatedFiles)]
+
+
+class Test(XTest):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def testProcessAction(self):
+        '''Actions run in worker processes.'''
+        fs = FS()
+        trgs = [fs.joinPath(self.tmpDir, 'out', '{}.pid'.format(i)) for i in range(4)]
+        with Builder(name=fs.joinPath(self.tmpDir, 'default'), fs=fs, workers=2, executor=ProcessExecutor()) as bldr:
+            for trg in trgs:
+                bldr.addTask(targets=[trg], action=pidAction)
+            bldr.addTask(name='all', fileDeps=trgs)
+            self.assertEquals(0, bldr.buildOne('all'))
+        for trg in trgs:
+            self.assertNotEquals(str(os.getpid()), fs.read(trg))
+
+    def testProcessGenerator(self):
+        '''Generated and provided files are passed back from the worker process.'''
+        fs = FS()
+        with Builder(name=fs.joinPath(self.tmpDir, 'default'), fs=fs, workers=2, executor=ProcessExecutor()) as bldr:
+            bldr.addTask(
+                name='generator',
+                action=(generatorAction, {'outDir': self.tmpDir}),
+                taskFactory=genTaskFactory)
+            bldr.addTask(
+                name='all',
+                taskDeps=['generator'],
+                dynFileDepFetcher=FetchDynFileDeps(fetchProv=True))
+            self.assertEquals(0, bldr.buildOne('all'))
+            self.assertEquals(3, len(bldr._getTaskById('generator').generatedFiles))
+        for i in range(3):
+            self.assertTrue(fs.isfile(fs.joinPath(self.tmpDir, 'out', 'gen{}.pid'.format(i))))
+
+    def testNotPicklable(self):
+        '''MockFS cannot be passed to other process, the actions run in the worker threads.'''
+        fs = MockFS()
+        with Builder(fs=fs, workers=2, executor=ProcessExecutor()) as bldr:
+            bldr.addTask(targets=['out/a.pid'], action=pidAction)
+            self.assertEquals(0, bldr.buildOne('out/a.pid'))
+        self.assertEquals(str(os.getpid()), fs.read('out/a.pid'))
@@ -22,21 +22,21 @@
 from helper import XTest
 from xbuild.fs import FS
 from xbuild.db import DB
-from xbuild.depgraph import DepGraph
+from xbuild.depgraph import DepGraph, EdgeKind
 
 
-def createGraph():
+def createGraph(rteGen=None):
     graph = DepGraph()
     graph.addTask(
         name='VSC.gen',
         fileDeps=['cfg0'],
         generatedFiles=['vsc0.h', 'vsc1.h', 'vsc0.c', 'vsc1.c', 'dyn.arxml'])
-    graph.addTask(
+    graph.addTask(**(rteGen or dict(
         name='RTE.gen',
         fileDeps=['cfg0', 'cfg1'],
         taskDeps=['VSC.gen'],
         dynFileDeps=['dyn.arxml'],
-        generatedFiles=['rte0.h', 'rte1.h'])
+        generatedFiles=['rte0.h', 'rte1.h'])))
     graph.addTask(
         name='VSC.obj',
         taskDeps=['VSC.gen'],
@@ -68,6 +68,17 @@ def createGraph():
     return graph
 
 
+def createDeepGenGraph():
+    '''The generator task is deeper than its generated files.'''
+    graph = DepGraph()
+    graph.addTask(name='gen', fileDeps=['gen.cfg'], generatedFiles=['g0.c', 'g1.c'])
+    graph.addTask(name='prep', taskDeps=['gen'], fileDeps=['prep.cfg'])
+    graph.addTask(name='all', taskDeps=['prep'], fileDeps=['g0.o'])
+    graph.addTask(targets=['g0.o'], fileDeps=['g0.c'])
+    graph.addTask(name='other', dynFileDeps=['g1.c'], taskDeps=['gen'])
+    return graph
+
+
 def printUML(graph, filesToHighLight=set(), tasksToHighLight=set(), fileNotes={}, taskNotes={}):
     db = DB.create('temp', fs=FS())
     db.loadGraph(graph)
@@ -76,9 +87,131 @@ def printUML(graph, filesToHighLight=set(), tasksToHighLight=set(), fileNotes={}
     db.forget()
 
 
+def getEdges(graph):
+    res = set()
+    for taskNode in graph.getAllTasks().values():
+        for nodeDict in taskNode.getLeftNodeDicts() + taskNode.getRightNodeDicts():
+            res.update((taskNode.id, nodeId) for nodeId in nodeDict)
+    return res
+
+
 class Test(XTest):
-    
-    pass
+
+    def checkDepths(self, graph, topLeafGenerated, depths, columns):
+        graph.calcDepths(topLeafGenerated=topLeafGenerated)
+        self.assertEquals(
+            sorted(depths),
+            sorted((n.id, n.depth.lower, n.depth.higher) for n in graph.fileDict.values() + graph.getAllTasks().values()))
+        self.assertEquals(columns, [sorted(n.id for n in column) for column in graph.columns])
+
+    def testDepths(self):
+        # the files and the unnamed tasks with the same id are both listed
+        depths = [
+            ('RTE.gen', 1, 4), ('VSC.gen', 1, 6), ('VSC.obj', 2, 3), ('cfg0', 2, 7), ('cfg1', 2, 5),
+            ('dyn.arxml', 2, 5), ('linker', 1, 1), ('rte0.h', 0, 3), ('rte1.h', 0, 3), ('runner', 0, 0),
+            ('src0.c', 4, 4), ('src0.o', 2, 2), ('src0.o', 3, 3), ('src1.c', 4, 4), ('src1.o', 2, 2),
+            ('src1.o', 3, 3), ('test.bin', 0, 0), ('vsc0.c', 3, 5), ('vsc0.h', 0, 5), ('vsc0.o', 2, 2),
+            ('vsc0.o', 3, 3), ('vsc1.c', 3, 5), ('vsc1.h', 0, 5), ('vsc1.o', 2, 2), ('vsc1.o', 3, 3)]
+        columns = [
+            ['runner', 'test.bin'], ['linker'], ['src0.o', 'src1.o', 'vsc0.o', 'vsc1.o'],
+            ['VSC.obj', 'rte0.h', 'rte1.h', 'src0.o', 'src1.o', 'vsc0.o', 'vsc1.o'], ['RTE.gen', 'src0.c', 'src1.c'],
+            ['cfg1', 'dyn.arxml', 'vsc0.c', 'vsc0.h', 'vsc1.c', 'vsc1.h'], ['VSC.gen'], ['cfg0']]
+        self.checkDepths(createGraph(), False, depths, columns)
+
+    def testDepthsTopLeafGenerated(self):
+        depths = [
+            ('RTE.gen', 1, 4), ('VSC.gen', 1, 6), ('VSC.obj', 2, 3), ('cfg0', 2, 7), ('cfg1', 2, 5),
+            ('dyn.arxml', 2, 5), ('linker', 1, 1), ('rte0.h', 0, 0), ('rte1.h', 0, 0), ('runner', 0, 0),
+            ('src0.c', 4, 4), ('src0.o', 2, 2), ('src0.o', 3, 3), ('src1.c', 4, 4), ('src1.o', 2, 2),
+            ('src1.o', 3, 3), ('test.bin', 0, 0), ('vsc0.c', 3, 4), ('vsc0.h', 0, 0), ('vsc0.o', 2, 2),
+            ('vsc0.o', 3, 3), ('vsc1.c', 3, 4), ('vsc1.h', 0, 0), ('vsc1.o', 2, 2), ('vsc1.o', 3, 3)]
+        columns = [
+            ['rte0.h', 'rte1.h', 'runner', 'test.bin', 'vsc0.h', 'vsc1.h'], ['linker'],
+            ['src0.o', 'src1.o', 'vsc0.o', 'vsc1.o'], ['VSC.obj', 'src0.o', 'src1.o', 'vsc0.o', 'vsc1.o'],
+            ['RTE.gen', 'src0.c', 'src1.c', 'vsc0.c', 'vsc1.c'], ['cfg1', 'dyn.arxml'], ['VSC.gen'], ['cfg0']]
+        self.checkDepths(createGraph(), True, depths, columns)
+
+    def testDepthsDeepGenerator(self):
+        depths = [
+            ('all', 0, 0), ('g0.c', 3, 3), ('g0.o', 1, 1), ('g0.o', 2, 2), ('g1.c', 1, 3), ('gen', 1, 4),
+            ('gen.cfg', 2, 5), ('other', 0, 0), ('prep', 1, 1), ('prep.cfg', 2, 2)]
+        columns = [['all', 'other'], ['g0.o', 'prep'], ['g0.o', 'prep.cfg'], ['g0.c', 'g1.c'], ['gen'], ['gen.cfg']]
+        self.checkDepths(createDeepGenGraph(), False, depths, columns)
+        depths[4] = ('g1.c', 1, 1)
+        columns = [['all', 'other'], ['g0.o', 'g1.c', 'prep'], ['g0.o', 'prep.cfg'], ['g0.c'], ['gen'], ['gen.cfg']]
+        self.checkDepths(createDeepGenGraph(), True, depths, columns)
+
+    def testSelectRightDeepChain(self):
+        '''Deeper than the recursion limit.'''
+        graph = DepGraph()
+        graph.addTask(targets=['f0'], fileDeps=['src'])
+        for i in range(1, 3000):
+            graph.addTask(targets=['f{}'.format(i)], fileDeps=['f{}'.format(i - 1)])
+        graph.addTask(name='all', fileDeps=['f2999'], generatedFiles=['all.log'])
+        selectedFiles, selectedTasks = graph.selectRight(['all'], leaveLeaves=True)
+        self.assertEquals(3001, len(selectedTasks))
+        self.assertEquals(3001, len(selectedFiles))
+        self.assertTrue('all.log' in selectedFiles)
+        self.assertFalse('src' in selectedFiles)
+        # f0 has an other parent
+        graph.addTask(name='other', fileDeps=['f0'])
+        selectedFiles, selectedTasks = graph.selectRight(['all'], leaveLeaves=True)
+        self.assertEquals(3000, len(selectedTasks))
+        self.assertFalse('f0' in selectedFiles)
+
+    def testSelectRightTopTaskDep(self):
+        '''A top level task selected via an other top level task doesn't select the targets of its task
+        dependencies when they have unselected parents.'''
+        graph = DepGraph()
+        graph.addTask(name='T0', targets=['f4'], fileDeps=['src'])
+        graph.addTask(name='T2', taskDeps=['T0'])
+        graph.addTask(name='T3', taskDeps=['T2'])
+        graph.addTask(name='T4', fileDeps=['src4'])
+        graph.addTask(name='T5', fileDeps=['f4'])
+        graph.addTask(name='T7', fileDeps=['f4'])
+        selectedFiles, selectedTasks = graph.selectRight(['T3', 'T2', 'T4'], leaveLeaves=True)
+        self.assertEquals(['T2', 'T3', 'T4'], sorted(selectedTasks))
+        self.assertFalse('f4' in selectedFiles)
+        self.assertFalse('T0' in selectedTasks)
+
+    def testUpdateTask(self):
+        rteGen = dict(name='RTE.gen', fileDeps=['cfg1', 'cfg2'], taskDeps=['VSC.gen'], generatedFiles=['rte0.h'])
+        graph = createGraph()
+        graph.updateTask(**rteGen)
+        ref = createGraph(rteGen)
+        rteGen = graph.findTask('RTE.gen')
+        # the dependents are kept
+        self.assertEquals(['src0.o', 'src1.o'], sorted(n.id for n in rteGen.taskDepOf.values()))
+        self.assertEquals(getEdges(ref), getEdges(graph))
+        self.assertEquals(sorted(ref.rootFileDict), sorted(graph.rootFileDict))
+        self.assertEquals(sorted(ref.rootTaskDict), sorted(graph.rootTaskDict))
+        self.assertFalse('rte1.h' in graph.fileDict)
+        self.assertTrue('dyn.arxml' in graph.rootFileDict)  # nobody depends on it anymore
+
+    def testSnapshot(self):
+        graph = createGraph()
+        snapshot = graph.getSnapshot()
+        self.assertTrue(snapshot is graph.getSnapshot())
+        nodes = snapshot.nodes
+        self.assertEquals(
+            sorted(graph.rootFileDict.values() + graph.rootTaskDict.values()), sorted(nodes[:snapshot.numRoots]))
+        self.assertEquals(len(nodes), len(graph.fileDict) + len(graph.getAllTasks()))
+        for idx, node in enumerate(nodes):
+            self.assertEquals(sorted(node.getRightNodeList()), sorted(nodes[i] for i in set(snapshot.getRightIdxs(idx))))
+            self.assertEquals(sorted(node.getLeftNodeList()), sorted(nodes[i] for i in set(snapshot.getLeftIdxs(idx))))
+        idx = snapshot.getNodeIdx(graph.findTask('VSC.obj'))
+        offsets = snapshot.rightOffsets
+        self.assertEquals(
+            [(EdgeKind.DynFileDep, 'vsc0.c'), (EdgeKind.DynFileDep, 'vsc1.c'), (EdgeKind.TaskDep, 'VSC.gen')],
+            sorted((snapshot.rightKinds[e], nodes[snapshot.rightEdges[e]].id) for e in range(offsets[idx], offsets[idx + 1])))
+        offsets = snapshot.leftOffsets
+        self.assertEquals(
+            [(EdgeKind.Provided, 'vsc0.o'), (EdgeKind.Provided, 'vsc1.o'), (EdgeKind.TaskDep, 'linker')],
+            sorted((snapshot.leftKinds[e], nodes[snapshot.leftEdges[e]].id) for e in range(offsets[idx], offsets[idx + 1])))
+        # every change drops the snapshot
+        graph.updateTask(name='runner', taskDeps=['linker'], fileDeps=['test.cfg'])
+        self.assertFalse(snapshot is graph.getSnapshot())
+        self.assertTrue(graph.fileDict['test.cfg'] in graph.getSnapshot().nodeIdxs)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,156 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import hashlib
+from threading import Thread, Lock
+from collections import Counter
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, HashEnt, HashDict
+from xbuild.hash import ChunkSize
+
+
+class CountingFS(MockFS):
+
+    def __init__(self):
+        super(CountingFS, self).__init__()
+        self.openCounter, self.cntLock = Counter(), Lock()
+
+    def open(self, fpath, mode='r'):
+        with self.cntLock:
+            self.openCounter[fpath] += 1
+        return super(CountingFS, self).open(fpath, mode)
+
+
+def concat(bldr, task, **kwargs):
+    res = ''
+    for src in task.getFileDeps():
+        res += bldr.fs.read(src)
+    for trg in task.targets:
+        bldr.fs.write(trg, res, mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def testChunked(self):
+        '''Files bigger than the chunk size get the same hash as their content.'''
+        fs = MockFS()
+        content = ''.join(chr(i % 251) for i in range(ChunkSize * 3 + 17))
+        fs.write('big.bin', content)
+        for algo in ('md5', 'sha1'):
+            hashEnt = HashEnt()
+            hashEnt.setByFile(fs, 'big.bin', algo)
+            self.assertEquals(hashlib.new(algo, content).hexdigest(), hashEnt.new)
+            self.assertEquals(hashEnt.new, HashEnt.calcHash(content, algo))
+
+    def testUnknownAlgo(self):
+        self.assertRaises(ValueError, HashDict, 'crc32')
+
+    def testAlgoChange(self):
+        '''The stored hashes are dropped when the hash algorithm changes.'''
+        fs = MockFS()
+        fs.write('src/a.txt', 'aFile', mkDirs=True)
+
+        def build(hashAlgo):
+            with Builder(fs=fs, hashAlgo=hashAlgo) as bldr:
+                bldr.addTask(targets=['out/a.txt'], fileDeps=['src/a.txt'], action=concat)
+                rc, output = self.buildAndFetchOutput(bldr, 'out/a.txt')
+                self.assertEquals(0, rc)
+            self.assertEquals(hashAlgo, json.loads(fs.read('default.xbuild'))['HashAlgo'])
+            return 'INFO: Building out/a.txt.' in output.splitlines()
+
+        self.assertTrue(build('md5'))
+        self.assertFalse(build('md5'))
+        self.assertTrue(build('sha1'))
+        self.assertFalse(build('sha1'))
+
+    def testStatSig(self):
+        '''The stored digest is reused while the stat signature matches.'''
+        fs = MockFS()
+        fs.write('a.txt', 'aFile')
+        hashEnt = HashEnt()
+        hashEnt.setByFile(fs, 'a.txt', racyWindowNs=0)
+        sig = fs.stat('a.txt').getSig()
+        self.assertEquals(sig, hashEnt.newSig)
+        self.assertEquals([hashEnt.new] + sig, hashEnt._toJsonObj())
+        # a fake digest proves that the file is not read
+        hashEnt = HashEnt._loadJsonObj(['cached'] + sig, self.fail)
+        hashEnt.setByFile(fs, 'a.txt', racyWindowNs=0)
+        self.assertEquals('cached', hashEnt.new)
+        fs.write('a.txt', 'aFile')
+        hashEnt.setByFile(fs, 'a.txt', racyWindowNs=0)
+        self.assertEquals(HashEnt.calcHash('aFile'), hashEnt.new)
+
+    def testRacySig(self):
+        '''Files modified right before hashing don't get a stat signature.'''
+        fs = MockFS()
+        fs.write('a.txt', 'aFile')
+        hashEnt = HashEnt()
+        hashEnt.setByFile(fs, 'a.txt')
+        self.assertIsNone(hashEnt.newSig)
+        self.assertEquals(HashEnt.calcHash('aFile'), hashEnt._toJsonObj())
+        self.assertEquals(HashEnt.calcHash('aFile'), HashEnt._loadJsonObj(hashEnt.new, self.fail).old)
+
+    def testStatSigInDB(self):
+        fs = MockFS()
+        fs.write('src/a.txt', 'aFile', mkDirs=True)
+
+        def build():
+            with Builder(fs=fs) as bldr:
+                bldr.db.hashDict.racyWindowNs = 0
+                bldr.addTask(targets=['out/a.txt'], fileDeps=['src/a.txt'], action=concat)
+                rc, output = self.buildAndFetchOutput(bldr, 'out/a.txt')
+                self.assertEquals(0, rc)
+            return 'INFO: Building out/a.txt.' in output.splitlines()
+
+        self.assertTrue(build())
+        hashes = json.loads(fs.read('default.xbuild'))['HashDict']
+        self.assertEquals(fs.stat('src/a.txt').getSig(), hashes['src/a.txt'][1:])
+        self.assertEquals(fs.stat('out/a.txt').getSig(), hashes['out/a.txt'][1:])
+        self.assertFalse(build())
+        fs.write('src/a.txt', 'aFile2')
+        self.assertTrue(build())
+        self.assertEquals('aFile2', fs.read('out/a.txt'))
+
+    def testHashFiles(self):
+        '''Concurrent batches hash each file only once.'''
+        fs = CountingFS()
+        fpaths = ['src/{}.c'.format(i) for i in range(40)]
+        for fpath in fpaths:
+            fs.write(fpath, fpath, mkDirs=True)
+        fs.openCounter.clear()
+        hashDict = HashDict()
+        results = []
+
+        def hashAll():
+            results.append(hashDict.hashFiles(fs, fpaths))
+
+        threads = [Thread(target=hashAll) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        hashDict.close()
+        self.assertEquals(8, len(results))
+        for hashEnts in results:
+            self.assertEquals([HashEnt.calcHash(fpath) for fpath in fpaths], [hashEnt.new for hashEnt in hashEnts])
+        self.assertEquals({fpath: 1 for fpath in fpaths}, dict(fs.openCounter))
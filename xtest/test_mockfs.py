@@ -193,3 +193,50 @@ class CleanerTest(unittest.TestCase):
             ['/dir0/dir0/dir0/file0.txt', '/dir0/dir0/dir0/file1.txt', '/dir0/dir0/dir0/file2.txt'],
             dPaths,
             ['/dir0/dir0/dir0'])
+
+    def testCleanConcurrently(self):
+        fs, dPaths, fPaths = self.buildFsTree()
+
+        def listdir(dpath, dontFail=False):
+            self.fail('listdir({}) is called'.format(dpath))
+        fs.listdir = listdir
+
+        dir00Files = [fPath for fPath in fPaths if fPath.startswith('/dir1/dir0/dir0/')]
+        cleaner = Cleaner(
+            fs, absPaths=dir00Files + ['/dir1/dir2/file0.txt', '/dir1/nodir/file0.txt'],
+            absDirPaths=['/dir1/dir1', '/dir1/dir0/dir2', '/dir1/dir2/nodir'], workers=4)
+        rmdirs, rmfiles = cleaner.clean()
+        rmDirs = ['/dir1/dir0/dir0', '/dir1/dir0/dir2', '/dir1/dir1']
+        self.assertListEqual(rmDirs, sorted(rmdirs))
+        self.assertListEqual(['/dir1/dir2/file0.txt'], rmfiles)
+        prefixes = tuple(rmDirs)
+        self.checkFS(
+            fs,
+            fPaths,
+            [fPath for fPath in fPaths if fPath.startswith(prefixes)] + ['/dir1/dir2/file0.txt'],
+            dPaths,
+            [dPath for dPath in dPaths if dPath.startswith(prefixes)])
+
+    def testCleanTypesOfRequestedNames(self):
+        '''Only the types of the paths to clean are asked, except in the purged directories.'''
+        fs, dPaths, fPaths = self.buildFsTree()
+        scans = {}
+        scanDirTypes = fs.scanDirTypes
+
+        def recordingScanDirTypes(dpath, names=None):
+            scans[dpath] = names
+            return scanDirTypes(dpath, names)
+        fs.scanDirTypes = recordingScanDirTypes
+
+        cleaner = Cleaner(fs, absPaths=['/dir0/dir0/file0.txt'], absDirPaths=['/dir0/dir1'])
+        cleaner.clean()
+        self.assertEquals(set(['dir0', 'dir1']), scans['/dir0'])
+        self.assertEquals(set(['file0.txt']), scans['/dir0/dir0'])
+        self.assertEquals(None, scans['/dir0/dir1'])
+        self.assertEquals(None, scans['/dir0/dir1/dir2'])
+        self.checkFS(
+            fs,
+            fPaths,
+            ['/dir0/dir0/file0.txt'] + [fPath for fPath in fPaths if fPath.startswith('/dir0/dir1/')],
+            dPaths,
+            [dPath for dPath in dPaths if dPath.startswith('/dir0/dir1')])
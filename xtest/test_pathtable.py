@@ -0,0 +1,107 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder
+from xbuild.pathtable import PathTable, PathFlags, PathLists, PathMap
+
+
+def action(bldr, task, **kwargs):
+    for trg in task.targets:
+        bldr.fs.write(trg, trg, mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def testPathTable(self):
+        table = PathTable()
+        self.assertEquals(0, table.getId('a'))
+        self.assertEquals(1, table.getId('b' + 'c'))
+        self.assertEquals(0, table.getId('a'))
+        self.assertEquals(None, table.findId('d'))
+        self.assertTrue(table.getPath(1) is intern('bc'))
+        self.assertEquals(2, len(table))
+        flags = PathFlags(table)
+        self.assertFalse('a' in flags)
+        self.assertTrue(flags.add('d'))
+        self.assertFalse(flags.add('d'))
+        self.assertTrue('d' in flags)
+        self.assertFalse('a' in flags)
+        self.assertFalse('e' in flags)
+        lists = PathLists(table)
+        self.assertEquals((), lists.get('a'))
+        self.assertEquals((), lists.get('e'))
+        lists.add('a', 1)
+        self.assertTrue(lists.addUnique('a', 2))
+        self.assertFalse(lists.addUnique('a', 2))
+        self.assertEquals([1, 2], lists.get('a'))
+        self.assertEquals((), lists.get('bc'))
+
+    def testPathMap(self):
+        table = PathTable()
+        table.getId('a')
+        pathMap = PathMap(table)
+        self.assertFalse('a' in pathMap)
+        self.assertEquals(None, pathMap.get('b'))
+        self.assertEquals(0, pathMap.get('b', 0))
+        self.assertRaises(KeyError, lambda: pathMap['a'])
+        pathMap['b'] = 2
+        pathMap['a'] = 1
+        pathMap['b'] = 3
+        self.assertEquals(2, len(pathMap))
+        self.assertEquals(3, pathMap['b'])
+        self.assertEquals([('a', 1), ('b', 3)], pathMap.items())
+        self.assertEquals(['a', 'b'], list(pathMap))
+        self.assertEquals([1, 3], pathMap.values())
+        self.assertEquals(1, pathMap.pop('a'))
+        self.assertEquals(None, pathMap.pop('a'))
+        del pathMap['b']
+        self.assertRaises(KeyError, pathMap.__delitem__, 'b')
+        self.assertEquals(0, len(pathMap))
+        pathMap['c'] = 4
+        pathMap.clear()
+        self.assertEquals([], pathMap.keys())
+        self.assertEquals(3, len(table))
+
+    def testParentTasks(self):
+        '''A task is a parent of its repeated and shared dependencies once.'''
+        fs = MockFS()
+        fs.write('src/a.c', 'a', mkDirs=True)
+        fs.write('src/common.h', 'common', mkDirs=True)
+        with Builder(fs=fs) as bldr:
+            bldr.addTask(name='a', targets=['out/a.o'], fileDeps=['src/a.c', 'src/common.h', 'src/a.c'], action=action)
+            bldr.addTask(targets=['out/b.o'], fileDeps=['src/common.h'], action=action)
+            bldr.addTask(name='all', fileDeps=['out/a.o', 'out/b.o'], taskDeps=['a'])
+            taskA = bldr._getTaskById('out/a.o')
+            self.assertEquals([taskA], bldr.parentTasks.get('src/a.c'))
+            self.assertEquals(2, len(bldr.parentTasks.get('src/common.h')))
+            self.assertEquals(1, len(bldr.parentTasks.get('out/a.o')))
+            self.assertEquals(1, len(bldr.parentTasks.get('a')))
+            self.assertEquals(2, taskA.pendingDepCnt)
+            self.assertEquals(0, bldr.buildOne('all'))
+            self.assertTrue('src/common.h' in bldr.upToDateFiles)
+            # the task, saved task and hash dicts are indexed by the ids of the same table
+            self.assertTrue(bldr.targetTaskDict['out/a.o'] is taskA)
+            self.assertTrue('src/common.h' in bldr.db.hashDict.nameHashDict)
+            self.assertTrue(bldr.db.hashDict.nameHashDict.pathTable is bldr.pathTable)
+            self.assertTrue(bldr.db.targetSavedTaskDict.pathTable is bldr.pathTable)
+            self.assertEquals('out/a.o', fs.read('out/a.o'))
@@ -0,0 +1,86 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from mockfs import MockFS
+from xbuild import Builder
+from xbuild.prio import Prio, prioCmp
+
+
+class Test(unittest.TestCase):
+
+    def testOrder(self):
+        '''Higher prio comes first, missing levels count as prio 0.'''
+        ordered = [[3], [0, 2], [0, 0, 1], [0], [0, 0, -1], [0, -1, 5], [-1]]
+        prios = [Prio(lst) for lst in ordered]
+        self.assertEquals(ordered, [ordered[prios.index(p)] for p in sorted(reversed(prios), key=lambda p: p.key)])
+        self.assertEquals(0, prioCmp(Prio([0]), Prio([0, 0, 0])))
+        self.assertEquals(0, prioCmp(Prio([1]), Prio([1, 0])))
+        self.assertTrue(prioCmp(Prio([1]), Prio([0, 1])) < 0)
+
+    def testSub(self):
+        '''Prio.sub() gives the same key as the full prio list.'''
+        prio = Prio()
+        lst = []
+        for p in (0, 2, 0, -1, 0, 0, 7):
+            prio = prio.sub(p, 'phase')
+            lst.append(p)
+            self.assertEquals(Prio(lst).key, prio.key)
+            self.assertEquals(len(lst), prio.depth)
+            self.assertTrue(prio.isRequested())
+        self.assertEquals('phase', prio.phase)
+        self.assertFalse(Prio().isRequested())
+        # default prio shares the key
+        self.assertTrue(prio.sub(0).key is prio.key)
+
+
+class CritPathTest(unittest.TestCase):
+
+    def getReadyOrder(self, prios={}):
+        '''Requests 3 short independent tasks and a chain of 2 long tasks, returns the order of the ready ones.'''
+        with Builder(fs=MockFS(), printInfo=False) as bldr:
+            for name, actionTime, deps in (
+                ('s0', 0.1, []), ('s1', 0.2, []), ('s2', 0.3, []), ('c0', 1.0, []), ('c1', 1.0, ['c0'])
+            ):
+                bldr.addTask(name=name, taskDeps=deps, action=lambda bldr, task: 0, prio=prios.get(name, 0))
+                bldr._getTaskByName(name).meta = {'actionTime': actionTime}
+            bldr.addTask(name='all', taskDeps=['s0', 's1', 's2', 'c1'])
+            self.assertEquals(0, bldr._buildInitialDepGraph(['all']))
+            bldr._calcCriticalPaths()
+            self.assertEquals(2.0, bldr._getTaskByName('c0').critPath)
+            readyQueue = bldr.queue.readyQueue
+            return [readyQueue.pop().task.name for _ in range(len(readyQueue))]
+
+    def testOrder(self):
+        '''The longest chain is started first, the task prio overrides it.'''
+        self.assertEquals(['c0', 's2', 's1', 's0'], self.getReadyOrder())
+        self.assertEquals(['s0', 'c0', 's2', 's1'], self.getReadyOrder(prios={'s0': 1}))
+
+    def testActionTime(self):
+        '''The action time is recorded in the task meta.'''
+        fs = MockFS()
+        with Builder(fs=fs, printInfo=False) as bldr:
+            bldr.addTask(name='t', action=lambda bldr, task: 0)
+            self.assertEquals(0, bldr.buildOne('t'))
+        with Builder(fs=fs, printInfo=False) as bldr:
+            bldr.addTask(name='t', action=lambda bldr, task: 0)
+            actionTime = bldr._getTaskByName('t').getActionTime()
+            self.assertTrue(0.0 <= actionTime < 1.0)
+            self.assertTrue('actionTime' in bldr._getTaskByName('t').meta)
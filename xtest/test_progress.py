@@ -0,0 +1,64 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from time import sleep
+from timeit import default_timer as timer
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder
+
+
+def sleepAction(bldr, task, **kwargs):
+    sleep(0.005)
+    for trg in task.targets:
+        bldr.fs.write(trg, 'done', mkDirs=True)
+    return 0
+
+
+class SlowProgress(object):
+
+    def __init__(self):
+        self.progresses = []
+
+    def __call__(self, progress):
+        self.progresses.append(progress)
+        sleep(0.1)
+
+
+class Test(XTest):
+
+    def testSlowProgressFn(self):
+        '''A slow progressFn doesn't throttle the build.'''
+        numTasks = 40
+        progressFn = SlowProgress()
+        start = timer()
+        with Builder(fs=MockFS(), workers=2, progressFn=progressFn, progressInterval=0.01) as bldr:
+            trgs = ['out/{}.txt'.format(i) for i in range(numTasks)]
+            for trg in trgs:
+                bldr.addTask(targets=[trg], action=sleepAction)
+            bldr.addTask(name='all', fileDeps=trgs, action=sleepAction)
+            self.assertEquals(0, bldr.buildOne('all'))
+        # calling progressFn for every task completion would take at least numTasks * 0.1 s
+        self.assertTrue(timer() - start < numTasks * 0.1 / 2)
+        self.assertTrue(len(progressFn.progresses) < numTasks)
+        last, end = progressFn.progresses[-2:]
+        self.assertEquals(numTasks + 1, last.done)
+        self.assertEquals(0, last.left)
+        self.assertEquals(0, end.rc)
@@ -0,0 +1,78 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder
+from xbuild.task import Task
+from xbuild.callbacks import alwaysUpToDate
+
+
+def layeredDiamond(bldr, layers, width):
+    '''Every task depends on all tasks of the previous layer. Returns the name of the top task.'''
+    prevNames = []
+    for layer in range(layers):
+        names = ['l{}_{}'.format(layer, i) for i in range(width)]
+        for name in names:
+            bldr.addTask(name=name, taskDeps=prevNames, upToDate=alwaysUpToDate)
+        prevNames = names
+    bldr.addTask(name='all', taskDeps=prevNames, upToDate=alwaysUpToDate)
+    return 'all'
+
+
+class Test(XTest):
+
+    def testDiamond(self):
+        '''Each task of a diamond-heavy graph is requested once.'''
+        cnt = [0]
+        setRequestPrio = Task._setRequestPrio
+
+        def countingSetRequestPrio(task, reqPrio):
+            cnt[0] += 1
+            return setRequestPrio(task, reqPrio)
+
+        Task._setRequestPrio = countingSetRequestPrio
+        try:
+            with Builder(fs=MockFS()) as bldr:
+                self.assertEquals(0, bldr._buildInitialDepGraph([layeredDiamond(bldr, layers=6, width=10)]))
+        finally:
+            Task._setRequestPrio = setRequestPrio
+        self.assertEquals(61, cnt[0])
+
+    def testLongChain(self):
+        '''A long dependency chain doesn't hit the recursion limit.'''
+        fs = MockFS()
+        with Builder(fs=fs) as bldr:
+            prevNames = []
+            for i in range(3000):
+                name = 't{}'.format(i)
+                bldr.addTask(name=name, taskDeps=prevNames, upToDate=alwaysUpToDate)
+                prevNames = [name]
+            self.assertEquals(0, bldr._buildInitialDepGraph(prevNames))
+
+    def testCycle(self):
+        fs = MockFS()
+        with Builder(fs=fs) as bldr:
+            bldr.addTask(name='a', taskDeps=['b'], upToDate=alwaysUpToDate)
+            bldr.addTask(name='b', taskDeps=['c'], upToDate=alwaysUpToDate)
+            bldr.addTask(name='c', taskDeps=['a'], upToDate=alwaysUpToDate)
+            rc, output = self.buildAndFetchOutput(bldr, 'a')
+        self.assertEquals(1, rc)
+        self.assertIn("ERROR: Task 'c' has a circular dependency on 'a'!", output)
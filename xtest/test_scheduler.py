@@ -0,0 +1,111 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder
+from xbuild.task import TState
+
+
+class RecordingBuilder(Builder):
+    '''Records the threads changing the build graph.'''
+
+    def __init__(self, *args, **kwargs):
+        super(RecordingBuilder, self).__init__(*args, **kwargs)
+        self.graphThreads = set()
+
+    def _handleTaskBuildCompleted(self, task):
+        self.graphThreads.add(threading.current_thread())
+        super(RecordingBuilder, self)._handleTaskBuildCompleted(task)
+
+
+def action(bldr, task, **kwargs):
+    for trg in task.targets:
+        bldr.fs.write(trg, trg, mkDirs=True)
+    return 0
+
+
+def callingAction(bldr, task, **kwargs):
+    '''Reads the build graph through the scheduler.'''
+    def getUnfinished():
+        return [trg for trg, trgTask in bldr.targetTaskDict.items() if trgTask.state != TState.Built]
+    unfinished = bldr.queue.call(getUnfinished)
+    bldr.fs.write(task.targets[0], '\n'.join(sorted(unfinished)), mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def testSchedulerThread(self):
+        '''The build graph is changed only by the thread running the build.'''
+        fs = MockFS()
+        with RecordingBuilder(fs=fs, workers=4) as bldr:
+            objs = ['out/{}.o'.format(i) for i in range(16)]
+            for obj in objs:
+                bldr.addTask(targets=[obj], action=action)
+            bldr.addTask(targets=['out/all'], fileDeps=objs, action=action)
+            self.assertEquals(0, bldr.buildOne('out/all'))
+            self.assertEquals(set([threading.current_thread()]), bldr.graphThreads)
+
+    def testCall(self):
+        '''Other threads read the build graph by BuildQueue.call().'''
+        fs = MockFS()
+        with Builder(fs=fs, workers=2) as bldr:
+            bldr.addTask(targets=['out/a'], action=action)
+            bldr.addTask(targets=['out/b'], fileDeps=['out/a'], action=callingAction)
+            bldr.addTask(targets=['out/all'], fileDeps=['out/b'], action=action)
+            self.assertEquals(0, bldr.buildOne('out/all'))
+        self.assertEquals('out/all\nout/b', fs.read('out/b'))
+        # without a running scheduler the call is direct
+        self.assertEquals(1, bldr.queue.call(lambda: 1))
+
+    def testStopDropsDispatched(self):
+        '''After a failure no new action is started, also not the ones dispatched before it.'''
+        fs = MockFS()
+        stopped = threading.Event()
+        started, startedLock = [], threading.Lock()
+
+        def failingAction(bldr, task, **kwargs):
+            return 1
+
+        def blockingAction(bldr, task, **kwargs):
+            # the workers are busy until the failure is handled
+            with startedLock:
+                started.append(task.targets[0])
+            stopped.wait(5)
+            return action(bldr, task)
+
+        with Builder(fs=fs, workers=2, printInfo=False) as bldr:
+            objs = ['out/{}.o'.format(i) for i in range(4 * bldr.workers)]
+            bldr.addTask(targets=['out/fail.o'], action=failingAction)
+            for obj in objs:
+                bldr.addTask(targets=[obj], action=blockingAction)
+            bldr.addTask(targets=['out/all'], fileDeps=['out/fail.o'] + objs, action=action)
+            stop = bldr.queue.stop
+
+            def recordingStop(rc):
+                stop(rc)
+                stopped.set()
+            bldr.queue.stop = recordingStop
+            self.assertEquals(1, bldr.buildOne('out/all'))
+        self.assertTrue(stopped.is_set())
+        # one task per worker can be taken before the scheduler handles the failure
+        self.assertTrue(len(started) <= bldr.workers, started)
@@ -0,0 +1,217 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import shutil
+import tempfile
+from threading import Lock
+from collections import Counter
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, FS
+from xbuild.task import Task
+from xbuild.fs import StatCache
+
+
+class CountingFS(MockFS):
+
+    def __init__(self):
+        super(CountingFS, self).__init__()
+        self.statCounter, self.scanCounter, self.cntLock = Counter(), Counter(), Lock()
+
+    def stat(self, fpath):
+        with self.cntLock:
+            self.statCounter[fpath] += 1
+        return super(CountingFS, self).stat(fpath)
+
+    def scanDir(self, dpath):
+        with self.cntLock:
+            self.scanCounter[dpath] += 1
+        return super(CountingFS, self).scanDir(dpath)
+
+
+def concat(bldr, task, **kwargs):
+    res = ''
+    for src in task.getFileDeps():
+        res += bldr.fs.read(src)
+    for trg in task.targets:
+        bldr.fs.write(trg, res, mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def createFS(self):
+        fs = CountingFS()
+        fs.write('inc/common.h', 'common', mkDirs=True)
+        for i in range(8):
+            fs.write('src/{}.c'.format(i), 'src{}'.format(i), mkDirs=True)
+        return fs
+
+    def build(self, fs, hashCheck):
+        with Builder(fs=fs, hashCheck=hashCheck) as bldr:
+            objs = []
+            for i in range(8):
+                obj = 'out/{}.o'.format(i)
+                bldr.addTask(targets=[obj], fileDeps=['src/{}.c'.format(i), 'inc/common.h'], action=concat)
+                objs.append(obj)
+            bldr.addTask(targets=['out/app'], fileDeps=objs, action=concat)
+            rc, output = self.buildAndFetchOutput(bldr, 'out/app')
+        self.assertEquals(0, rc)
+        return [line for line in output.splitlines() if line.startswith('INFO: Building')]
+
+    def testTimeStamp(self):
+        '''The timestamp check works through the FS.'''
+        fs = self.createFS()
+        self.assertEquals(9, len(self.build(fs, hashCheck=False)))
+        self.assertEquals([], self.build(fs, hashCheck=False))
+        fs.write('src/3.c', 'changed')
+        self.assertEquals(
+            ['INFO: Building out/3.o.', 'INFO: Building out/app.'], self.build(fs, hashCheck=False))
+        self.assertEquals('changed', fs.read('out/3.o')[:7])
+
+    def testStatOnce(self):
+        '''A shared dependency is stat-ed once in a no-op build.'''
+        for hashCheck in (False, True):
+            fs = self.createFS()
+            self.build(fs, hashCheck)
+            fs.statCounter.clear()
+            self.assertEquals([], self.build(fs, hashCheck))
+            self.assertEquals(1, fs.statCounter['inc/common.h'])
+            self.assertEquals(1, fs.statCounter['out/3.o'])
+
+    def testInvalidate(self):
+        fs = MockFS()
+        statCache = StatCache(fs)
+        statCache.activate()
+        try:
+            self.assertFalse(statCache.isfile('a.txt'))
+            fs.write('a.txt', 'a')
+            self.assertTrue(statCache.isfile('a.txt'))
+            fs.remove('a.txt')
+            self.assertFalse(statCache.exists('a.txt'))
+        finally:
+            statCache.deactivate()
+
+    def testScanBatch(self):
+        '''Many paths of the same directory are served by one directory scan.'''
+        fs = self.createFS()
+        statCache = StatCache(fs)
+        statCache.scanBatch = 4
+        fpaths = ['src/{}.c'.format(i) for i in range(8)] + ['src/missing.c', 'inc/common.h']
+        statCache.activate()
+        try:
+            stats = statCache.statMany(fpaths)
+            self.assertEquals(
+                [fs.stat(fpath).getSig() for fpath in fpaths[:8]], [st.getSig() for st in stats[:8]])
+            self.assertEquals([None, True], [stats[8], stats[9].isFile()])
+            self.assertEquals(1, fs.scanCounter['src'])
+            self.assertEquals(0, fs.scanCounter['inc'])
+            fs.statCounter.clear()
+            self.assertTrue(statCache.isfile('src/3.c'))
+            self.assertFalse(statCache.exists('src/missing.c'))
+            self.assertEquals(0, sum(fs.statCounter.values()))
+        finally:
+            statCache.deactivate()
+
+    def testNoScanWithoutStats(self):
+        '''When the directory listing doesn't carry the metadata only the requested paths are stat-ed.'''
+
+        class CountingLocalFS(FS):
+
+            def __init__(self):
+                super(CountingLocalFS, self).__init__()
+                self.statCounter = Counter()
+
+            def stat(self, fpath):
+                self.statCounter[fpath] += 1
+                return super(CountingLocalFS, self).stat(fpath)
+
+        tmpDir = tempfile.mkdtemp()
+        try:
+            fs = CountingLocalFS()
+            for i in range(64):
+                fs.write(fs.joinPath(tmpDir, '{}.c'.format(i)), 'src')
+            statCache = StatCache(fs)
+            statCache.scanBatch = 4
+            fpaths = [fs.joinPath(tmpDir, '{}.c'.format(i)) for i in range(8)]
+            statCache.activate()
+            try:
+                self.assertTrue(all(st.isFile() for st in statCache.statMany(fpaths)))
+            finally:
+                statCache.deactivate()
+            if not fs.scanDirHasStats:
+                self.assertEquals(sorted(fpaths), sorted(fs.statCounter))
+            self.assertTrue(sum(fs.statCounter.values()) <= len(fpaths))
+        finally:
+            shutil.rmtree(tmpDir)
+
+    def testScanFallback(self):
+        '''A name not listed by the directory scan is stat-ed, e.g. on a case-insensitive file system.'''
+
+        class CaseInsensitiveFS(CountingFS):
+
+            def stat(self, fpath):
+                return super(CaseInsensitiveFS, self).stat(fpath.lower())
+
+        fs = CaseInsensitiveFS()
+        for i in range(8):
+            fs.write('src/{}.c'.format(i), 'src{}'.format(i), mkDirs=True)
+        statCache = StatCache(fs)
+        statCache.scanBatch = 4
+        fpaths = ['src/{}.c'.format(i) for i in range(7)] + ['src/7.C', 'src/missing.c']
+        statCache.activate()
+        try:
+            stats = statCache.statMany(fpaths)
+            self.assertEquals(1, fs.scanCounter['src'])
+            self.assertEquals(fs.stat('src/7.c').getSig(), stats[7].getSig())
+            self.assertEquals(None, stats[8])
+            self.assertTrue(statCache.isfile('src/7.C'))
+        finally:
+            statCache.deactivate()
+
+    def testMkdirsParents(self):
+        '''The parents created by mkdirs are invalidated too.'''
+        fs = MockFS()
+        statCache = StatCache(fs)
+        statCache.activate()
+        try:
+            self.assertFalse(statCache.exists('out'))
+            self.assertFalse(statCache.exists('out/sub'))
+            fs.mkdirs('out/sub/dir')
+            self.assertTrue(statCache.isdir('out'))
+            self.assertTrue(statCache.isdir('out/sub'))
+            self.assertTrue(statCache.isdir('out/sub/dir'))
+        finally:
+            statCache.deactivate()
+
+    def testAddGeneratedFiles(self):
+        tmpDir = tempfile.mkdtemp()
+        try:
+            for fs, root in ((MockFS(), 'gen'), (FS(), FS().joinPath(tmpDir, 'gen'))):
+                fpaths = [fs.joinPath(root, fpath) for fpath in ('a.c', 'sub/b.c', 'sub/deep/c.c')]
+                for fpath in fpaths:
+                    fs.write(fpath, fpath, mkDirs=True)
+                task = Task(targets=['gen'])
+                task.addGeneratedFiles(fs, root)
+                self.assertEquals(fpaths, sorted(task.generatedFiles))
+                self.assertRaises(OSError, task.addGeneratedFiles, fs, fs.joinPath(root, 'missing'))
+                self.assertRaises(OSError, task.addGeneratedFiles, fs, fpaths[0])
+        finally:
+            shutil.rmtree(tmpDir)
@@ -0,0 +1,78 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pickle
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, Task, FetchDynFileDeps
+
+
+def action(bldr, task, **kwargs):
+    for trg in task.targets:
+        bldr.fs.write(trg, trg, mkDirs=True)
+    return 0
+
+
+def generatorAction(bldr, task, **kwargs):
+    for i in range(3):
+        fpath = 'gen/{}.c'.format(i)
+        bldr.fs.write(fpath, fpath, mkDirs=True)
+        task.generatedFiles.append(fpath)
+        task.providedFiles.append('out/{}.o'.format(i))
+    return 0
+
+
+def taskFactory(bldr, task):
+    # the common file and the prep task are built before the generator
+    return [
+        Task(targets=[trg], fileDeps=[src, 'out/common'], taskDeps=['prep'], action=action)
+        for trg, src in zip(task.providedFiles, task.generatedFiles)]
+
+
+class Test(XTest):
+
+    def testSlots(self):
+        task = Task(targets=['out/a'], fileDeps=['src/a', 'src/a'], action=action)
+        self.assertFalse(hasattr(task, '__dict__'))
+        self.assertEquals(1, task.pendingDepCnt)
+        self.assertEquals(None, task._userData)
+        task.userData.value = 1
+        self.assertEquals(1, task.userData.value)
+        copy = pickle.loads(pickle.dumps(task._getRemoteCopy(), pickle.HIGHEST_PROTOCOL))
+        self.assertEquals(None, copy.action)
+        self.assertEquals(['src/a', 'src/a'], copy.fileDeps)
+        self.assertEquals(1, copy.userData.value)
+        self.assertTrue(action is task.action[0])
+
+    def testFactoryTaskOfBuiltDeps(self):
+        '''The dependencies built before a taskFactory runs are not pending in its tasks.'''
+        fs = MockFS()
+        with Builder(fs=fs) as bldr:
+            bldr.addTask(name='prep', action=(lambda bldr, task: 0))
+            bldr.addTask(targets=['out/common'], action=action)
+            bldr.addTask(
+                name='generator', fileDeps=['out/common'], taskDeps=['prep'],
+                action=generatorAction, taskFactory=taskFactory)
+            bldr.addTask(name='all', taskDeps=['generator'], dynFileDepFetcher=FetchDynFileDeps(fetchProv=True))
+            self.assertEquals(0, bldr.buildOne('all'))
+            for i in range(3):
+                task = bldr._getTaskById('out/{}.o'.format(i))
+                self.assertEquals(0, task.pendingDepCnt)
+                self.assertEquals(task.targets[0], fs.read(task.targets[0]))
@@ -0,0 +1,80 @@
+# Copyright (c) 2016 Endre Bak
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+from mockfs import MockFS
+from helper import XTest
+from xbuild import Builder, Tracer
+from xbuild.callbacks import alwaysUpToDate
+
+
+def concat(bldr, task, **kwargs):
+    res = ''
+    for src in task.getFileDeps():
+        res += bldr.fs.read(src)
+    for trg in task.targets:
+        bldr.fs.write(trg, res, mkDirs=True)
+    return 0
+
+
+class Test(XTest):
+
+    def build(self, fs, tracer):
+        with Builder(fs=fs, workers=2, tracer=tracer) as bldr:
+            objs = []
+            for i in range(4):
+                src, obj = 'src/{}.c'.format(i), 'out/{}.o'.format(i)
+                fs.write(src, src, mkDirs=True)
+                bldr.addTask(targets=[obj], fileDeps=[src], action=concat)
+                objs.append(obj)
+            bldr.addTask(targets=['out/app'], fileDeps=objs, action=concat)
+            bldr.addTask(name='check', taskDeps=[], upToDate=alwaysUpToDate)
+            bldr.addTask(name='all', fileDeps=['out/app'], taskDeps=['check'])
+            self.assertEquals(0, bldr.buildOne('all'))
+
+    def testTrace(self):
+        '''Every executed task is traced with its phases.'''
+        fs = MockFS()
+        tracer = Tracer()
+        self.build(fs, tracer)
+        traces = {trace.taskId: trace for trace in tracer.traces}
+        self.assertEquals(
+            sorted(['out/0.o', 'out/1.o', 'out/2.o', 'out/3.o', 'out/app', 'check', 'all']), sorted(traces))
+        trace = traces['out/app']
+        self.assertTrue(trace.queued <= trace.dispatched <= trace.notified)
+        self.assertEquals(['upToDate', 'action', 'save'], [span[0] for span in trace.spans])
+        self.assertTrue(trace.worker.startswith('Wrk'))
+        self.assertEquals(['upToDate', 'save'], [span[0] for span in traces['check'].spans])
+        # the parents are notified after the dependencies
+        self.assertTrue(traces['out/0.o'].notified <= trace.dispatched)
+        summary = tracer.summary(topN=len(traces))
+        self.assertTrue(all(taskId in summary for taskId in traces))
+
+    def testChromeTrace(self):
+        fs = MockFS()
+        tracer = Tracer()
+        self.build(fs, tracer)
+        tracer.writeChromeTrace(fs, 'trace/build.json')
+        events = json.loads(fs.read('trace/build.json'))['traceEvents']
+        actions = [evt['name'] for evt in events if evt['ph'] == 'X' and evt['cat'] == 'action']
+        self.assertEquals(sorted(['out/0.o', 'out/1.o', 'out/2.o', 'out/3.o', 'out/app']), sorted(actions))
+        self.assertEquals(7, len([evt for evt in events if evt['ph'] == 'b']))
+        threadNames = [evt['args']['name'] for evt in events if evt['ph'] == 'M']
+        self.assertTrue(all(name.startswith('Wrk') for name in threadNames))